@@ -0,0 +1,34 @@
+"""composite index for keyset paging over messages
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # build it concurrently on postgres so a big messages table isn't write-locked
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_space_created_id",
+            "messages",
+            ["space_id", "created_at", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_messages_space_created_id",
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
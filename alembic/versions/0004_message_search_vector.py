@@ -0,0 +1,39 @@
+"""generated tsvector column + GIN index for message search
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+Postgres only, other backends fall back to a LIKE match in the search route.
+Adding a stored generated column rewrites the messages table, run it off peak.
+"""
+from alembic import op
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    # 'english' has to match SEARCH_CONFIG in app/routers/spaces.py
+    op.execute(
+        "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED"
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_search_vector "
+            "ON messages USING gin (search_vector)"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_search_vector")
+    op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
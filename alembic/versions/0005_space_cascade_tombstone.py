@@ -0,0 +1,49 @@
+"""cascade space deletes in the database and add spaces.deleted_at
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+# default postgres names, from 0001 or from the old create_all
+FOREIGN_KEYS = [
+    ("messages", "messages_space_id_fkey"),
+    ("space_membership", "space_membership_space_id_fkey"),
+]
+
+
+def replace_foreign_keys(ondelete):
+    for table, name in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY (space_id) "
+            f"REFERENCES spaces (id) {ondelete} NOT VALID"
+        )
+    # the drop holds an exclusive lock on the table until the transaction ends,
+    # so the (long) validation only gets to run under its lighter lock once
+    # that's committed
+    with op.get_context().autocommit_block():
+        for table, name in FOREIGN_KEYS:
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+
+
+def upgrade():
+    op.add_column("spaces", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    # sqlite can't alter constraints in place, fresh sqlite databases get them from the models
+    if op.get_bind().dialect.name == "postgresql":
+        replace_foreign_keys("ON DELETE CASCADE")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        replace_foreign_keys("")
+    op.drop_column("spaces", "deleted_at")
@@ -0,0 +1,24 @@
+"""last read message per membership for unread counts
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # nullable with no default, so postgres only touches the catalog
+    op.add_column("space_membership", sa.Column("last_read_message_id", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("space_membership", "last_read_message_id")
@@ -0,0 +1,50 @@
+"""knowledge entries and their chunks for semantic search
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "knowledge_entries",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("space_id", sa.Integer(), sa.ForeignKey("spaces.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("author_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_knowledge_entries_space_id", "knowledge_entries", ["space_id"])
+    op.create_table(
+        "knowledge_chunks",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("space_id", sa.Integer(), sa.ForeignKey("spaces.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("entry_id", sa.Integer(), sa.ForeignKey("knowledge_entries.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("indexed", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("removed", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.create_index("ix_knowledge_chunks_entry", "knowledge_chunks", ["entry_id"])
+    op.create_index("ix_knowledge_chunks_pending", "knowledge_chunks", ["space_id", "indexed", "removed"])
+
+
+def downgrade():
+    op.drop_index("ix_knowledge_chunks_pending", table_name="knowledge_chunks")
+    op.drop_index("ix_knowledge_chunks_entry", table_name="knowledge_chunks")
+    op.drop_table("knowledge_chunks")
+    op.drop_index("ix_knowledge_entries_space_id", table_name="knowledge_entries")
+    op.drop_table("knowledge_entries")
@@ -0,0 +1,109 @@
+"""range partition messages on created_at, one partition per month
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+
+Postgres only. The table is rebuilt: rows are copied into the partitioned
+one and the old heap is dropped, so run it in a maintenance window. The
+primary key becomes (id, created_at), postgres wants the partition key in
+every unique constraint. ids keep coming from the same sequence.
+The maintenance job (app/db/partitions.py) creates partitions from here on.
+"""
+from datetime import datetime, timedelta, timezone
+from alembic import op
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+# partitions created past the current month, MESSAGES_PARTITIONS_AHEAD keeps it going
+AHEAD = 3
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def create_indexes(primary_key):
+    # the old table is gone by now, so the usual names are free again
+    op.execute(f"ALTER TABLE messages ADD PRIMARY KEY ({primary_key})")
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_space_id_fkey FOREIGN KEY (space_id) "
+        "REFERENCES spaces (id) ON DELETE CASCADE"
+    )
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id)"
+    )
+    op.execute("CREATE INDEX ix_messages_space_created_id ON messages (space_id, created_at, id)")
+    op.execute("CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute(
+        "CREATE TABLE messages ("
+        " id integer NOT NULL DEFAULT nextval('messages_id_seq'),"
+        " content text NOT NULL,"
+        " created_at timestamptz NOT NULL DEFAULT now(),"
+        " user_id integer,"
+        " space_id integer,"
+        # 'english' has to match SEARCH_CONFIG in app/routers/spaces.py, same as 0004
+        " search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED"
+        ") PARTITION BY RANGE (created_at)"
+    )
+    # before the old table goes, or the sequence goes with it
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+
+    oldest = bind.exec_driver_sql("SELECT min(created_at) FROM messages_unpartitioned").scalar()
+    now = datetime.now(timezone.utc)
+    oldest = oldest.astimezone(timezone.utc) if oldest else now
+    month = datetime(oldest.year, oldest.month, 1, tzinfo=timezone.utc)
+    last = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+    for _ in range(AHEAD):
+        last = next_month(last)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE messages_p{month:%Y%m} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+        )
+        month = next_month(month)
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+    op.execute(
+        "INSERT INTO messages (id, content, created_at, user_id, space_id) "
+        "SELECT id, content, coalesce(created_at, now()), user_id, space_id FROM messages_unpartitioned"
+    )
+    op.execute("DROP TABLE messages_unpartitioned")
+    create_indexes("id, created_at")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    # archived months (app/db/archive.py) are not brought back, only what is still in postgres
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute(
+        "CREATE TABLE messages ("
+        " id integer NOT NULL DEFAULT nextval('messages_id_seq'),"
+        " content text NOT NULL,"
+        " created_at timestamptz DEFAULT now(),"
+        " user_id integer,"
+        " space_id integer,"
+        " search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED"
+        ")"
+    )
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute(
+        "INSERT INTO messages (id, content, created_at, user_id, space_id) "
+        "SELECT id, content, created_at, user_id, space_id FROM messages_partitioned"
+    )
+    op.execute("DROP TABLE messages_partitioned")
+    create_indexes("id")
@@ -0,0 +1,45 @@
+import argparse
+import asyncio
+import sys
+from app.bench import harness
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench",
+                                     description="Drive the real app in process and report latency per endpoint")
+    parser.add_argument("--database-url", help="defaults to a throwaway sqlite file, point it at a local postgres to compare")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--spaces", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=10, help="messages posted per user")
+    parser.add_argument("--reads", type=int, default=10, help="reads per user for each read endpoint")
+    parser.add_argument("--page-size", type=int, help="limit for the message and space list reads, defaults to the api default")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--group-commit", action="store_true",
+                        help="batch create_message inserts, tune with MESSAGES_GROUP_WINDOW_MS / MESSAGES_GROUP_MAX")
+    parser.add_argument("--rate-limits", action="store_true", help="leave the rate limiter on")
+    parser.add_argument("--startup", type=int, metavar="N",
+                        help="instead of the api run, time N cold worker starts (import, app, lifespan, first request)")
+    parser.add_argument("--out", help="write the report as json")
+    parser.add_argument("--baseline", help="json report to compare against, exits 1 on a regression")
+    parser.add_argument("--p95-tolerance", type=float, default=0.25, help="allowed p95 growth over the baseline")
+    args = parser.parse_args(argv)
+
+    harness.configure_env(args.database_url, args.group_commit)
+    if args.startup:
+        report = harness.run_startup(args.startup)
+    else:
+        report = asyncio.run(harness.run_api(args.users, args.spaces, args.messages, args.reads,
+                                             args.concurrency, args.rate_limits, args.page_size))
+    print(harness.format_report(report))
+    if args.out:
+        harness.save_report(args.out, report)
+
+    if args.baseline:
+        failures = harness.compare(report, harness.load_report(args.baseline), args.p95_tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        if failures:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+# offline defaults, these have to be in place before anything imports app.core.config
+def configure_env(database_url: str | None = None, group_commit: bool = False):
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    if group_commit:
+        os.environ["MESSAGES_GROUP_COMMIT"] = "true"
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='teambrain-bench-')}/bench.db")
+    os.environ.setdefault("REDIS_URL", "fakeredis://")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # nearest rank
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+# queries issued while handling the current request, set per call by Recorder
+current_queries: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar("current_queries", default=None)
+
+def count_query(*args):
+    counter = current_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.queries: dict[str, list[int]] = {}
+        self.errors: dict[str, int] = {}
+        self.elapsed: dict[str, float] = {}
+
+    async def call(self, name: str, client, method: str, url: str, **kwargs):
+        counter = [0]
+        token = current_queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            current_queries.reset(token)
+        self.latencies.setdefault(name, []).append(elapsed_ms)
+        self.queries.setdefault(name, []).append(counter[0])
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    async def phase(self, name: str, calls, concurrency: int):
+        # runs the coroutine factories with at most `concurrency` in flight
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(factory):
+            async with semaphore:
+                return await factory()
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run(factory) for factory in calls))
+        self.elapsed[name] = self.elapsed.get(name, 0.0) + time.perf_counter() - start
+        return results
+
+    def report(self) -> dict:
+        report = {}
+        for name, values in self.latencies.items():
+            queries = self.queries[name]
+            elapsed = self.elapsed.get(name) or sum(values) / 1000
+            report[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3),
+                "p99_ms": round(percentile(values, 99), 3),
+                "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+                "queries_per_call": round(sum(queries) / len(queries), 2),
+            }
+        return report
+
+def format_report(report: dict) -> str:
+    width = max([16] + [len(name) + 2 for name in report])
+    header = f"{'endpoint':<{width}}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'queries':>9}"
+    lines = [header, "-" * len(header)]
+    for name, row in report.items():
+        lines.append(
+            f"{name:<{width}}{row['count']:>7}{row['errors']:>5}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            f"{row['p99_ms']:>10.2f}{row['rps']:>9.1f}{row['queries_per_call']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+def compare(report: dict, baseline: dict, p95_tolerance: float) -> list[str]:
+    # any extra query per call is a regression, latency gets some slack for noise
+    failures = []
+    for name, old in baseline.items():
+        new = report.get(name)
+        if new is None:
+            continue
+        if new["queries_per_call"] > old["queries_per_call"] + 0.01:
+            failures.append(f"{name}: queries/call {old['queries_per_call']} -> {new['queries_per_call']}")
+        if new["p95_ms"] > old["p95_ms"] * (1 + p95_tolerance):
+            failures.append(f"{name}: p95 {old['p95_ms']}ms -> {new['p95_ms']}ms")
+    return failures
+
+def create_schema():
+    # the app no longer builds its own tables, a throwaway bench database needs them
+    from app.db import models # noqa: F401, registers the tables on Base
+    from app.db.database import Base, engine
+    Base.metadata.create_all(bind=engine)
+
+@asynccontextmanager
+async def running_app():
+    # imported late so configure_env() wins over .env
+    from sqlalchemy import event
+    from app.main import create_app
+    from app.db.database import async_engine
+
+    app = create_app()
+    create_schema()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+    try:
+        async with app.router.lifespan_context(app):
+            yield app
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_query)
+
+def client_for(app, user_index: int):
+    import httpx
+    # every virtual user gets its own address, like real clients would
+    transport = httpx.ASGITransport(app=app, client=(f"10.0.{user_index // 250}.{user_index % 250 + 1}", 40000))
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+async def run_api(users: int, spaces: int, messages: int, reads: int, concurrency: int,
+                  rate_limits: bool = False, page_size: int | None = None) -> dict:
+    recorder = Recorder()
+    page = {"limit": page_size} if page_size else {}
+    run_id = int(time.time() * 1000)
+
+    async with running_app() as app:
+        if not rate_limits:
+            # measure handler cost, not throttling
+            from app.core.ratelimit import limiter
+            limiter.enabled = False
+
+        clients = [client_for(app, i) for i in range(users)]
+        try:
+            emails = [f"bench{run_id}-{i}@example.com" for i in range(users)]
+            await recorder.phase("register", [
+                lambda i=i: recorder.call("register", clients[i], "POST", "/auth/register",
+                                          json={"name": f"user{i}", "email": emails[i], "password": "benchpassword"})
+                for i in range(users)
+            ], concurrency)
+
+            logins = await recorder.phase("login", [
+                lambda i=i: recorder.call("login", clients[i], "POST", "/auth/login",
+                                          json={"email": emails[i], "password": "benchpassword"})
+                for i in range(users)
+            ], concurrency)
+            for client, response in zip(clients, logins):
+                client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+            created = await recorder.phase("create_space", [
+                lambda i=i: recorder.call("create_space", clients[i % users], "POST", "/spaces/",
+                                          json={"name": f"bench space {i}"})
+                for i in range(spaces)
+            ], concurrency)
+            space_ids = [response.json()["id"] for response in created]
+
+            # everyone joins every space they don't own
+            await recorder.phase("join_space", [
+                lambda i=i, s=s: recorder.call("join_space", clients[i], "POST", f"/spaces/{space_ids[s]}/join", json={})
+                for i in range(users) for s in range(spaces) if s % users != i
+            ], concurrency)
+
+            await recorder.phase("create_message", [
+                lambda i=i, m=m: recorder.call("create_message", clients[i], "POST", "/messages/",
+                                               json={"content": f"message {m} from {i}",
+                                                     "space_id": space_ids[(i + m) % spaces]})
+                for i in range(users) for m in range(messages)
+            ], concurrency)
+
+            await recorder.phase("get_messages", [
+                lambda i=i, r=r: recorder.call("get_messages", clients[i], "GET", "/messages/",
+                                               params={"space_id": space_ids[(i + r) % spaces], **page})
+                for i in range(users) for r in range(reads)
+            ], concurrency)
+
+            await recorder.phase("users_me", [
+                lambda i=i: recorder.call("users_me", clients[i], "GET", "/users/me")
+                for i in range(users) for _ in range(reads)
+            ], concurrency)
+
+            await recorder.phase("get_spaces", [
+                lambda i=i: recorder.call("get_spaces", clients[i], "GET", "/spaces/", params=page)
+                for i in range(users) for _ in range(reads)
+            ], concurrency)
+
+            await recorder.phase("get_members", [
+                lambda i=i, r=r: recorder.call("get_members", clients[i], "GET",
+                                               f"/spaces/{space_ids[(i + r) % spaces]}/members")
+                for i in range(users) for r in range(reads)
+            ], concurrency)
+        finally:
+            for client in clients:
+                await client.aclose()
+
+    return recorder.report()
+
+def measure_startup():
+    # runs in a fresh interpreter per sample, see run_startup()
+    stages = {}
+    start = time.perf_counter()
+    import app.main
+    stages["import"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    application = app.main.create_app()
+    stages["create_app"] = time.perf_counter() - mark
+
+    async def serve():
+        nonlocal mark
+        import httpx
+        mark = time.perf_counter()
+        async with application.router.lifespan_context(application):
+            stages["lifespan"] = time.perf_counter() - mark
+            transport = httpx.ASGITransport(app=application)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                mark = time.perf_counter()
+                response = await client.get("/spaces/")
+                stages["first_request"] = time.perf_counter() - mark
+                response.raise_for_status()
+
+    asyncio.run(serve())
+    stages["ready"] = stages["import"] + stages["create_app"] + stages["lifespan"] + stages["first_request"]
+    print(json.dumps({name: seconds * 1000 for name, seconds in stages.items()}))
+
+def run_startup(samples: int) -> dict:
+    # every sample is a new worker process, so imports and pools start cold
+    create_schema()
+    timings: dict[str, list[float]] = {}
+    for _ in range(samples):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", "from app.bench.harness import measure_startup; measure_startup()"],
+            check=True, capture_output=True, text=True, env=os.environ.copy(),
+        ).stdout
+        process_ms = (time.perf_counter() - start) * 1000
+        stages = json.loads(output.strip().splitlines()[-1])
+        stages["process"] = process_ms
+        for name, value in stages.items():
+            timings.setdefault(name, []).append(value)
+
+    report = {}
+    for name, values in timings.items():
+        report[f"startup:{name}"] = {
+            "count": len(values),
+            "errors": 0,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "rps": 0.0,
+            "queries_per_call": 0.0,
+        }
+    return report
+
+def load_report(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def save_report(path: str, report: dict):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from app.core.redis_client import ard
+
+# per process LRU with a ttl, sits in front of redis for hot keys
+class LocalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        # bumped by every delete/clear. a load that started before one passes
+        # the value it saw to set() and gets dropped instead of caching stale data
+        self.generation = 0
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None, generation: int | None = None):
+        if generation is not None and generation != self.generation:
+            return
+        self.data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def delete(self, key):
+        self.generation += 1
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self.data.clear()
+
+# makes concurrent misses on the same key share one load instead of all
+# going to redis/postgres at once
+class SingleFlight:
+    def __init__(self):
+        self.calls: dict[Any, asyncio.Future] = {}
+
+    async def do(self, key, fn: Callable[[], Awaitable[Any]]):
+        future = self.calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # mark it retrieved so asyncio doesn't warn when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
+
+# the same guard for redis copies. writers bump {key}:gen after they commit
+# (drop_shared), loaders read it before going to postgres and store_shared
+# only writes if it hasn't moved, so a load that read the old row can't put
+# it back after the invalidation
+GENERATION_TTL = 60 * 60 * 24
+
+STORE_SCRIPT = ard.register_script("""
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+""")
+
+def generation_key(key: str) -> str:
+    return f"{key}:gen"
+
+async def read_shared(key: str) -> tuple[str | None, str]:
+    # the cached value (if any) and the generation to hand back to store_shared
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.get(generation_key(key))
+            value, generation = await pipe.execute()
+    except Exception:
+        return None, ""
+    return value, generation or "0"
+
+async def store_shared(key: str, value: str, ttl: int, generation: str) -> bool:
+    if not generation:
+        # redis was down when the load started, don't risk it
+        return False
+    try:
+        return bool(await STORE_SCRIPT(keys=[key, generation_key(key)], args=[value, ttl, generation]))
+    except Exception:
+        return False
+
+async def drop_shared(*keys: str):
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(generation_key(key))
+                pipe.expire(generation_key(key), GENERATION_TTL)
+                pipe.delete(key)
+            await pipe.execute()
+    except Exception:
+        pass
+
+INVALIDATE_CHANNEL = "cache:invalidate"
+
+# name -> LocalCache, so one subscription can drop keys from any of them
+local_caches: dict[str, LocalCache] = {}
+
+def register_cache(name: str, cache: LocalCache) -> LocalCache:
+    local_caches[name] = cache
+    return cache
+
+async def invalidate(name: str, key):
+    # drop it here right away, then tell every other worker
+    cache = local_caches.get(name)
+    if cache is not None:
+        cache.delete(key)
+    try:
+        await ard.publish(INVALIDATE_CHANNEL, f"{name}:{key}")
+    except Exception:
+        pass
+
+async def listen_invalidations():
+    while True:
+        pubsub = ard.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            # anything could have changed while we weren't listening
+            for cache in local_caches.values():
+                cache.clear()
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                name, key = message["data"].split(":", 1)
+                cache = local_caches.get(name)
+                if cache is not None:
+                    cache.delete(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await asyncio.sleep(1.0)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
@@ -2,11 +2,166 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # derived from DATABASE_URL (asyncpg / aiosqlite) when not set
+    ASYNC_DATABASE_URL: str | None = None
+    # optional replica for read only routes, same async derivation as above
+    READ_REPLICA_URL: str | None = None
+    ASYNC_READ_REPLICA_URL: str | None = None
+
+    # connection pool, per engine and per worker
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # connections each engine opens while the app starts, and how long startup
+    # waits on them before serving anyway
+    STARTUP_WARM_CONNECTIONS: int = 2
+    STARTUP_WARM_TIMEOUT: float = 5
+
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     REDIS_URL: str
 
+    ACCESS_TOKEN_MINUTES: int = 60
+    REFRESH_TOKEN_MINUTES: int = 60 * 24 * 7
+
+    # bcrypt runs on its own small pool so a login burst can't starve everything else
+    # 0 runs it inline on the event loop like the old sync handlers did
+    BCRYPT_WORKERS: int = 4
+    # hand bcrypt to the job workers instead, so api workers only ever wait on io
+    BCRYPT_OFFLOAD: bool = False
+    BCRYPT_OFFLOAD_TIMEOUT: float = 10
+
+    # in-process layer of the user cache (redis is the second layer)
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 30
+    USER_REDIS_TTL: int = 120
+
+    # every user's space ids for membership checks, see app/core/membership.py
+    MEMBERSHIP_CACHE_SIZE: int = 10000
+    MEMBERSHIP_CACHE_TTL: int = 30
+    MEMBERSHIP_REDIS_TTL: int = 600
+
+    # verified jwt claims, entries never outlive the token's exp
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: int = 300
+
+    # per request sql/redis/bcrypt timing exported on /metrics
+    METRICS_ENABLED: bool = True
+    # log requests slower than this with the sql they ran, 0 turns it off
+    SLOW_REQUEST_MS: int = 0
+
+    # message history paging
+    MESSAGES_PAGE_SIZE: int = 50
+    MESSAGES_PAGE_MAX: int = 200
+
+    # spaces with more messages than this are tombstoned and purged in batches
+    SPACE_PURGE_THRESHOLD: int = 10000
+    SPACE_PURGE_BATCH: int = 5000
+
+    # postgres keeps messages in monthly partitions (migration 0009), this many
+    # months past the current one always exist
+    MESSAGES_PARTITIONS_AHEAD: int = 3
+    PARTITION_MAINTENANCE_INTERVAL: int = 3600
+    # months that ended longer ago than this move to zstd NDJSON under
+    # ARCHIVE_DIR (same disk for api and job workers), 0 keeps everything in postgres
+    MESSAGES_ARCHIVE_AFTER_DAYS: int = 0
+    ARCHIVE_DIR: str = "data/archive"
+    ARCHIVE_ZSTD_LEVEL: int = 9
+    # how long archiving and new partitions wait for their locks before trying again next run
+    ARCHIVE_LOCK_TIMEOUT: int = 5
+    # parsed space-months each worker keeps for history reads
+    ARCHIVE_CACHE_SIZE: int = 64
+
+    # space export/import (NDJSON), rows per cursor fetch / per insert
+    EXPORT_CHUNK: int = 1000
+    IMPORT_CHUNK: int = 1000
+    IMPORT_MAX_LINE: int = 64 * 1024
+
+    # bulk ingestion, its rate limit is counted in messages not requests
+    MESSAGES_BATCH_MAX: int = 500
+
+    # group commit: single message posts in a worker are collected for up to
+    # this many ms (or rows) and written in one transaction, see app/db/group_commit.py
+    MESSAGES_GROUP_COMMIT: bool = False
+    MESSAGES_GROUP_WINDOW_MS: float = 5.0
+    MESSAGES_GROUP_MAX: int = 100
+
+    # unread counters live in redis, this often a job rebuilds them from postgres
+    UNREAD_RECONCILE_INTERVAL: int = 3600
+    UNREAD_RECONCILE_BATCH: int = 500
+
+    # per route limits, see app/core/ratelimit.py. override with a json object
+    RATE_LIMITS: dict[str, str] = {
+        "auth.login": "3/minute",
+        "auth.refresh": "10/minute",
+        "messages.create": "1/minute",
+        "messages.batch": "600/minute",
+    }
+    RATE_LIMIT_ENABLED: bool = True
+    # most tokens a worker claims from redis at once for one key, spent locally
+    RATE_LIMIT_PRECLAIM: int = 20
+    # unspent claimed tokens are dropped after this many seconds
+    RATE_LIMIT_LEASE: float = 1.0
+    RATE_LIMIT_LOCAL_KEYS: int = 100000
+
+    # background jobs, see app/core/jobs.py and `python -m app.worker`
+    JOB_CONCURRENCY: int = 8
+    # process pool for cpu bound jobs, 0 means one per core
+    JOB_PROCESSES: int = 0
+    JOB_BACKOFF_BASE: float = 2.0
+    JOB_BACKOFF_MAX: float = 300
+    # running longer than this means the worker died and the job goes back on the queue
+    JOB_VISIBILITY_TIMEOUT: int = 600
+    JOB_RESULT_TTL: int = 60 * 60 * 24
+    JOB_SENSITIVE_TTL: int = 60
+    # run a worker inside the api process, handy for local dev
+    JOBS_IN_PROCESS: bool = False
+
+    # rolling space summaries, see app/core/summary.py
+    SUMMARISER: str = "extractive"
+    SUMMARY_SENTENCES: int = 5
+    # messages folded per query while catching up
+    SUMMARY_BATCH: int = 1000
+    # reading a digest older than this queues a refresh
+    SUMMARY_MAX_AGE: int = 300
+
+    # knowledge base, see app/core/knowledge.py. entries are split into
+    # overlapping windows of words and each one gets a vector
+    KNOWLEDGE_CHUNK_WORDS: int = 120
+    KNOWLEDGE_CHUNK_OVERLAP: int = 20
+    # chunks embedded per step of the index job, and how often a sweep picks up missed ones
+    KNOWLEDGE_INDEX_BATCH: int = 1000
+    KNOWLEDGE_SWEEP_INTERVAL: int = 60
+    KNOWLEDGE_MAX_K: int = 50
+    EMBEDDER: str = "hashing"
+    EMBEDDING_DIM: int = 256
+    # per space memory-mapped index files, has to be the same disk for api and job workers
+    VECTOR_INDEX_DIR: str = "data/vectors"
+    # flat scans every row, ivf only the closest lists once a space has VECTOR_IVF_MIN_ROWS
+    VECTOR_INDEX_MODE: str = "flat"
+    VECTOR_INDEX_INITIAL: int = 1024
+    # indexes a worker keeps mapped
+    VECTOR_INDEX_OPEN: int = 256
+    VECTOR_IVF_MIN_ROWS: int = 50000
+    # 0 picks sqrt(rows)
+    VECTOR_IVF_LISTS: int = 0
+    VECTOR_IVF_PROBES: int = 16
+
+    # who's online, see app/core/presence.py. hits are buffered per worker and
+    # flushed every PRESENCE_FLUSH_INTERVAL seconds, a user is written at most
+    # once per PRESENCE_REFRESH seconds per space, which is also the heartbeat cadence
+    PRESENCE_FLUSH_INTERVAL: float = 2.0
+    PRESENCE_REFRESH: int = 30
+    # seen within this long counts as online
+    PRESENCE_ONLINE_SECONDS: int = 90
+    PRESENCE_ONLINE_MAX: int = 500
+    # how long the daily and monthly active user counts are kept
+    PRESENCE_DAILY_RETENTION_DAYS: int = 35
+    PRESENCE_MONTHLY_RETENTION_DAYS: int = 400
+
     class Config:
         env_file = ".env"
 
-settings = Settings() # type: ignore
\ No newline at end of file
+settings = Settings() # type: ignore
@@ -0,0 +1,70 @@
+import re
+import zlib
+import numpy as np
+from app.core.config import settings
+
+# turns text into unit length float32 vectors for the knowledge index. the
+# default needs no model download and no network: words and word pairs are
+# hashed into a fixed number of buckets (the hashing trick), so the same text
+# always lands on the same vector in any worker, and nothing is fitted up front
+
+class Embedder:
+    name = ""
+    dim = 0
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        # (len(texts), dim) float32, rows l2 normalised so dot product is cosine
+        raise NotImplementedError
+
+WORD = re.compile(r"[a-z0-9][a-z0-9'_-]*")
+
+class HashingEmbedder(Embedder):
+    name = "hashing"
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def features(self, text: str) -> list[str]:
+        words = WORD.findall(text.lower())
+        # pairs keep a little word order, "not working" vs "working"
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                # crc32 is stable across processes, hash() is salted per interpreter
+                h = zlib.crc32(feature.encode())
+                # a sign bit from the hash keeps collisions from only ever adding up
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        # sublinear counts so one repeated word doesn't own the vector
+        np.copyto(vectors, np.sign(vectors) * np.log1p(np.abs(vectors)))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+embedders: dict[str, type[Embedder]] = {
+    "hashing": HashingEmbedder,
+}
+
+def get_embedder() -> Embedder:
+    embedder = embedders.get(settings.EMBEDDER)
+    if embedder is None:
+        raise ValueError(f"unknown embedder {settings.EMBEDDER!r}")
+    if embedder is HashingEmbedder:
+        return HashingEmbedder(settings.EMBEDDING_DIM)
+    return embedder()
+
+def chunk_text(text: str, size: int, overlap: int) -> list[str]:
+    # windows of `size` words, each sharing `overlap` words with the one before
+    # so a sentence cut in half is still whole in one of them
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
@@ -0,0 +1,55 @@
+import hashlib
+from typing import Awaitable, Callable
+from fastapi import Request, Response
+from app.core.redis_client import ard
+
+# cached list bodies live under a key that includes a version counter, writes
+# just bump the counter and the old entries age out on their own ttl
+SPACES_VERSION = "spaces:version"
+
+def members_version(space_id: int) -> str:
+    return f"space:{space_id}:members:version"
+
+async def get_version(key: str) -> int:
+    try:
+        return int(await ard.get(key) or 0)
+    except Exception:
+        return -1
+
+async def bump_versions(*keys: str):
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(key)
+            await pipe.execute()
+    except Exception:
+        pass
+
+async def cached_body(key: str, version: int, build: Callable[[], Awaitable[bytes]], ttl: int = 300) -> bytes:
+    # version -1 means redis is down, skip the cache entirely
+    if version < 0:
+        return await build()
+    key = f"{key}:v{version}"
+    try:
+        body = await ard.get(key)
+    except Exception:
+        body = None
+    if body is not None:
+        return body.encode()
+    body = await build()
+    try:
+        await ard.set(key, body, ex=ttl)
+    except Exception:
+        pass
+    return body
+
+def etag_response(request: Request, body: bytes) -> Response:
+    # strong etag off the exact bytes, so a lost version counter can never reuse one
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable
+from app.core.config import settings
+from app.core.redis_client import ard
+
+# redis backed job queue. the api enqueues, `python -m app.worker` runs them.
+#   jobs:queue       list of job ids waiting to run
+#   jobs:processing  ids a worker has picked up, reaped back into the queue if it dies
+#   jobs:delayed     zset of ids waiting out a retry backoff, scored by when to run
+#   job:{id}         hash with name, args, status, attempts, result, error
+# a job is visible on /jobs/{id} to whoever queued it, or for jobs keyed on a
+# space (one pending per space, whoever asked first) to every member of it
+QUEUE = "jobs:queue"
+PROCESSING = "jobs:processing"
+DELAYED = "jobs:delayed"
+
+@dataclass
+class JobSpec:
+    fn: Callable
+    # cpu jobs go to the worker's process pool, the rest run on its event loop
+    cpu: bool = False
+    max_attempts: int = 5
+    # args are kept out of the job hash, short lived and deleted on pickup. the
+    # result only lives JOB_SENSITIVE_TTL and goes as soon as wait_for_job has it
+    sensitive: bool = False
+    # seconds between runs for jobs the workers queue up by themselves, no args
+    every: float | None = None
+
+registry: dict[str, JobSpec] = {}
+
+def job(name: str, cpu: bool = False, max_attempts: int = 5, sensitive: bool = False,
+        every: float | None = None):
+    def register(fn):
+        registry[name] = JobSpec(fn, cpu, max_attempts, sensitive, every)
+        return fn
+    return register
+
+def job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+async def enqueue(name: str, args: dict, key: str | None = None, owner_id: int | None = None,
+                  space_id: int | None = None, sensitive: bool = False) -> str:
+    # a key makes it idempotent, enqueueing the same key again while it's
+    # still pending just hands back the existing job
+    job_id = key or uuid.uuid4().hex
+    if not await ard.hsetnx(job_key(job_id), "status", "queued"):
+        status = await ard.hget(job_key(job_id), "status")
+        if status not in ("done", "failed"):
+            return job_id
+
+    fields = {
+        "name": name,
+        "status": "queued",
+        "attempts": 0,
+        "owner_id": owner_id if owner_id is not None else "",
+        "space_id": space_id if space_id is not None else "",
+        "created": time.time(),
+        "result": "",
+        "error": "",
+    }
+    async with ard.pipeline(transaction=True) as pipe:
+        if sensitive:
+            pipe.set(f"{job_key(job_id)}:args", json.dumps(args), ex=settings.JOB_SENSITIVE_TTL)
+            fields["args"] = ""
+            fields["sensitive"] = 1
+        else:
+            fields["args"] = json.dumps(args)
+        pipe.hset(job_key(job_id), mapping=fields) # type: ignore
+        pipe.persist(job_key(job_id))
+        pipe.delete(f"{job_key(job_id)}:done")
+        pipe.lpush(QUEUE, job_id)
+        await pipe.execute()
+    return job_id
+
+async def get_job(job_id: str) -> dict | None:
+    data = await ard.hgetall(job_key(job_id))
+    if not data or "name" not in data:
+        return None
+    return {
+        "id": job_id,
+        "name": data["name"],
+        "status": data["status"],
+        "attempts": int(data.get("attempts") or 0),
+        "owner_id": int(data["owner_id"]) if data.get("owner_id") else None,
+        "space_id": int(data["space_id"]) if data.get("space_id") else None,
+        "result": json.loads(data["result"]) if data.get("result") else None,
+        "error": data.get("error") or None,
+    }
+
+async def wait_for_job(job_id: str, timeout: float) -> Any:
+    # the worker pushes onto job:{id}:done once the job is finished for good
+    if await ard.blpop([f"{job_key(job_id)}:done"], timeout=timeout) is None: # type: ignore
+        raise TimeoutError(f"job {job_id} did not finish in {timeout}s")
+    job = await get_job(job_id)
+    if await ard.hget(job_key(job_id), "sensitive"):
+        # whoever waits on it is the only one meant to see it
+        await ard.hdel(job_key(job_id), "result")
+    if job is None or job["status"] != "done":
+        raise RuntimeError(f"job {job_id} failed: {job and job['error']}")
+    return job["result"]
+
+def backoff(attempts: int) -> float:
+    delay = min(settings.JOB_BACKOFF_BASE * 2 ** (attempts - 1), settings.JOB_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+async def finish(job_id: str, status: str, result: Any = None, error: str = "", sensitive: bool = False):
+    async with ard.pipeline(transaction=True) as pipe:
+        pipe.hset(job_key(job_id), mapping={
+            "status": status,
+            "result": json.dumps(result) if result is not None else "",
+            "error": error,
+            "finished": time.time(),
+        })
+        pipe.expire(job_key(job_id), settings.JOB_SENSITIVE_TTL if sensitive else settings.JOB_RESULT_TTL)
+        pipe.lrem(PROCESSING, 0, job_id)
+        pipe.rpush(f"{job_key(job_id)}:done", status)
+        pipe.expire(f"{job_key(job_id)}:done", 60)
+        await pipe.execute()
+
+async def retry_later(job_id: str, error: str, attempts: int):
+    async with ard.pipeline(transaction=True) as pipe:
+        pipe.hset(job_key(job_id), mapping={"status": "retrying", "error": error})
+        pipe.lrem(PROCESSING, 0, job_id)
+        pipe.zadd(DELAYED, {job_id: time.time() + backoff(attempts)})
+        await pipe.execute()
+
+async def requeue(job_id: str):
+    # timestamps from the last try would get it reaped again before it starts
+    async with ard.pipeline(transaction=True) as pipe:
+        pipe.hset(job_key(job_id), "status", "queued")
+        pipe.hdel(job_key(job_id), "started", "claimed")
+        pipe.lpush(QUEUE, job_id)
+        await pipe.execute()
+
+async def promote_delayed():
+    due = await ard.zrangebyscore(DELAYED, "-inf", time.time())
+    for job_id in due:
+        # only whoever removes it from the zset gets to requeue it
+        if await ard.zrem(DELAYED, job_id):
+            await requeue(job_id)
+
+async def schedule_periodic():
+    # every worker calls this, the lock makes sure only one of them queues each run
+    for name, spec in registry.items():
+        if spec.every and await ard.set(f"jobs:periodic:{name}", 1, nx=True, ex=max(1, int(spec.every))):
+            await enqueue(name, {}, key=f"periodic:{name}")
+
+async def reap_stale():
+    # a job running longer than the visibility timeout belonged to a dead worker.
+    # so did one that was claimed and never started, the worker died in between
+    now = time.time()
+    cutoff = now - settings.JOB_VISIBILITY_TIMEOUT
+    for job_id in await ard.lrange(PROCESSING, 0, -1):
+        started, claimed = await ard.hmget(job_key(job_id), ["started", "claimed"])
+        since = started or claimed
+        if since is None:
+            # claimed without a stamp, its timeout runs from here
+            await ard.hsetnx(job_key(job_id), "claimed", now)
+        elif float(since) < cutoff:
+            if await ard.lrem(PROCESSING, 1, job_id):
+                await requeue(job_id)
+
+async def claim(job_id: str):
+    # stamped as soon as a worker takes it off the queue, see reap_stale()
+    await ard.hset(job_key(job_id), "claimed", time.time())
+
+async def run_job(job_id: str, process_pool) -> None:
+    data = await ard.hgetall(job_key(job_id))
+    spec = registry.get(data.get("name", ""))
+    if spec is None:
+        await finish(job_id, "failed", error=f"unknown job {data.get('name')!r}")
+        return
+
+    attempts = int(data.get("attempts") or 0) + 1
+    await ard.hset(job_key(job_id), mapping={"status": "running", "attempts": attempts, "started": time.time()})
+
+    if spec.sensitive:
+        raw = await ard.getdel(f"{job_key(job_id)}:args")
+        if raw is None:
+            # args expired before anyone got to it, can't retry without them
+            await finish(job_id, "failed", error="job arguments expired")
+            return
+        args = json.loads(raw)
+    else:
+        args = json.loads(data.get("args") or "{}")
+
+    try:
+        if spec.cpu:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(process_pool, call_with_kwargs, spec.fn, args)
+        else:
+            result = await spec.fn(**args)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        # sensitive args are gone after the first try, so no retries for those
+        if attempts < spec.max_attempts and not spec.sensitive:
+            await retry_later(job_id, error, attempts)
+        else:
+            await finish(job_id, "failed", error=error, sensitive=spec.sensitive)
+        return
+    await finish(job_id, "done", result=result, sensitive=spec.sensitive)
+
+def call_with_kwargs(fn, kwargs):
+    # top level so it pickles into the process pool
+    return fn(**kwargs)
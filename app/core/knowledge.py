@@ -0,0 +1,145 @@
+import asyncio
+import numpy as np
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.embeddings import chunk_text, get_embedder
+from app.core.jobs import enqueue
+from app.core.vector_index import SpaceIndex, drop, index_dir, locked, read_meta, reader
+from app.db.database import AsyncSessionLocal
+from app.db.models import KnowledgeChunk, KnowledgeEntry, Space
+
+# postgres keeps the entries and their chunks, the vector index is derived
+# from them and only the index job writes it. new chunks start with
+# indexed=false, edits and deletes flag the old ones removed instead of
+# deleting them, and the job embeds the first kind, tombstones the second and
+# then marks/deletes the rows. searches double check hits against postgres so
+# an index that's a few seconds behind never returns something that's gone
+
+def chunks_for(entry: KnowledgeEntry) -> list[KnowledgeChunk]:
+    texts = chunk_text(f"{entry.title}\n{entry.content}",
+                       settings.KNOWLEDGE_CHUNK_WORDS, settings.KNOWLEDGE_CHUNK_OVERLAP)
+    return [
+        KnowledgeChunk(space_id=entry.space_id, entry_id=entry.id, position=position, content=text)
+        for position, text in enumerate(texts)
+    ]
+
+async def retire_chunks(db: AsyncSession, entry_id: int):
+    await db.execute(
+        update(KnowledgeChunk)
+        .where(KnowledgeChunk.entry_id == entry_id, KnowledgeChunk.removed.is_(False))
+        .values(removed=True)
+    )
+
+async def schedule_index(space_id: int) -> str:
+    # keyed, a space has at most one index job pending and any member can poll it
+    return await enqueue("index_space", {"space_id": space_id}, key=f"index_space:{space_id}", space_id=space_id)
+
+def apply(space_id: int, dim: int, embedder: str, ids: list[int], vectors: np.ndarray | None, removed: list[int]):
+    # blocking file work, runs in a thread
+    with locked(space_id):
+        index = SpaceIndex.open(space_id, writable=True) or SpaceIndex.create(space_id, dim, embedder)
+        if removed:
+            index.remove(removed)
+        if ids:
+            # a crash after the index write but before the commit replays the batch, no duplicates
+            index.remove(ids)
+            index.add(np.asarray(ids, dtype=np.int64), vectors)
+        if index.needs_training():
+            index.train()
+        index.save_meta()
+
+async def sync_index(space_id: int) -> dict:
+    embedder = get_embedder()
+    added = removed = 0
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(Space.id).where(Space.id == space_id, Space.deleted_at.is_(None))) is None:
+            await asyncio.to_thread(drop, space_id)
+            return {"added": 0, "removed": 0}
+
+        meta = read_meta(index_dir(space_id))
+        if meta is None or meta["embedder"] != embedder.name or meta["dim"] != embedder.dim:
+            # no index on this disk yet, or vectors from another embedder: start over from postgres
+            await asyncio.to_thread(drop, space_id)
+            await db.execute(update(KnowledgeChunk).where(KnowledgeChunk.space_id == space_id).values(indexed=False))
+            await db.execute(delete(KnowledgeChunk).where(KnowledgeChunk.space_id == space_id,
+                                                          KnowledgeChunk.removed.is_(True)))
+            await db.commit()
+
+        while True:
+            gone = (await db.scalars(
+                select(KnowledgeChunk.id)
+                .where(KnowledgeChunk.space_id == space_id, KnowledgeChunk.removed.is_(True))
+                .limit(settings.KNOWLEDGE_INDEX_BATCH)
+            )).all()
+            pending = (await db.execute(
+                select(KnowledgeChunk.id, KnowledgeChunk.content)
+                .where(KnowledgeChunk.space_id == space_id, KnowledgeChunk.indexed.is_(False),
+                       KnowledgeChunk.removed.is_(False))
+                .order_by(KnowledgeChunk.id)
+                .limit(settings.KNOWLEDGE_INDEX_BATCH)
+            )).all()
+            ids = [row.id for row in pending]
+            vectors = await asyncio.to_thread(embedder.embed, [row.content for row in pending]) if pending else None
+            # the index first, a crash in between only means the same batch runs again
+            await asyncio.to_thread(apply, space_id, embedder.dim, embedder.name, ids, vectors, list(gone))
+            if not gone and not pending:
+                return {"added": added, "removed": removed}
+            if ids:
+                await db.execute(update(KnowledgeChunk).where(KnowledgeChunk.id.in_(ids)).values(indexed=True))
+            if gone:
+                await db.execute(delete(KnowledgeChunk).where(KnowledgeChunk.id.in_(gone)))
+            await db.commit()
+            added += len(ids)
+            removed += len(gone)
+
+async def sweep() -> int:
+    # catches chunks written while a space's index job was already running
+    async with AsyncSessionLocal() as db:
+        space_ids = (await db.scalars(
+            select(KnowledgeChunk.space_id).distinct()
+            .where(or_(KnowledgeChunk.indexed.is_(False), KnowledgeChunk.removed.is_(True)))
+        )).all()
+    for space_id in space_ids:
+        await schedule_index(space_id)
+    return len(space_ids)
+
+async def ask(db: AsyncSession, space_id: int, query: str, k: int) -> tuple[list[dict], str | None]:
+    # top k chunks for the query, plus a job id when the index had to be (re)built first
+    embedder = get_embedder()
+    index = reader(space_id)
+    if index is None or index.meta["embedder"] != embedder.name or index.meta["dim"] != embedder.dim:
+        return [], await schedule_index(space_id)
+
+    vector = embedder.embed([query])[0]
+    if not vector.any():
+        return [], None
+    # numpy lets go of the gil for the scan. a few extra in case some are stale
+    hits = await asyncio.to_thread(index.search, vector, k + 8, settings.VECTOR_IVF_PROBES)
+    if not hits:
+        return [], None
+    rows = (await db.execute(
+        select(KnowledgeChunk.id, KnowledgeChunk.content, KnowledgeChunk.position,
+               KnowledgeEntry.id.label("entry_id"), KnowledgeEntry.title, KnowledgeEntry.kind)
+        .join(KnowledgeEntry, KnowledgeEntry.id == KnowledgeChunk.entry_id)
+        .where(KnowledgeChunk.id.in_([chunk_id for chunk_id, _ in hits]),
+               KnowledgeChunk.space_id == space_id, KnowledgeChunk.removed.is_(False))
+    )).all()
+    found = {row.id: row for row in rows}
+    results = []
+    for chunk_id, score in hits:
+        row = found.get(chunk_id)
+        if row is None:
+            continue
+        results.append({
+            "chunk_id": chunk_id,
+            "entry_id": row.entry_id,
+            "title": row.title,
+            "kind": row.kind,
+            "position": row.position,
+            "content": row.content,
+            "score": round(score, 4),
+        })
+        if len(results) == k:
+            break
+    return results, None
@@ -0,0 +1,66 @@
+import json
+from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LocalCache, SingleFlight, register_cache, invalidate, read_shared, store_shared, drop_shared
+from app.core.config import settings
+from app.core.security import get_current_user
+from app.core.presence import presence
+from app.db import database, schemas
+from app.db.models import SpaceMembership
+
+# every user's space ids, so "is this user in that space" is a set lookup.
+# same layering as the user cache: this worker's memory, then redis, then
+# postgres. joins, leaves, creates and deletes call invalidate_spaces() after
+# they commit, which drops the redis copy and every worker's local one and
+# bumps the generations so a load already in flight can't store what it read
+space_cache = register_cache("spaces", LocalCache(settings.MEMBERSHIP_CACHE_SIZE, settings.MEMBERSHIP_CACHE_TTL))
+space_loads = SingleFlight()
+
+def spaces_key(user_id) -> str:
+    return f"user:{user_id}:spaces"
+
+async def get_space_ids(user_id: int, db: AsyncSession) -> frozenset[int]:
+    space_ids = space_cache.get(str(user_id))
+    if space_ids is None:
+        # keyed on the generation like the user cache, see app.core.security
+        generation = space_cache.generation
+        space_ids = await space_loads.do((user_id, generation), lambda: load_space_ids(user_id, db, generation))
+    return space_ids
+
+async def load_space_ids(user_id: int, db: AsyncSession, generation: int) -> frozenset[int]:
+    cached, shared_generation = await read_shared(spaces_key(user_id))
+    if cached is not None:
+        space_ids = frozenset(json.loads(cached))
+        space_cache.set(str(user_id), space_ids, generation=generation)
+        return space_ids
+
+    space_ids = frozenset((await db.scalars(
+        select(SpaceMembership.space_id).where(SpaceMembership.user_id == user_id)
+    )).all())
+    # a join or leave that committed while this ran bumped the generations, and then
+    # neither copy is written. otherwise the old set could sit in redis for MEMBERSHIP_REDIS_TTL
+    await store_shared(spaces_key(user_id), json.dumps(sorted(space_ids)), settings.MEMBERSHIP_REDIS_TTL,
+                       shared_generation)
+    space_cache.set(str(user_id), space_ids, generation=generation)
+    return space_ids
+
+async def invalidate_spaces(*user_ids: int):
+    if not user_ids:
+        return
+    await drop_shared(*[spaces_key(user_id) for user_id in user_ids])
+    for user_id in user_ids:
+        await invalidate("spaces", str(user_id))
+
+async def is_member(user_id: int, space_id: int, db: AsyncSession) -> bool:
+    return space_id in await get_space_ids(user_id, db)
+
+async def require_membership(space_id: int,
+                             current_user: schemas.CurrentUser = Depends(get_current_user),
+                             db: AsyncSession = Depends(database.get_db)
+                             ) -> schemas.CurrentUser:
+    # for routes with a {space_id} path param, hands back the current user
+    if not await is_member(current_user.id, space_id, db):
+        raise HTTPException(status_code=403, detail="You dont belong to this space")
+    presence.seen(current_user.id, space_id)
+    return current_user
@@ -0,0 +1,220 @@
+import contextvars
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import wraps
+from sqlalchemy import event
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from app.core.config import settings
+
+logger = logging.getLogger("app.slow_requests")
+
+# prometheus style histogram, one per (name, labels). kept in process, so each
+# worker exposes its own numbers on /metrics
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+METRICS: dict[str, tuple[str, tuple[float, ...]]] = {
+    "http_request_duration_seconds": ("Total time spent handling the request", TIME_BUCKETS),
+    "http_request_sql_queries": ("SQL statements issued per request", COUNT_BUCKETS),
+    "http_request_sql_seconds": ("Time spent in SQL per request", TIME_BUCKETS),
+    "http_request_redis_calls": ("Redis commands issued per request", COUNT_BUCKETS),
+    "http_request_redis_seconds": ("Time spent waiting on redis per request", TIME_BUCKETS),
+    "http_request_bcrypt_seconds": ("Time spent hashing or verifying passwords per request", TIME_BUCKETS),
+    "db_pool_checkout_wait_seconds": ("Time spent waiting for a pooled connection", TIME_BUCKETS),
+    "group_commit_batch_size": ("Rows written per group commit transaction", COUNT_BUCKETS),
+}
+
+histograms: dict[tuple[str, tuple[tuple[str, str], ...]], Histogram] = {}
+request_totals: dict[tuple[str, str, str], int] = {}
+# other modules register callables returning extra lines (already formatted)
+collectors: list = []
+
+def observe(name: str, value: float, **labels: str):
+    key = (name, tuple(sorted(labels.items())))
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram(METRICS[name][1])
+    histogram.observe(value)
+
+@dataclass
+class RequestStats:
+    sql_count: int = 0
+    sql_time: float = 0.0
+    redis_count: int = 0
+    redis_time: float = 0.0
+    bcrypt_time: float = 0.0
+    statements: list[str] = field(default_factory=list)
+
+current_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("current_stats", default=None)
+
+def record_bcrypt(seconds: float):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.bcrypt_time += seconds
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_stats.get()
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.sql_time += elapsed
+    if settings.SLOW_REQUEST_MS and len(stats.statements) < 50:
+        stats.statements.append(f"{elapsed * 1000:.1f}ms {statement[:500]}")
+
+def instrument_engine(engine):
+    # create_app() can run more than once per process (tests, benchmarks)
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+def instrument_redis(client, is_async: bool):
+    # no hook api in redis-py, so wrap execute_command on the client instance.
+    # pipelines are their own client objects, so their execute gets wrapped as
+    # they're made, counting every queued command
+    if getattr(client.execute_command, "instrumented", False):
+        return
+    client.execute_command = timed(client.execute_command, is_async)
+    make_pipeline = client.pipeline
+
+    @wraps(make_pipeline)
+    def pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        pipe.execute = timed(pipe.execute, is_async, lambda: len(pipe.command_stack))
+        return pipe
+
+    client.pipeline = pipeline
+
+def timed(call, is_async: bool, count=lambda: 1):
+    if is_async:
+        @wraps(call)
+        async def run(*args, **kwargs):
+            # the stack is cleared by the time execute returns
+            commands = count()
+            start = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                record_redis(time.perf_counter() - start, commands)
+    else:
+        @wraps(call)
+        def run(*args, **kwargs):
+            commands = count()
+            start = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                record_redis(time.perf_counter() - start, commands)
+
+    run.instrumented = True # type: ignore
+    return run
+
+def record_redis(seconds: float, commands: int = 1):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.redis_count += commands
+        stats.redis_time += seconds
+
+# plain asgi middleware, cheaper than BaseHTTPMiddleware and doesn't buffer streaming responses
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_stats.reset(token)
+            route = scope.get("route")
+            # label by template (/messages/{id}) so ids don't blow up the label count
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            observe("http_request_duration_seconds", elapsed, route=path, method=method)
+            observe("http_request_sql_queries", stats.sql_count, route=path, method=method)
+            observe("http_request_sql_seconds", stats.sql_time, route=path, method=method)
+            observe("http_request_redis_calls", stats.redis_count, route=path, method=method)
+            observe("http_request_redis_seconds", stats.redis_time, route=path, method=method)
+            if stats.bcrypt_time:
+                observe("http_request_bcrypt_seconds", stats.bcrypt_time, route=path, method=method)
+            key = (path, method, str(status_code))
+            request_totals[key] = request_totals.get(key, 0) + 1
+
+            if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+                logger.warning(
+                    "slow request %s %s %d %.1fms sql=%d (%.1fms) redis=%d (%.1fms) bcrypt=%.1fms\n%s",
+                    method, scope["path"], status_code, elapsed * 1000,
+                    stats.sql_count, stats.sql_time * 1000, stats.redis_count, stats.redis_time * 1000,
+                    stats.bcrypt_time * 1000, "\n".join(stats.statements),
+                )
+
+def format_labels(labels, *extra: str) -> str:
+    # the whole {...} block, nothing at all for a series without labels
+    parts = [f'{k}="{v}"' for k, v in labels] + list(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def render() -> str:
+    lines = []
+    by_name: dict[str, list] = {}
+    for (name, labels), histogram in histograms.items():
+        by_name.setdefault(name, []).append((labels, histogram))
+    for name, series in by_name.items():
+        lines.append(f"# HELP {name} {METRICS[name][0]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = format_labels(labels, f'le="{bound}"')
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            le = format_labels(labels, 'le="+Inf"')
+            lines.append(f"{name}_bucket{le} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+    lines.append("# HELP http_requests_total Requests handled")
+    lines.append("# TYPE http_requests_total counter")
+    for (path, method, status_code), total in request_totals.items():
+        lines.append(f'http_requests_total{{route="{path}",method="{method}",status="{status_code}"}} {total}')
+
+    for collector in collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+async def metrics_endpoint(request: Request):
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
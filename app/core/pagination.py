@@ -0,0 +1,29 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+
+# cursors are opaque to the client, they just hand back whatever we gave them
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# search results are ordered by (rank, id) instead of time
+def encode_rank_cursor(rank: float, id: int) -> str:
+    raw = f"{rank!r}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return float(rank), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from app.core.config import settings
+from app.core.redis_client import ard
+
+# who's around in a space, without postgres. every authenticated request and
+# every heartbeat is a dict write in this worker, a flusher drains the buffer
+# every PRESENCE_FLUSH_INTERVAL seconds in one pipeline:
+#   presence:space:{id}             sorted set, user id -> last seen (unix time)
+#   active:space:{id}:day:{YYYYMMDD}   hyperloglog of the users seen that day
+#   active:space:{id}:month:{YYYYMM}   same for the month
+# a (space, user) pair is written at most once per PRESENCE_REFRESH seconds
+# per worker however chatty the client is, and the commands per flush grow
+# with the spaces touched, not the users. sorted sets get trimmed to the
+# online window and expire once a space goes quiet, the hyperloglogs are
+# ~12KB at most and expire after their retention
+
+def presence_key(space_id: int) -> str:
+    return f"presence:space:{space_id}"
+
+def day_key(space_id: int, day: date) -> str:
+    return f"active:space:{space_id}:day:{day:%Y%m%d}"
+
+def month_key(space_id: int, day: date) -> str:
+    return f"active:space:{space_id}:month:{day:%Y%m}"
+
+async def spaces_of(user_ids: list[int]) -> dict[int, frozenset[int]]:
+    # this worker's membership cache, then the copy in redis. a user whose
+    # spaces aren't cached anywhere gets fanned out on a later hit instead
+    # of costing a query here. membership imports security, which imports this
+    from app.core.membership import space_cache, spaces_key
+    found: dict[int, frozenset[int]] = {}
+    missing = []
+    for user_id in user_ids:
+        space_ids = space_cache.get(str(user_id))
+        if space_ids is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = space_ids
+    if missing:
+        # an invalidation during the mget means what came back may be stale for the local cache
+        generation = space_cache.generation
+        try:
+            cached = await ard.mget([spaces_key(user_id) for user_id in missing])
+        except Exception:
+            cached = []
+        for user_id, value in zip(missing, cached):
+            if value is not None:
+                found[user_id] = frozenset(json.loads(value))
+                space_cache.set(str(user_id), found[user_id], generation=generation)
+    return found
+
+class PresenceBuffer:
+    def __init__(self):
+        # (space_id, user_id) -> last seen, space_id None means all of the user's spaces
+        self.pending: dict[tuple[int | None, int], float] = {}
+        # when each pair last went into the buffer, so repeats inside PRESENCE_REFRESH are free
+        self.recent: dict[tuple[int | None, int], float] = {}
+
+    def seen(self, user_id: int, space_id: int | None = None):
+        now = time.time()
+        key = (space_id, user_id)
+        if now - self.recent.get(key, 0.0) < settings.PRESENCE_REFRESH:
+            return
+        self.recent[key] = now
+        self.pending[key] = now
+
+    async def flush(self) -> int:
+        # returns how many (space, user) pairs went to redis
+        pending, self.pending = self.pending, {}
+        now = time.time()
+        self.recent = {key: at for key, at in self.recent.items() if now - at < settings.PRESENCE_REFRESH}
+        if not pending:
+            return 0
+
+        visits: dict[int, dict[str, float]] = {}
+        anywhere = {user_id: at for (space_id, user_id), at in pending.items() if space_id is None}
+        for (space_id, user_id), at in pending.items():
+            if space_id is not None:
+                visits.setdefault(space_id, {})[str(user_id)] = at
+        found = await spaces_of(list(anywhere))
+        for user_id in anywhere.keys() - found.keys():
+            # nothing to fan out to yet, let their next request try again
+            self.recent.pop((None, user_id), None)
+        for user_id, space_ids in found.items():
+            for space_id in space_ids:
+                members = visits.setdefault(space_id, {})
+                members[str(user_id)] = max(members.get(str(user_id), 0.0), anywhere[user_id])
+
+        today = datetime.fromtimestamp(now, timezone.utc).date()
+        try:
+            async with ard.pipeline(transaction=False) as pipe:
+                for space_id, members in visits.items():
+                    key = presence_key(space_id)
+                    pipe.zadd(key, members, gt=True)
+                    pipe.zremrangebyscore(key, "-inf", now - settings.PRESENCE_ONLINE_SECONDS)
+                    pipe.expire(key, settings.PRESENCE_ONLINE_SECONDS)
+                    pipe.pfadd(day_key(space_id, today), *members)
+                    pipe.expire(day_key(space_id, today), settings.PRESENCE_DAILY_RETENTION_DAYS * 86400)
+                    pipe.pfadd(month_key(space_id, today), *members)
+                    pipe.expire(month_key(space_id, today), settings.PRESENCE_MONTHLY_RETENTION_DAYS * 86400)
+                await pipe.execute()
+        except Exception:
+            # presence is best effort, the next heartbeat puts them back
+            return 0
+        return sum(len(members) for members in visits.values())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def close(self):
+        await self.flush()
+
+presence = PresenceBuffer()
+
+async def forget(space_id: int, user_id: int):
+    # someone who left shouldn't show as online until the window runs out
+    presence.pending.pop((space_id, user_id), None)
+    try:
+        await ard.zrem(presence_key(space_id), str(user_id))
+    except Exception:
+        pass
+
+async def online(space_id: int, limit: int) -> tuple[int, list[tuple[int, float]]]:
+    # how many are online, and the `limit` most recently seen with their last seen time
+    cutoff = time.time() - settings.PRESENCE_ONLINE_SECONDS
+    async with ard.pipeline(transaction=False) as pipe:
+        pipe.zcount(presence_key(space_id), cutoff, "+inf")
+        pipe.zrevrangebyscore(presence_key(space_id), "+inf", cutoff, start=0, num=limit, withscores=True)
+        count, members = await pipe.execute()
+    return count, [(int(user_id), at) for user_id, at in members]
+
+async def active_counts(space_id: int, days: int) -> dict:
+    # distinct users per day for the last `days` days (today first), over the
+    # whole stretch, and for this month. hyperloglog, so within ~1%
+    today = datetime.now(timezone.utc).date()
+    span = [today - timedelta(days=i) for i in range(days)]
+    async with ard.pipeline(transaction=False) as pipe:
+        for day in span:
+            pipe.pfcount(day_key(space_id, day))
+        pipe.pfcount(*[day_key(space_id, day) for day in span])
+        pipe.pfcount(month_key(space_id, today))
+        *daily, period, monthly = await pipe.execute()
+    return {
+        "space_id": space_id,
+        "daily": [{"day": day, "active": count} for day, count in zip(span, daily)],
+        "period_active": period,
+        "month": f"{today:%Y-%m}",
+        "monthly_active": monthly,
+    }
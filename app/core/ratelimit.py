@@ -0,0 +1,162 @@
+import math
+import re
+import time
+from dataclasses import dataclass
+from fastapi import HTTPException, Request
+from app.core import metrics
+from app.core.cache import LocalCache
+from app.core.config import settings
+from app.core.redis_client import ard
+from app.core.security import get_userid_from_request
+
+# GCRA: each key stores a theoretical arrival time (tat). every token pushes it
+# forward by limit/period and a request fits while tat - now stays inside the
+# period, which gives a smooth sliding window with bursts up to the limit.
+# the check and the update are one lua script so workers can't race each other.
+# the script can also hand out several tokens at once, each worker keeps those
+# as a short lease and spends them without going back to redis
+GCRA_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local want = tonumber(ARGV[4])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local room = math.floor((now + period - tat) / interval)
+if room < cost then
+    return {0, tat + cost * interval - period - now}
+end
+local granted = math.min(want, room)
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], tat, 'PX', math.ceil(tat - now))
+return {granted, 0}
+"""
+
+UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+RATE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: float
+    text: str
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+def parse_rate(text: str) -> Rate:
+    match = RATE.match(text)
+    if not match:
+        raise ValueError(f"bad rate {text!r}, expected something like '10/minute'")
+    limit, multiple, unit = match.groups()
+    return Rate(int(limit), int(multiple or 1) * UNITS[unit], text)
+
+@dataclass
+class Lease:
+    tokens: int
+    # how many to ask for next time, doubles while a key stays busy
+    batch: int
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = settings.RATE_LIMIT_ENABLED
+        self.rates = {name: parse_rate(text) for name, text in settings.RATE_LIMITS.items()}
+        self.leases = LocalCache(settings.RATE_LIMIT_LOCAL_KEYS, settings.RATE_LIMIT_LEASE)
+        # per worker tat values, only used while redis is unreachable
+        self.fallback = LocalCache(settings.RATE_LIMIT_LOCAL_KEYS, 3600)
+        self.fallback_until = 0.0
+        self.script = ard.register_script(GCRA_SCRIPT)
+        self.checks = {"lease": 0, "redis": 0, "fallback": 0}
+
+    def max_batch(self, rate: Rate) -> int:
+        # tight limits (3/minute) stay exact, every check goes to redis
+        return max(1, min(settings.RATE_LIMIT_PRECLAIM, rate.limit // 10))
+
+    async def hit(self, name: str, key: str, cost: int = 1) -> float:
+        # returns 0 when allowed, otherwise seconds until it would be
+        if not self.enabled:
+            return 0.0
+        rate = self.rates[name]
+        lease_key = (name, key)
+        lease = self.leases.get(lease_key)
+        if lease is not None and lease.tokens >= cost:
+            lease.tokens -= cost
+            self.checks["lease"] += 1
+            return 0.0
+
+        batch = min(lease.batch * 2, self.max_batch(rate)) if lease else 1
+        want = max(cost, batch)
+        if time.monotonic() >= self.fallback_until:
+            try:
+                granted, retry_ms = await self.script(
+                    keys=[f"ratelimit:{name}:{key}"],
+                    args=[rate.interval * 1000, rate.period * 1000, cost, want],
+                )
+                self.checks["redis"] += 1
+            except Exception:
+                # give redis a few seconds before trying again
+                self.fallback_until = time.monotonic() + 5
+            else:
+                if not granted:
+                    return max(int(retry_ms), 1) / 1000
+                # kept even when empty, a key that comes back within the lease asks for more
+                self.leases.set(lease_key, Lease(int(granted) - cost, batch))
+                return 0.0
+
+        self.checks["fallback"] += 1
+        return self.local_hit(name, key, rate, cost)
+
+    def local_hit(self, name: str, key: str, rate: Rate, cost: int) -> float:
+        # same gcra as the script, but only this worker's traffic counts
+        now = time.time()
+        tat = max(self.fallback.get((name, key)) or now, now)
+        if math.floor((now + rate.period - tat) / rate.interval) < cost:
+            return max(tat + cost * rate.interval - rate.period - now, 0.001)
+        tat += cost * rate.interval
+        self.fallback.set((name, key), tat, ttl=tat - now)
+        return 0.0
+
+    async def check(self, name: str, key: str, cost: int = 1):
+        retry_after = await self.hit(name, key, cost)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {self.rates[name].text}",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def render_metrics(self) -> list[str]:
+        lines = [
+            "# HELP rate_limit_checks_total Rate limit checks by where they were decided",
+            "# TYPE rate_limit_checks_total counter",
+        ]
+        for source, total in self.checks.items():
+            lines.append(f'rate_limit_checks_total{{source="{source}"}} {total}')
+        return lines
+
+limiter = RateLimiter()
+metrics.collectors.append(limiter.render_metrics)
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+def by_ip(request: Request) -> str:
+    return f"ip:{client_ip(request)}"
+
+def by_user(request: Request) -> str:
+    user_id = get_userid_from_request(request)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return by_ip(request)
+
+def rate_limit(name: str, key_func=by_ip):
+    # route dependency, the rate itself comes from settings.RATE_LIMITS[name]
+    if name not in limiter.rates:
+        raise KeyError(f"no rate configured for {name!r}")
+
+    async def dependency(request: Request):
+        await limiter.check(name, key_func(request))
+    return dependency
@@ -0,0 +1,125 @@
+import asyncio
+import json
+from fastapi import WebSocket, WebSocketDisconnect
+from app.core.redis_client import ard
+
+def space_channel(space_id: int) -> str:
+    return f"space:{space_id}:events"
+
+async def publish_event(space_id: int, event: str, data: dict):
+    # fire and forget, a redis hiccup shouldn't fail the write that triggered it
+    try:
+        await ard.publish(space_channel(space_id), json.dumps({"type": event, "data": data}, default=str))
+    except Exception:
+        pass
+
+async def publish_events(events: list[tuple[int, str, dict]]):
+    # same as publish_event but one round trip for the whole batch
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            for space_id, event, data in events:
+                pipe.publish(space_channel(space_id), json.dumps({"type": event, "data": data}, default=str))
+            await pipe.execute()
+    except Exception:
+        pass
+
+# one redis subscription per worker, fanned out to the sockets connected to this
+# worker. every socket gets its own bounded queue so a slow client gets dropped
+# instead of holding up everyone else in the space
+class SpaceHub:
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self.queues: dict[int, set[asyncio.Queue]] = {}
+        self.pubsub = None
+        self.listener: asyncio.Task | None = None
+        self.lock = asyncio.Lock()
+
+    async def join(self, space_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        async with self.lock:
+            if self.pubsub is None:
+                self.pubsub = ard.pubsub()
+            if space_id not in self.queues:
+                self.queues[space_id] = set()
+                await self.pubsub.subscribe(space_channel(space_id))
+            self.queues[space_id].add(queue)
+            if self.listener is None or self.listener.done():
+                self.listener = asyncio.create_task(self._listen())
+        return queue
+
+    async def leave(self, space_id: int, queue: asyncio.Queue):
+        async with self.lock:
+            queues = self.queues.get(space_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self.queues[space_id]
+                try:
+                    await self.pubsub.unsubscribe(space_channel(space_id)) # type: ignore
+                except Exception:
+                    pass
+
+    def dispatch(self, space_id: int, payload: str):
+        for queue in list(self.queues.get(space_id, ())):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # None tells pump() to hang up on this client
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0) # type: ignore
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # lost redis, back off and let the next loop reconnect
+                await asyncio.sleep(1.0)
+                continue
+            if message is None:
+                continue
+            space_id = int(message["channel"].split(":")[1])
+            self.dispatch(space_id, message["data"])
+
+    async def pump(self, websocket: WebSocket, queue: asyncio.Queue, on_ping=None):
+        async def send():
+            while True:
+                payload = await queue.get()
+                if payload is None:
+                    await websocket.close(code=1013)
+                    return
+                await websocket.send_text(payload)
+
+        async def receive():
+            # clients only send pings, we just need to notice when they leave
+            try:
+                while True:
+                    await websocket.receive_text()
+                    if on_ping is not None:
+                        on_ping()
+            except WebSocketDisconnect:
+                return
+
+        tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+        if self.pubsub is not None:
+            try:
+                await self.pubsub.aclose()
+            except Exception:
+                pass
+        self.queues.clear()
+        self.pubsub = None
+        self.listener = None
+
+hub = SpaceHub()
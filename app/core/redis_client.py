@@ -0,0 +1,17 @@
+import redis
+import redis.asyncio
+from app.core.config import settings
+
+# REDIS_URL=fakeredis:// keeps everything in process, for offline benchmark runs
+FAKE_REDIS = settings.REDIS_URL.startswith("fakeredis://")
+
+if FAKE_REDIS:
+    import fakeredis
+    import fakeredis.aioredis
+    fake_server = fakeredis.FakeServer()
+    rd = fakeredis.FakeRedis(server=fake_server, decode_responses=True)
+    ard = fakeredis.aioredis.FakeRedis(server=fake_server, decode_responses=True)
+else:
+    # sync client is only left for scripts, request handlers use ard
+    rd = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    ard = redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
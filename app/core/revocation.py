@@ -0,0 +1,75 @@
+import asyncio
+import time
+from app.core.redis_client import ard
+
+# redis keeps every revoked jti in a sorted set scored by the token's exp, so
+# anything that expired can be trimmed off and the set never grows past the
+# tokens that are still alive. each worker mirrors it in memory and gets new
+# entries over pub/sub, so the auth hot path is just a dict lookup
+REVOKED_KEY = "tokens:revoked"
+REVOKED_CHANNEL = "tokens:revoked"
+
+class RevocationList:
+    def __init__(self):
+        self.entries: dict[str, float] = {}
+        self.next_prune = 0.0
+
+    def add(self, jti: str, exp: float):
+        if exp > time.time():
+            self.entries[jti] = exp
+
+    def is_revoked(self, jti: str) -> bool:
+        now = time.time()
+        if now >= self.next_prune:
+            self.prune(now)
+        exp = self.entries.get(jti)
+        return exp is not None and exp > now
+
+    def prune(self, now: float):
+        self.entries = {jti: exp for jti, exp in self.entries.items() if exp > now}
+        self.next_prune = now + 60
+
+    def replace(self, entries: dict[str, float]):
+        self.entries = entries
+        self.prune(time.time())
+
+revoked = RevocationList()
+
+# returns False when the token was already revoked, even by another worker,
+# which is how refresh token reuse gets caught
+async def revoke_token(jti: str, exp: float) -> bool:
+    fresh = not revoked.is_revoked(jti)
+    revoked.add(jti, exp)
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            pipe.zadd(REVOKED_KEY, {jti: exp}, nx=True)
+            pipe.zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+            pipe.publish(REVOKED_CHANNEL, f"{jti}:{exp}")
+            added, *_ = await pipe.execute()
+    except Exception:
+        return fresh
+    return fresh and bool(added)
+
+async def listen_revocations():
+    while True:
+        pubsub = ard.pubsub()
+        try:
+            await pubsub.subscribe(REVOKED_CHANNEL)
+            # subscribe first, then load, so nothing revoked in between gets missed
+            entries = await ard.zrangebyscore(REVOKED_KEY, time.time(), "+inf", withscores=True)
+            revoked.replace({jti: exp for jti, exp in entries})
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                jti, exp = message["data"].rsplit(":", 1)
+                revoked.add(jti, float(exp))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await asyncio.sleep(1.0)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
@@ -1,16 +1,24 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from app.core.config import settings
 from fastapi.security import OAuth2PasswordBearer
 from app.db import models, database
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 from fastapi import Request
 from app.db import schemas
-import redis
-
-rd = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+from app.core.redis_client import rd, ard
+from app.core.cache import LocalCache, SingleFlight, register_cache, invalidate, read_shared, store_shared, drop_shared
+from app.core.revocation import revoked
+from app.core.metrics import record_bcrypt
+from app.core.jobs import enqueue, wait_for_job
+from app.core.presence import presence
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -22,53 +30,148 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# bcrypt drops the GIL so a few threads really do run in parallel
+bcrypt_pool = ThreadPoolExecutor(max_workers=settings.BCRYPT_WORKERS or 1, thread_name_prefix="bcrypt")
+
+async def hash_password_async(password: str) -> str:
+    start = time.perf_counter()
+    try:
+        if settings.BCRYPT_OFFLOAD:
+            job_id = await enqueue("hash_password", {"password": password}, sensitive=True)
+            return await wait_for_job(job_id, settings.BCRYPT_OFFLOAD_TIMEOUT)
+        if not settings.BCRYPT_WORKERS:
+            return hash_password(password)
+        return await asyncio.get_running_loop().run_in_executor(bcrypt_pool, hash_password, password)
+    finally:
+        record_bcrypt(time.perf_counter() - start)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    start = time.perf_counter()
+    try:
+        if settings.BCRYPT_OFFLOAD:
+            job_id = await enqueue("verify_password", {"plain_password": plain_password,
+                                                       "hashed_password": hashed_password}, sensitive=True)
+            return await wait_for_job(job_id, settings.BCRYPT_OFFLOAD_TIMEOUT)
+        if not settings.BCRYPT_WORKERS:
+            return verify_password(plain_password, hashed_password)
+        return await asyncio.get_running_loop().run_in_executor(
+            bcrypt_pool, verify_password, plain_password, hashed_password)
+    finally:
+        record_bcrypt(time.perf_counter() - start)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=60))
-    to_encode.update({"exp": expire})
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_MINUTES))
+    # jti is what gets put on the denylist when a token is revoked
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     # this works the opposite as payload in the get_current_user
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+# ver is the user's token_version when it was issued, bumping it kills every older token
+def create_token_pair(user_id: int, token_version: int) -> dict:
+    access_token = create_access_token(
+        data={"sub": str(user_id), "type": "access", "ver": token_version}
+    )
+    refresh_token = create_access_token(
+        data={"sub": str(user_id), "type": "refresh", "ver": token_version},
+        expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_MINUTES)
+    )
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+# verified claims keyed by a digest of the token, each entry lives until the token's exp
+# so a repeat token skips the signature check entirely
+token_cache = LocalCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+def decode_token(token: str, request: Request | None = None) -> dict:
+    # the rate limit key func and get_current_user both need the claims, decode once per request
+    if request is not None and getattr(request.state, "token", None) == token:
+        return request.state.token_claims
+
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is None or payload.get("exp", 0) <= time.time():
+        # this works the opposite as payload in the create_access_token (breaking down the encode)
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        ttl = payload["exp"] - time.time() if "exp" in payload else settings.TOKEN_CACHE_TTL
+        token_cache.set(digest, payload, ttl=min(ttl, settings.TOKEN_CACHE_TTL))
+
+    if request is not None:
+        request.state.token = token
+        request.state.token_claims = payload
+    return payload
+
+async def get_current_user(request: Request,
+                           token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(database.get_db)
+                           ) -> schemas.CurrentUser:
+    user = await get_user_from_token(token, db, request)
+    # counts as being online in every space they're in, see app/core/presence.py
+    presence.seen(user.id)
+    return user
+
+# shared by get_current_user and the websocket routes (they can't use oauth2_scheme)
+async def get_user_from_token(token: str, db: AsyncSession, request: Request | None = None) -> schemas.CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
     try:
-        # this works the opposite as payload in the create_access_token (breaking down the encode)
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token, request)
         user_id = payload.get("sub")
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    key = f"user:{user_id}"
-    
-    try:
-        cache = rd.get(key)
-    except Exception:
-        cache = None
-
-    if cache is not None and isinstance(cache, str):
-        cached = schemas.UserResponse.model_validate_json(cache)
-        user = db.get(models.User, cached.id)
-        if user:
-            return user
-        
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
-    if user is None:
+    # refresh tokens only work on /auth/refresh
+    if payload.get("type", "access") != "access":
+        raise credentials_exception
+    if payload.get("jti") and revoked.is_revoked(payload["jti"]):
         raise credentials_exception
-    try:
-        rd.set(key, schemas.UserResponse.model_validate(user).model_dump_json(), ex=120)
-    except:
-        pass
     
+    user = await get_cached_user(str(user_id), db)
+    if user is None or payload.get("ver", 0) != user.token_version:
+        raise credentials_exception
+    return user
+
+async def get_cached_user(user_id: str, db: AsyncSession) -> schemas.CurrentUser | None:
+    user = user_cache.get(user_id)
+    if user is None:
+        # keyed on the generation too, a request after an invalidation never joins a load from before it
+        generation = user_cache.generation
+        user = await user_loads.do((user_id, generation), lambda: load_user(user_id, db, generation))
     return user
 
+# layer 1 is this worker's memory, layer 2 is redis, postgres only on a full miss.
+# writers call invalidate_user() after they commit, see the generations in app.core.cache
+user_cache = register_cache("user", LocalCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL))
+user_loads = SingleFlight()
+
+def user_key(user_id) -> str:
+    return f"user:{user_id}"
+
+async def load_user(user_id: str, db: AsyncSession, generation: int) -> schemas.CurrentUser | None:
+    cache, shared_generation = await read_shared(user_key(user_id))
+    if cache is not None:
+        user = schemas.CurrentUser.model_validate_json(cache)
+        user_cache.set(user_id, user, generation=generation)
+        return user
+
+    db_user = await db.get(models.User, int(user_id))
+    if db_user is None:
+        return None
+    user = schemas.CurrentUser.model_validate(db_user)
+    await store_shared(user_key(user_id), user.model_dump_json(), settings.USER_REDIS_TTL, shared_generation)
+    user_cache.set(user_id, user, generation=generation)
+    return user
+
+async def invalidate_user(user_id: int):
+    # after the commit: redis first, then this worker and every other one
+    await drop_shared(user_key(user_id))
+    await invalidate("user", str(user_id))
+
 def get_userid_from_request(request: Request):
     auth = request.headers.get("Authorization")
     if not auth or not auth.startswith("Bearer "):
@@ -76,7 +179,7 @@ def get_userid_from_request(request: Request):
     
     token = auth.split(" ", 1)[1]
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token, request)
     except JWTError:
         return None
     user_id = payload.get("sub")
@@ -0,0 +1,166 @@
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, tuple_, update, func
+from app.core.config import settings
+from app.core.jobs import enqueue
+from app.db.database import AsyncSessionLocal
+from app.db.models import Message, Space, SpaceSummary
+
+# every space keeps a rolling digest. a refresh only reads the messages past the
+# stored high-water mark (created_at, id) and folds them into the previous state,
+# so it costs O(new messages) and reading the digest is a primary key lookup
+
+class Summariser:
+    # state is whatever the summariser needs to fold more messages in later,
+    # it has to round trip through json
+    name = ""
+
+    def fold(self, state: dict | None, messages: list[tuple[int, str]]) -> dict:
+        raise NotImplementedError
+
+    def render(self, state: dict) -> str:
+        raise NotImplementedError
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD = re.compile(r"[a-z0-9][a-z0-9'_-]*")
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does for from
+had has have he her him his how i if in into is it its just like me more my no not now of on one or
+our out so some than that the their them then there these they this to too up us was we were what
+when where which who will with would you your yeah ok okay im dont
+""".split())
+
+class ExtractiveSummariser(Summariser):
+    # picks the sentences whose words come up most across the whole space. the
+    # state is the word counts plus the current picks, so a refresh only has
+    # to rescore those picks against the new sentences. no network, and the
+    # same messages always give the same digest
+    name = "extractive"
+
+    def __init__(self, sentences: int = 5, max_terms: int = 2000):
+        self.sentences = sentences
+        self.max_terms = max_terms
+
+    def terms(self, text: str) -> list[str]:
+        return [w for w in WORD.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS]
+
+    def score(self, counts: dict[str, int], text: str) -> float:
+        words = set(self.terms(text))
+        if not words:
+            return 0.0
+        # mean weight so long rambling sentences don't win by size alone
+        return sum(counts.get(w, 0) for w in words) / len(words) ** 0.5
+
+    def fold(self, state, messages):
+        counts: dict[str, int] = dict(state["terms"]) if state else {}
+        picks: list[list] = list(state["picks"]) if state else []
+
+        candidates = []
+        for message_id, content in messages:
+            for sentence in SENTENCE_SPLIT.split(content):
+                sentence = " ".join(sentence.split())
+                words = self.terms(sentence)
+                for w in words:
+                    counts[w] = counts.get(w, 0) + 1
+                if len(words) >= 3:
+                    candidates.append([message_id, sentence])
+
+        if len(counts) > self.max_terms:
+            top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:self.max_terms]
+            counts = dict(top)
+
+        seen = set()
+        unique = []
+        for message_id, sentence in picks + candidates:
+            if sentence.lower() not in seen:
+                seen.add(sentence.lower())
+                unique.append([message_id, sentence])
+        # ties go to the older message so the digest doesn't churn
+        unique.sort(key=lambda pick: (-self.score(counts, pick[1]), pick[0]))
+        picks = sorted(unique[:self.sentences], key=lambda pick: pick[0])
+        return {"terms": counts, "picks": picks}
+
+    def render(self, state):
+        return "\n".join(f"- {sentence}" for _, sentence in state["picks"])
+
+summarisers: dict[str, type[Summariser]] = {
+    "extractive": ExtractiveSummariser,
+}
+
+def get_summariser() -> Summariser:
+    summariser = summarisers.get(settings.SUMMARISER)
+    if summariser is None:
+        raise ValueError(f"unknown summariser {settings.SUMMARISER!r}")
+    if summariser is ExtractiveSummariser:
+        return ExtractiveSummariser(settings.SUMMARY_SENTENCES)
+    return summariser()
+
+async def refresh_summary(space_id: int) -> int:
+    # returns the digest version after the refresh, 0 if the space is gone
+    summariser = get_summariser()
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(Space.id).where(Space.id == space_id, Space.deleted_at.is_(None))) is None:
+            return 0
+        summary = await db.get(SpaceSummary, space_id)
+        # a different summariser can't fold into this state, start over
+        if summary is not None and summary.summariser != summariser.name:
+            await db.delete(summary)
+            await db.flush()
+            summary = None
+
+        state = json.loads(summary.state) if summary else None # type: ignore
+        mark = (summary.last_created_at, summary.last_message_id) if summary and summary.last_message_id else None
+        folded = 0
+        while True:
+            query = select(Message.id, Message.content, Message.created_at).where(Message.space_id == space_id)
+            if mark:
+                query = query.where(tuple_(Message.created_at, Message.id) > mark)
+            query = query.order_by(Message.created_at.asc(), Message.id.asc()).limit(settings.SUMMARY_BATCH)
+            rows = (await db.execute(query)).all()
+            if rows:
+                state = summariser.fold(state, [(row.id, row.content) for row in rows])
+                mark = (rows[-1].created_at, rows[-1].id)
+                folded += len(rows)
+            if len(rows) < settings.SUMMARY_BATCH:
+                break
+
+        if summary is None:
+            state = state or summariser.fold(None, [])
+            db.add(SpaceSummary(
+                space_id=space_id, content=summariser.render(state), state=json.dumps(state),
+                summariser=summariser.name, version=1, message_count=folded,
+                last_created_at=mark and mark[0], last_message_id=mark and mark[1],
+            ))
+            await db.commit()
+            return 1
+
+        version = summary.version + (1 if folded else 0)
+        values = {"refreshed_at": func.now()}
+        if folded:
+            values.update(
+                content=summariser.render(state), state=json.dumps(state), version=version,
+                message_count=summary.message_count + folded, last_created_at=mark[0], last_message_id=mark[1], # type: ignore
+            )
+        # only lands if nobody else refreshed in the meantime, their digest is just as good
+        await db.execute(
+            update(SpaceSummary)
+            .where(SpaceSummary.space_id == space_id, SpaceSummary.version == summary.version)
+            .values(**values)
+        )
+        await db.commit()
+        return version # type: ignore
+
+async def schedule_refresh(space_id: int) -> str:
+    # shared by the space, any member can poll it
+    return await enqueue("summarise_space", {"space_id": space_id},
+                         key=f"summarise_space:{space_id}", space_id=space_id)
+
+def is_stale(summary: SpaceSummary) -> bool:
+    refreshed_at = summary.refreshed_at
+    if refreshed_at is None:
+        return True
+    if refreshed_at.tzinfo is None: # type: ignore
+        # sqlite hands back naive utc
+        refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - refreshed_at > timedelta(seconds=settings.SUMMARY_MAX_AGE)
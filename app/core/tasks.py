@@ -0,0 +1,41 @@
+from app.core.jobs import job
+from app.core.security import hash_password, verify_password
+from app.db.purge import purge_space
+from app.core.summary import refresh_summary
+from app.core.unread import reconcile
+from app.core.knowledge import sync_index, sweep
+from app.db.archive import maintain
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+
+# everything the worker can run. importing this module is what registers them
+
+# bcrypt is pure cpu, it goes to the worker's process pool (see BCRYPT_OFFLOAD)
+job("hash_password", cpu=True, sensitive=True)(hash_password)
+job("verify_password", cpu=True, sensitive=True)(verify_password)
+
+@job("purge_space")
+async def purge_space_job(space_id: int):
+    # safe to run twice, it just deletes whatever is left
+    await purge_space(space_id)
+
+@job("summarise_space")
+async def summarise_space_job(space_id: int):
+    return await refresh_summary(space_id)
+
+@job("reconcile_unread", every=settings.UNREAD_RECONCILE_INTERVAL)
+async def reconcile_unread_job():
+    async with AsyncSessionLocal() as db:
+        return await reconcile(db)
+
+@job("index_space")
+async def index_space_job(space_id: int):
+    return await sync_index(space_id)
+
+@job("index_pending", every=settings.KNOWLEDGE_SWEEP_INTERVAL)
+async def index_pending_job():
+    return await sweep()
+
+@job("maintain_messages", every=settings.PARTITION_MAINTENANCE_INTERVAL)
+async def maintain_messages_job():
+    return await maintain()
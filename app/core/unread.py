@@ -0,0 +1,142 @@
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.redis_client import ard
+from app.db.models import Message, SpaceMembership
+
+# unread counts without counting messages on every launch. each space has a
+# hash space:{id}:unread with "total" (live messages in the space) and one
+# field per member holding what total was the last time they caught up, so
+# unread is total - mark. postgres keeps last_read_message_id as the truth,
+# anything missing from redis gets rebuilt from it and a periodic job
+# reconciles whatever drift deletes and races leave behind
+
+def unread_key(space_id: int) -> str:
+    return f"space:{space_id}:unread"
+
+# the author has read their own messages, so their mark moves with the total.
+# nothing is touched until the hash has been seeded, a fresh counter would be wrong
+BUMP_SCRIPT = ard.register_script("""
+if redis.call('HEXISTS', KEYS[1], 'total') == 1 then
+    redis.call('HINCRBY', KEYS[1], 'total', ARGV[2])
+    if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+        redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+    end
+end
+return 0
+""")
+
+SEED_SCRIPT = ard.register_script("""
+if redis.call('HEXISTS', KEYS[1], 'total') == 0 then
+    redis.call('HSET', KEYS[1], 'total', ARGV[2])
+end
+local total = tonumber(redis.call('HGET', KEYS[1], 'total'))
+redis.call('HSET', KEYS[1], ARGV[1], total - tonumber(ARGV[3]))
+return total
+""")
+
+async def messages_changed(changes: dict[tuple[int, int], int]):
+    # {(space_id, author_id): +n or -n}, all in one round trip
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            for (space_id, user_id), delta in changes.items():
+                await BUMP_SCRIPT(keys=[unread_key(space_id)], args=[user_id, delta], client=pipe)
+            await pipe.execute()
+    except Exception:
+        pass
+
+async def forget_read_mark(space_id: int, user_id: int):
+    # rebuilt from last_read_message_id on the next read
+    try:
+        await ard.hdel(unread_key(space_id), str(user_id))
+    except Exception:
+        pass
+
+async def reset_counts(space_id: int):
+    # after a bulk change, the next read rebuilds the whole hash from postgres
+    try:
+        await ard.delete(unread_key(space_id))
+    except Exception:
+        pass
+
+def exact_counts(user_id: int, space_ids):
+    # total and unread per space straight from postgres, unread skips the user's own messages
+    unread = func.sum(case(
+        (and_(Message.id > func.coalesce(SpaceMembership.last_read_message_id, 0),
+              Message.user_id != user_id), 1),
+        else_=0,
+    ))
+    return (
+        select(SpaceMembership.space_id, func.count(Message.id).label("total"), unread.label("unread"))
+        .outerjoin(Message, Message.space_id == SpaceMembership.space_id)
+        .where(SpaceMembership.user_id == user_id, SpaceMembership.space_id.in_(space_ids))
+        .group_by(SpaceMembership.space_id)
+    )
+
+async def unread_counts(db: AsyncSession, user_id: int, space_ids: list[int]) -> dict[int, int]:
+    counts: dict[int, int] = {}
+    missing = list(space_ids)
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            for space_id in space_ids:
+                pipe.hmget(unread_key(space_id), "total", str(user_id))
+            marks = await pipe.execute()
+        missing = []
+        for space_id, (total, mark) in zip(space_ids, marks):
+            if total is None or mark is None:
+                missing.append(space_id)
+            else:
+                counts[space_id] = max(0, int(total) - int(mark))
+    except Exception:
+        pass
+    if not missing:
+        return counts
+
+    rows = (await db.execute(exact_counts(user_id, missing))).all()
+    for row in rows:
+        counts[row.space_id] = int(row.unread or 0)
+    try:
+        async with ard.pipeline(transaction=False) as pipe:
+            for row in rows:
+                await SEED_SCRIPT(keys=[unread_key(row.space_id)], args=[user_id, row.total, row.unread or 0], client=pipe)
+            await pipe.execute()
+    except Exception:
+        pass
+    return counts
+
+async def reconcile(db: AsyncSession) -> int:
+    # rewrites every space's hash from postgres, a chunk of spaces at a time.
+    # returns how many memberships it went through
+    unread = func.sum(case(
+        (and_(Message.id > func.coalesce(SpaceMembership.last_read_message_id, 0),
+              Message.user_id != SpaceMembership.user_id), 1),
+        else_=0,
+    ))
+    seen = 0
+    after = 0
+    while True:
+        space_ids = (await db.scalars(
+            select(SpaceMembership.space_id).distinct().where(SpaceMembership.space_id > after)
+            .order_by(SpaceMembership.space_id).limit(settings.UNREAD_RECONCILE_BATCH)
+        )).all()
+        if not space_ids:
+            return seen
+        totals = dict((await db.execute(
+            select(Message.space_id, func.count()).where(Message.space_id.in_(space_ids)).group_by(Message.space_id)
+        )).all())
+        rows = (await db.execute(
+            select(SpaceMembership.space_id, SpaceMembership.user_id, unread.label("unread"))
+            .outerjoin(Message, Message.space_id == SpaceMembership.space_id)
+            .where(SpaceMembership.space_id.in_(space_ids))
+            .group_by(SpaceMembership.space_id, SpaceMembership.user_id)
+        )).all()
+        hashes: dict[int, dict[str, int]] = {space_id: {"total": totals.get(space_id, 0)} for space_id in space_ids}
+        for row in rows:
+            hashes[row.space_id][str(row.user_id)] = hashes[row.space_id]["total"] - int(row.unread or 0)
+        async with ard.pipeline(transaction=True) as pipe:
+            for space_id, mapping in hashes.items():
+                pipe.delete(unread_key(space_id))
+                pipe.hset(unread_key(space_id), mapping=mapping) # type: ignore
+            await pipe.execute()
+        seen += len(rows)
+        after = space_ids[-1]
@@ -0,0 +1,262 @@
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+import numpy as np
+from app.core.cache import LocalCache
+from app.core.config import settings
+
+# one vector index per space on local disk, numpy arrays that are memory-mapped
+# so a worker only pages in what a search touches. per space directory:
+#   meta.json            dim, count, removed, and which files are current
+#   vectors-{n}.npy      (capacity, dim) float32 rows
+#   ids-{n}.npy          (capacity,) int64 chunk id per row, -1 once removed
+#   lists-{n}.npy        (capacity,) int32 ivf list per row, -1 before training
+#   centroids-{n}.npy    (lists, dim) float32, only once ivf is trained
+#   offsets-{n}.npy      (lists + 1,) int64, where each list starts in the sorted part
+# appends write rows past `count` in place and then bump count in meta.json.
+# growing, compacting and training write new files instead, so a reader that
+# still maps the old ones never sees half a change. writers hold a flock on the
+# directory, readers never lock and reopen whenever meta.json is replaced
+
+def index_dir(space_id: int) -> str:
+    return os.path.join(settings.VECTOR_INDEX_DIR, str(space_id))
+
+def read_meta(path: str) -> dict | None:
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def kmeans(vectors: np.ndarray, lists: int, iterations: int = 10) -> np.ndarray:
+    # spherical k-means, the rows are unit length so the nearest centroid is the biggest dot product
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # an empty list keeps its old centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+    return centroids
+
+class SpaceIndex:
+    def __init__(self, path: str, meta: dict, writable: bool = False):
+        self.path = path
+        self.meta = meta
+        mode = "r+" if writable else "r"
+        files = meta["files"]
+        self.vectors = np.load(self.file(files["vectors"]), mmap_mode=mode)
+        self.ids = np.load(self.file(files["ids"]), mmap_mode=mode)
+        self.lists = np.load(self.file(files["lists"]), mmap_mode=mode)
+        self.centroids = np.load(self.file(files["centroids"])) if files.get("centroids") else None
+        self.offsets = np.load(self.file(files["offsets"])) if files.get("offsets") else None
+
+    @classmethod
+    def open(cls, space_id: int, writable: bool = False) -> "SpaceIndex | None":
+        path = index_dir(space_id)
+        meta = read_meta(path)
+        return cls(path, meta, writable) if meta else None
+
+    @classmethod
+    def create(cls, space_id: int, dim: int, embedder: str) -> "SpaceIndex":
+        path = index_dir(space_id)
+        os.makedirs(path, exist_ok=True)
+        meta = {"dim": dim, "embedder": embedder, "count": 0, "removed": 0,
+                "generation": 0, "trained_on": 0, "files": {}}
+        index = cls.__new__(cls)
+        index.path, index.meta, index.centroids, index.offsets = path, meta, None, None
+        index.resize(settings.VECTOR_INDEX_INITIAL)
+        index.save_meta()
+        return index
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    def new_file(self, kind: str, shape, dtype, fill=None) -> np.ndarray:
+        self.meta["generation"] += 1
+        name = f"{kind}-{self.meta['generation']}.npy"
+        array = np.lib.format.open_memmap(self.file(name), mode="w+", dtype=dtype, shape=shape)
+        if fill is not None:
+            array[:] = fill
+        staged = self.meta.setdefault("staged", {})
+        if kind in staged:
+            # replaced again before meta.json ever pointed at it. unlinking is
+            # fine while it's still mapped, resize() may be copying out of it
+            os.remove(self.file(staged[kind]))
+        staged[kind] = name
+        return array
+
+    def save_meta(self):
+        # the atomic rename is the commit point, files nobody points at get removed after it
+        staged = self.meta.pop("staged", {})
+        old = [name for kind, name in self.meta["files"].items() if kind in staged]
+        self.meta["files"].update(staged)
+        for kind in staged:
+            if kind in ("vectors", "ids", "lists"):
+                getattr(self, kind).flush()
+        tmp = self.file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.file("meta.json"))
+        for name in old:
+            try:
+                os.remove(self.file(name))
+            except FileNotFoundError:
+                pass
+
+    def resize(self, capacity: int, rows: np.ndarray | None = None):
+        # copies the live rows (all of them unless `rows` picks some) into bigger or tighter files
+        count = self.count if rows is None else len(rows)
+        vectors = self.new_file("vectors", (capacity, self.meta["dim"]), np.float32)
+        ids = self.new_file("ids", (capacity,), np.int64, fill=-1)
+        lists = self.new_file("lists", (capacity,), np.int32, fill=-1)
+        if count:
+            pick = slice(0, count) if rows is None else rows
+            vectors[:count] = self.vectors[pick]
+            ids[:count] = self.ids[pick]
+            lists[:count] = self.lists[pick]
+        self.vectors, self.ids, self.lists = vectors, ids, lists
+        self.meta["count"] = count
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        if not len(ids):
+            return
+        start = self.count
+        end = start + len(ids)
+        if end > len(self.ids):
+            self.resize(max(end, len(self.ids) * 2))
+        self.vectors[start:end] = vectors
+        self.ids[start:end] = ids
+        if self.centroids is not None:
+            self.lists[start:end] = np.argmax(vectors @ self.centroids.T, axis=1)
+        self.vectors.flush()
+        self.ids.flush()
+        self.lists.flush()
+        self.meta["count"] = end
+
+    def remove(self, ids) -> int:
+        count = self.count
+        rows = np.flatnonzero(np.isin(self.ids[:count], np.asarray(list(ids), dtype=np.int64)))
+        if len(rows):
+            self.ids[rows] = -1
+            self.ids.flush()
+            self.meta["removed"] += len(rows)
+        # mostly tombstones, rewrite with just the live rows
+        if self.meta["removed"] > max(settings.VECTOR_INDEX_INITIAL, count // 2):
+            live = np.flatnonzero(self.ids[:count] >= 0)
+            # order is kept, the sorted part just gets shorter
+            sorted_rows = int(np.searchsorted(live, self.meta["trained_on"]))
+            self.resize(max(settings.VECTOR_INDEX_INITIAL, len(live) * 2), live)
+            self.meta["removed"] = 0
+            if self.centroids is not None:
+                self.set_offsets(sorted_rows)
+        return len(rows)
+
+    def needs_training(self) -> bool:
+        if settings.VECTOR_INDEX_MODE != "ivf" or self.count < settings.VECTOR_IVF_MIN_ROWS:
+            return False
+        # retrain once the unsorted tail is as big as the sorted part
+        return self.centroids is None or self.count > 2 * self.meta["trained_on"]
+
+    def save_array(self, kind: str, array: np.ndarray):
+        # small arrays that are read whole, not mapped
+        self.meta["generation"] += 1
+        name = f"{kind}-{self.meta['generation']}.npy"
+        np.save(self.file(name), array)
+        self.meta.setdefault("staged", {})[kind] = name
+
+    def set_offsets(self, sorted_rows: int):
+        # the first sorted_rows rows are grouped by list, list c is rows offsets[c]:offsets[c+1]
+        offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64) # type: ignore
+        offsets[1:] = np.cumsum(np.bincount(self.lists[:sorted_rows], minlength=len(self.centroids))) # type: ignore
+        self.save_array("offsets", offsets)
+        self.offsets = offsets
+        self.meta["trained_on"] = sorted_rows
+
+    def train(self):
+        live = np.flatnonzero(self.ids[:self.count] >= 0)
+        lists = settings.VECTOR_IVF_LISTS or int(np.clip(np.sqrt(len(live)), 16, 4096))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(len(live), lists * 64), replace=False))
+        centroids = kmeans(np.asarray(self.vectors[sample]), lists)
+        assign = np.empty(len(live), dtype=np.int32)
+        for start in range(0, len(live), 65536):
+            block = np.asarray(self.vectors[live[start:start + 65536]])
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        # rewritten grouped by list, so probing a list reads one contiguous slice
+        order = np.argsort(assign, kind="stable")
+        self.resize(max(settings.VECTOR_INDEX_INITIAL, len(live) * 2), live[order])
+        self.lists[:len(live)] = assign[order]
+        self.meta["removed"] = 0
+        self.centroids = centroids
+        self.save_array("centroids", centroids)
+        self.set_offsets(len(live))
+
+    def search(self, query: np.ndarray, k: int, probes: int) -> list[tuple[int, float]]:
+        count = self.count
+        if self.centroids is not None and probes < len(self.centroids):
+            # ivf: only the lists whose centroids are closest to the query, a slice
+            # each out of the sorted part plus whatever was appended since training
+            nearest = np.argpartition(-(self.centroids @ query), probes)[:probes]
+            sorted_rows = self.meta["trained_on"]
+            tail = sorted_rows + np.flatnonzero(np.isin(self.lists[sorted_rows:count], nearest))
+            vectors = np.concatenate([self.vectors[self.offsets[c]:self.offsets[c + 1]] for c in nearest]
+                                     + [self.vectors[tail]])
+            ids = np.concatenate([self.ids[self.offsets[c]:self.offsets[c + 1]] for c in nearest]
+                                 + [self.ids[tail]])
+        else:
+            vectors, ids = self.vectors[:count], self.ids[:count]
+        if not len(ids):
+            return []
+        scores = vectors @ query
+        scores[ids < 0] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if ids[i] >= 0]
+
+@contextmanager
+def locked(space_id: int):
+    # one writer per space across every process on the host
+    path = index_dir(space_id)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "lock"), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def drop(space_id: int):
+    with locked(space_id):
+        shutil.rmtree(index_dir(space_id), ignore_errors=True)
+
+# maps this worker has open, reopened when meta.json changes underneath them
+readers = LocalCache(settings.VECTOR_INDEX_OPEN, 3600)
+
+def reader(space_id: int) -> SpaceIndex | None:
+    try:
+        stat = os.stat(os.path.join(index_dir(space_id), "meta.json"))
+    except FileNotFoundError:
+        readers.delete(space_id)
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    cached = readers.get(space_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        index = SpaceIndex.open(space_id)
+    except FileNotFoundError:
+        # a writer swapped files between the stat and the load, the next search gets them
+        return cached[1] if cached is not None else None
+    if index is not None:
+        readers.set(space_id, (stamp, index))
+    return index
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, NamedTuple
+import zstandard
+from pydantic import TypeAdapter
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LocalCache
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.partitions import ensure_partitions, is_partitioned, list_partitions, logger, next_month
+from app.db.transfer import ExportedMessage, exported_adapter
+
+# months older than MESSAGES_ARCHIVE_AFTER_DAYS leave postgres for zstd
+# compressed NDJSON on local disk, one file per space so a history read only
+# decompresses the space it wants:
+#   {ARCHIVE_DIR}/messages/2026-01/manifest.json         {"from", "to", "spaces": {"12": 3400}}
+#   {ARCHIVE_DIR}/messages/2026-01/space-12.ndjson.zst   oldest first, same lines as /export
+# a month directory is written under a .tmp name and renamed into place just
+# before the partition is dropped, in the same transaction that locked it.
+# archived messages are read only, get_messages falls through to them once
+# postgres runs out of older rows
+
+class ArchivedMessage(NamedTuple):
+    id: int
+    content: str
+    user_id: int | None
+    space_id: int
+    created_at: datetime
+
+archived_adapter = TypeAdapter(list[ExportedMessage])
+
+def archive_root() -> str:
+    return os.path.join(settings.ARCHIVE_DIR, "messages")
+
+def month_dir(month: datetime) -> str:
+    return os.path.join(archive_root(), f"{month:%Y-%m}")
+
+def space_file(month: datetime, space_id: int) -> str:
+    return os.path.join(month_dir(month), f"space-{space_id}.ndjson.zst")
+
+def write_manifest(path: str, manifest: dict):
+    tmp = os.path.join(path, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, "manifest.json"))
+
+class MonthWriter:
+    # rows come in ordered by (space_id, created_at, id), so one file is open at a time
+    def __init__(self, path: str):
+        self.path = path
+        self.compressor = zstandard.ZstdCompressor(level=settings.ARCHIVE_ZSTD_LEVEL)
+        self.counts: dict[str, int] = {}
+        self.space_id = None
+        self.file = None
+
+    def switch(self, space_id: int):
+        self.close_file()
+        self.space_id = space_id
+        self.file = open(os.path.join(self.path, f"space-{space_id}.ndjson.zst"), "wb")
+
+    def write(self, rows):
+        start = 0
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or rows[end].space_id != rows[start].space_id:
+                if rows[start].space_id != self.space_id:
+                    self.switch(rows[start].space_id)
+                lines = exported_adapter.dump_json(exported_adapter.validate_python(rows[start:end], from_attributes=True))
+                # every batch is its own zstd frame, readers go across frames
+                self.file.write(self.compressor.compress( # type: ignore
+                    lines[1:-1].replace(b'},{"id"', b'}\n{"id"') + b"\n"))
+                key = str(rows[start].space_id)
+                self.counts[key] = self.counts.get(key, 0) + end - start
+                start = end
+
+    def close_file(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+async def archive_partition(db: AsyncSession, name: str, month: datetime) -> int:
+    # one transaction: writes to the month wait on the lock while it's copied
+    # out, then it's detached and dropped. reads carry on the whole time
+    final = month_dir(month)
+    tmp = final + ".tmp"
+    await asyncio.to_thread(shutil.rmtree, tmp, True)
+    os.makedirs(tmp)
+    writer = MonthWriter(tmp)
+    try:
+        await db.execute(text(f"SET LOCAL lock_timeout = '{settings.ARCHIVE_LOCK_TIMEOUT}s'"))
+        await db.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        # keyset batches rather than a server side cursor, asyncpg keeps a cursor's
+        # portal open until the transaction ends and the DROP below would refuse
+        select_rows = f"SELECT id, content, user_id, space_id, created_at FROM {name}"
+        order = "ORDER BY space_id, created_at, id LIMIT :limit"
+        last = None
+        while True:
+            if last is None:
+                query, params = text(f"{select_rows} {order}"), {}
+            else:
+                query = text(f"{select_rows} WHERE (space_id, created_at, id) > (:space_id, :created_at, :id) {order}")
+                params = {"space_id": last.space_id, "created_at": last.created_at, "id": last.id}
+            rows = (await db.execute(query, {**params, "limit": settings.EXPORT_CHUNK})).all()
+            if rows:
+                await asyncio.to_thread(writer.write, rows)
+                last = rows[-1]
+            if len(rows) < settings.EXPORT_CHUNK:
+                break
+        writer.close_file()
+        manifest = {"from": month.isoformat(), "to": next_month(month).isoformat(), "spaces": writer.counts}
+        await asyncio.to_thread(write_manifest, tmp, manifest)
+        await asyncio.to_thread(shutil.rmtree, final, True)
+        os.replace(tmp, final)
+        await db.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        await db.execute(text(f"DROP TABLE {name}"))
+        await db.commit()
+    except BaseException:
+        writer.close_file()
+        await db.rollback()
+        # the rows are still in postgres, an archive copy would show them twice
+        await asyncio.to_thread(shutil.rmtree, tmp, True)
+        await asyncio.to_thread(shutil.rmtree, final, True)
+        raise
+    return sum(writer.counts.values())
+
+async def maintain(now: datetime | None = None) -> dict:
+    # creates next months' partitions and archives the ones past the cutoff
+    now = now or datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        if not is_partitioned(db):
+            return {"created": [], "archived": {}}
+        created = await ensure_partitions(db, now)
+        archived = {}
+        if settings.MESSAGES_ARCHIVE_AFTER_DAYS:
+            cutoff = now - timedelta(days=settings.MESSAGES_ARCHIVE_AFTER_DAYS)
+            for name, month in await list_partitions(db):
+                if next_month(month) <= cutoff:
+                    archived[name] = await archive_partition(db, name, month)
+                    logger.info("archived %s, %s messages", name, archived[name])
+    return {"created": created, "archived": archived}
+
+# month -> {space_id: count}, reloaded whenever the archive root's mtime moves
+# (a month is added, or drop_space touched it)
+catalog_cache = LocalCache(1, 60)
+# parsed space-months, the files never change once written
+month_cache = LocalCache(settings.ARCHIVE_CACHE_SIZE, 600)
+
+def catalog() -> dict[datetime, dict[int, int]]:
+    try:
+        stamp = os.stat(archive_root()).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = catalog_cache.get("months")
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    months = {}
+    for entry in sorted(os.listdir(archive_root())):
+        try:
+            with open(os.path.join(archive_root(), entry, "manifest.json")) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        months[datetime.fromisoformat(manifest["from"])] = {int(k): v for k, v in manifest["spaces"].items()}
+    catalog_cache.set("months", (stamp, months))
+    return months
+
+def space_months(space_id: int) -> list[datetime]:
+    # archived months that have messages for the space, oldest first
+    return sorted(month for month, spaces in catalog().items() if space_id in spaces)
+
+def has_space(space_id: int) -> bool:
+    return any(space_id in spaces for spaces in catalog().values())
+
+def read_raw(month: datetime, space_id: int) -> Iterator[bytes]:
+    try:
+        f = open(space_file(month, space_id), "rb")
+    except FileNotFoundError:
+        return
+    with f, zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True) as reader:
+        while chunk := reader.read(1 << 20):
+            yield chunk
+
+def load_month(month: datetime, space_id: int) -> list[ArchivedMessage]:
+    rows = month_cache.get((month, space_id))
+    if rows is None:
+        data = b"".join(read_raw(month, space_id)).rstrip(b"\n")
+        parsed = archived_adapter.validate_json(b"[" + data.replace(b"\n", b",") + b"]") if data else []
+        rows = [ArchivedMessage(m.id, m.content, m.user_id, space_id, m.created_at) for m in parsed] # type: ignore
+        month_cache.set((month, space_id), rows)
+    return rows
+
+def older(space_id: int, before: tuple[datetime, int] | None, limit: int) -> list[ArchivedMessage]:
+    # up to `limit` messages older than `before`, newest first
+    found: list[ArchivedMessage] = []
+    for month in reversed(space_months(space_id)):
+        if before is not None and month >= before[0]:
+            continue
+        rows = load_month(month, space_id)
+        if before is not None:
+            rows = [row for row in rows if (row.created_at, row.id) < before]
+        found.extend(reversed(rows[-(limit - len(found)):]))
+        if len(found) >= limit:
+            break
+    return found
+
+def newer(space_id: int, after: tuple[datetime, int], limit: int) -> list[ArchivedMessage]:
+    # up to `limit` messages newer than `after`, oldest first
+    found: list[ArchivedMessage] = []
+    for month in space_months(space_id):
+        if next_month(month) <= after[0]:
+            continue
+        rows = [row for row in load_month(month, space_id) if (row.created_at, row.id) > after]
+        found.extend(rows[:limit - len(found)])
+        if len(found) >= limit:
+            break
+    return found
+
+def drop_space(space_id: int):
+    # a deleted space's history goes from the archive too
+    for month, spaces in catalog().items():
+        if space_id not in spaces:
+            continue
+        try:
+            os.remove(space_file(month, space_id))
+        except FileNotFoundError:
+            pass
+        manifest = {"from": month.isoformat(), "to": next_month(month).isoformat(),
+                    "spaces": {str(k): v for k, v in spaces.items() if k != space_id}}
+        write_manifest(month_dir(month), manifest)
+        month_cache.delete((month, space_id))
+    catalog_cache.clear()
+    # rewriting a manifest only changes its month's dir, bump the root so every
+    # other worker's catalog reloads instead of serving the space until its ttl
+    try:
+        stamp = os.stat(archive_root()).st_mtime_ns
+    except FileNotFoundError:
+        return
+    # at least a ns later, file times are coarser than a catalog load
+    now = max(time.time_ns(), stamp + 1)
+    os.utime(archive_root(), ns=(now, now))
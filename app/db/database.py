@@ -1,8 +1,75 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core import metrics
 
-engine = create_engine(settings.DATABASE_URL)
+# async drivers for the sync urls we already use in .env
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver configured for {backend}, set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+# name -> engine, for the pool gauges on /metrics
+engines: dict = {}
+
+def timed_pool(base: type[QueuePool], name: str) -> type[QueuePool]:
+    # times how long a request waits to get a connection out of the pool
+    class TimedPool(base): # type: ignore
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                metrics.observe("db_pool_checkout_wait_seconds", time.perf_counter() - start, pool=name)
+    return TimedPool
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def make_engine(url: str, name: str, is_async: bool):
+    options = {}
+    # sqlite (benchmarks) keeps the default pool, the knobs below are for postgres
+    if make_url(url).get_backend_name() != "sqlite":
+        options = dict(
+            poolclass=timed_pool(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    engine = create_async_engine(url, **options) if is_async else create_engine(url, **options)
+    if make_url(url).get_backend_name() == "sqlite":
+        # sqlite ignores foreign keys (and so ON DELETE CASCADE) unless asked
+        sync_engine = engine.sync_engine if is_async else engine # type: ignore
+        event.listen(sync_engine, "connect", enable_sqlite_foreign_keys)
+    engines[name] = engine
+    return engine
+
+# sync engine is still used by alembic, scripts and the old sync benchmarks
+engine = make_engine(settings.DATABASE_URL, "sync", is_async=False)
+async_engine = make_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL),
+                           "primary", is_async=True)
+
+# read only routes go to the replica when there is one, otherwise it's just the primary
+if settings.READ_REPLICA_URL:
+    read_engine = make_engine(settings.ASYNC_READ_REPLICA_URL or async_database_url(settings.READ_REPLICA_URL),
+                              "replica", is_async=True)
+else:
+    read_engine = async_engine
 
 Base = declarative_base()
 
@@ -12,9 +79,54 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
-def get_db():
+# expire_on_commit=False so routes can still read the object after commit
+# without a lazy load (those don't work on an async session)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# for routes that never write, can lag the primary slightly when a replica is set
+async def get_read_db():
+    async with ReadSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def pool_metrics() -> list[str]:
+    lines = [
+        "# HELP db_pool_checked_out Connections currently checked out",
+        "# TYPE db_pool_checked_out gauge",
+    ]
+    saturation = [
+        "# HELP db_pool_saturation Checked out connections over pool_size + max_overflow",
+        "# TYPE db_pool_saturation gauge",
+    ]
+    for name, db_engine in engines.items():
+        # read through the engine, dispose() swaps in a fresh pool
+        pool = db_engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        checked_out = pool.checkedout()
+        capacity = pool.size() + max(settings.DB_MAX_OVERFLOW, 0)
+        lines.append(f'db_pool_checked_out{{pool="{name}"}} {checked_out}')
+        saturation.append(f'db_pool_saturation{{pool="{name}"}} {checked_out / capacity if capacity else 0}')
+    return lines + saturation
+
+metrics.collectors.append(pool_metrics)
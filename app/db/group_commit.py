@@ -0,0 +1,78 @@
+import asyncio
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from app.core import metrics
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import Message
+
+# one transaction per chat message means one fsync per message. with group
+# commit on, concurrent inserts in a worker wait for a short window (or until
+# the batch fills), go out as one multi-row INSERT ... RETURNING in one
+# transaction, and every caller gets its own row back. a failed batch is
+# retried row by row when a constraint failed, so one bad insert (a space
+# deleted mid window) only fails its own request
+
+class GroupCommitter:
+    def __init__(self, model, columns, window_ms: float, max_batch: int):
+        self.model = model
+        self.columns = columns
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.pending: list[tuple[dict, asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.writes: set[asyncio.Task] = set()
+
+    async def add(self, values: dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((values, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self.write(batch))
+            self.writes.add(task)
+            task.add_done_callback(self.writes.discard)
+
+    async def write(self, batch: list[tuple[dict, asyncio.Future]]):
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    insert(self.model).returning(*self.columns, sort_by_parameter_order=True),
+                    [values for values, _ in batch],
+                )).all()
+                await db.commit()
+        except Exception as e:
+            if isinstance(e, IntegrityError) and len(batch) > 1:
+                await asyncio.gather(*(self.write([item]) for item in batch))
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        metrics.observe("group_commit_batch_size", len(rows))
+        # a caller that went away (client disconnect) has a cancelled future, its row still went in
+        for (_, future), row in zip(batch, rows):
+            if not future.done():
+                future.set_result(row)
+
+    async def close(self):
+        self.flush()
+        if self.writes:
+            await asyncio.gather(*self.writes, return_exceptions=True)
+
+message_writer = GroupCommitter(
+    Message,
+    (Message.id, Message.content, Message.user_id, Message.space_id, Message.created_at),
+    settings.MESSAGES_GROUP_WINDOW_MS,
+    settings.MESSAGES_GROUP_MAX,
+)
@@ -1,6 +1,6 @@
 from app.db.database import Base
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, func
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, DateTime, Text, Index, false, func
 from typing import Optional
 
 class User(Base):
@@ -10,6 +10,8 @@ class User(Base):
     email = Column(String, nullable=False, unique=True, index=True)
     password_hash = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # bumped to revoke every token issued before it
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     messages = relationship("Message", back_populates="user")
     memberships = relationship("SpaceMembership", back_populates="user")
@@ -21,9 +23,12 @@ class Space(Base):
     description = Column(Text)
     owner_id = Column(Integer, ForeignKey("users.id"))
     password_hash: Optional[str] = Column(String, nullable=True) # type: ignore
+    # set while a big space's messages are purged in the background, see app/db/purge.py
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
-    messages = relationship("Message", back_populates="space")
-    memberships = relationship("SpaceMembership", back_populates="space")
+    # the database cascades these, passive_deletes stops the ORM loading them first
+    messages = relationship("Message", back_populates="space", passive_deletes=True)
+    memberships = relationship("SpaceMembership", back_populates="space", passive_deletes=True)
     
     @property
     def requires_password(self) -> bool:
@@ -32,8 +37,10 @@ class Space(Base):
 class SpaceMembership(Base):
     __tablename__ = "space_membership"
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
-    space_id = Column(Integer, ForeignKey("spaces.id"), primary_key=True)
+    space_id = Column(Integer, ForeignKey("spaces.id", ondelete="CASCADE"), primary_key=True)
     join_at = Column(DateTime(timezone=True), server_default=func.now())
+    # newest message this member has seen, unread counts start after it
+    last_read_message_id = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="memberships")
     space = relationship("Space", back_populates="memberships")
@@ -42,9 +49,59 @@ class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True)
     content = Column(Text(200), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # the partition key on postgres, where the primary key is really (id, created_at)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
-    space_id = Column(Integer, ForeignKey("spaces.id"))
+    space_id = Column(Integer, ForeignKey("spaces.id", ondelete="CASCADE"))
 
     user = relationship("User", back_populates="messages")
-    space = relationship("Space", back_populates="messages")
\ No newline at end of file
+    space = relationship("Space", back_populates="messages")
+
+    # keyset paging walks (space_id, created_at, id) so history reads stay index-only
+    __table_args__ = (
+        Index("ix_messages_space_created_id", "space_id", "created_at", "id"),
+    )
+
+class SpaceSummary(Base):
+    __tablename__ = "space_summaries"
+    space_id = Column(Integer, ForeignKey("spaces.id", ondelete="CASCADE"), primary_key=True)
+    # rendered digest, served as is so reads never touch the messages
+    content = Column(Text, nullable=False, default="")
+    # summariser specific state the next refresh folds new messages into
+    state = Column(Text, nullable=False, default="{}")
+    summariser = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    message_count = Column(Integer, nullable=False, default=0)
+    # high-water mark, the last (created_at, id) folded into the digest
+    last_created_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_id = Column(Integer, nullable=True)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class KnowledgeEntry(Base):
+    __tablename__ = "knowledge_entries"
+    id = Column(Integer, primary_key=True)
+    space_id = Column(Integer, ForeignKey("spaces.id", ondelete="CASCADE"), nullable=False, index=True)
+    author_id = Column(Integer, ForeignKey("users.id"))
+    # document, faq or decision
+    kind = Column(String, nullable=False, default="document")
+    title = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class KnowledgeChunk(Base):
+    __tablename__ = "knowledge_chunks"
+    id = Column(Integer, primary_key=True)
+    space_id = Column(Integer, ForeignKey("spaces.id", ondelete="CASCADE"), nullable=False)
+    # null once the entry is gone, the row stays until the index has dropped it
+    entry_id = Column(Integer, ForeignKey("knowledge_entries.id", ondelete="SET NULL"), nullable=True)
+    position = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    # the vector index works through these, see app/core/knowledge.py
+    indexed = Column(Boolean, nullable=False, default=False, server_default=false())
+    removed = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    __table_args__ = (
+        Index("ix_knowledge_chunks_entry", "entry_id"),
+        Index("ix_knowledge_chunks_pending", "space_id", "indexed", "removed"),
+    )
@@ -0,0 +1,86 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+
+logger = logging.getLogger("app.partitions")
+
+# on postgres messages is range partitioned on created_at, one partition per
+# month named messages_pYYYYMM (migration 0009), plus messages_default for
+# anything no month covers. the maintenance job keeps a few months ahead of
+# now so inserts never land in the default (if some do anyway, they're moved
+# when their month is created), and old months get archived
+# (app/db/archive.py). other databases keep the plain table and skip all this
+
+PARTITION = re.compile(r"^messages_p(\d{4})(\d{2})$")
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+def next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+def partition_name(month: datetime) -> str:
+    return f"messages_p{month:%Y%m}"
+
+def partition_month(name: str) -> datetime | None:
+    match = PARTITION.match(name)
+    return datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc) if match else None
+
+def is_partitioned(db: AsyncSession) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
+async def list_partitions(db: AsyncSession) -> list[tuple[str, datetime]]:
+    # monthly partitions, oldest first
+    names = (await db.scalars(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = 'messages'"
+    ))).all()
+    months = [(name, partition_month(name)) for name in names]
+    return sorted((name, month) for name, month in months if month is not None)
+
+async def create_partition(db: AsyncSession, name: str, month: datetime) -> int:
+    # one transaction: rows for the month that landed in the default partition
+    # (the job was down, or someone wrote far into the future) move into the new
+    # table, then it's attached. CREATE ... PARTITION OF would just fail on them.
+    # attaching only needs a weak lock on messages, the default is locked while
+    # it's checked. returns how many rows moved
+    start, end = month.isoformat(), next_month(month).isoformat()
+    await db.execute(text(f"SET LOCAL lock_timeout = '{settings.ARCHIVE_LOCK_TIMEOUT}s'"))
+    # no new rows for the month can slip into the default between the move and the attach
+    await db.execute(text("LOCK TABLE messages_default IN SHARE ROW EXCLUSIVE MODE"))
+    await db.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    moved = await db.execute(text(
+        f"WITH moved AS (DELETE FROM messages_default WHERE created_at >= '{start}' AND created_at < '{end}' "
+        f"RETURNING id, content, created_at, user_id, space_id) "
+        f"INSERT INTO {name} (id, content, created_at, user_id, space_id) SELECT * FROM moved"
+    ))
+    await db.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    await db.commit()
+    return moved.rowcount # type: ignore
+
+async def ensure_partitions(db: AsyncSession, now: datetime | None = None) -> list[str]:
+    # this month and MESSAGES_PARTITIONS_AHEAD after it, returns the ones it created
+    if not is_partitioned(db):
+        return []
+    existing = {name for name, _ in await list_partitions(db)}
+    created = []
+    month = month_start(now or datetime.now(timezone.utc))
+    for _ in range(settings.MESSAGES_PARTITIONS_AHEAD + 1):
+        name = partition_name(month)
+        if name not in existing:
+            try:
+                moved = await create_partition(db, name, month)
+                created.append(name)
+                if moved:
+                    logger.info("moved %s messages out of messages_default into %s", moved, name)
+            except Exception:
+                # most likely the lock timeout, the next run tries again
+                await db.rollback()
+                logger.exception("could not create partition %s", name)
+        month = next_month(month)
+    return created
@@ -0,0 +1,48 @@
+import asyncio
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import Message, Space, SpaceMembership
+from app.core.jobs import enqueue
+from app.db.archive import drop_space, has_space
+
+async def remove_space(db: AsyncSession, space: Space) -> bool:
+    # runs inside the caller's transaction. small spaces go in one statement and
+    # the foreign keys cascade to messages and memberships. big ones get
+    # tombstoned and their messages purged in batches afterwards, returns True then.
+    # so do spaces with archived history, the purge job clears the archive files
+    sample = select(Message.id).where(Message.space_id == space.id).limit(settings.SPACE_PURGE_THRESHOLD + 1)
+    message_count = await db.scalar(select(func.count()).select_from(sample.subquery()))
+    if message_count > settings.SPACE_PURGE_THRESHOLD or await asyncio.to_thread(has_space, space.id): # type: ignore
+        space.deleted_at = func.now() # type: ignore
+        await db.execute(delete(SpaceMembership).where(SpaceMembership.space_id == space.id))
+        return True
+    await db.execute(delete(Space).where(Space.id == space.id))
+    return False
+
+async def purge_space(space_id: int):
+    # every batch is its own short transaction, so locks and wal stay small
+    while True:
+        async with AsyncSessionLocal() as db:
+            batch = select(Message.id).where(Message.space_id == space_id).limit(settings.SPACE_PURGE_BATCH)
+            result = await db.execute(delete(Message).where(Message.id.in_(batch)))
+            await db.commit()
+        if result.rowcount < settings.SPACE_PURGE_BATCH: # type: ignore
+            break
+        await asyncio.sleep(0)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Space).where(Space.id == space_id, Space.deleted_at.is_not(None)))
+        await db.commit()
+    await asyncio.to_thread(drop_space, space_id)
+
+async def schedule_purge(space_id: int, owner_id: int | None = None) -> str:
+    # runs on the job worker, keyed so the same space is only ever queued once
+    return await enqueue("purge_space", {"space_id": space_id}, key=f"purge_space:{space_id}", owner_id=owner_id)
+
+async def resume_purges():
+    # picks up tombstoned spaces whose purge job got lost (redis flushed etc)
+    async with AsyncSessionLocal() as db:
+        space_ids = (await db.scalars(select(Space.id).where(Space.deleted_at.is_not(None)))).all()
+    for space_id in space_ids:
+        await schedule_purge(space_id)
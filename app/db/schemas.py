@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, StringConstraints, ConfigDict
-from typing import Annotated, Optional, Text
-from datetime import datetime
+from typing import Annotated, Any, Literal, Optional, Text
+from datetime import date, datetime
 
 class UserBase(BaseModel):
     name: str
@@ -18,6 +18,10 @@ class UserResponse(UserBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+# what the user cache holds, token_version never goes out in a response
+class CurrentUser(UserResponse):
+    token_version: int = 0
+
 class UpdateUser(BaseModel):
     name: Optional[str] = None
     email: Optional[str] = None
@@ -26,8 +30,17 @@ class UpdateUser(BaseModel):
 
 class TokenResponse(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None
     token_type: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+    # log out every session of this user, not just this one
+    everywhere: bool = False
+
 class SpaceBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -48,6 +61,18 @@ class SpaceResponse(SpaceBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class MySpaceResponse(SpaceResponse):
+    last_read_message_id: Optional[int] = None
+    unread: int
+
+class MarkReadRequest(BaseModel):
+    # defaults to the newest message in the space
+    message_id: Optional[int] = None
+
+class MarkReadResponse(BaseModel):
+    space_id: int
+    last_read_message_id: Optional[int] = None
+
 class SpaceJoinRequest(BaseModel):
     password: Optional[str] = None
 
@@ -58,10 +83,92 @@ class SpaceJoinResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class SpaceSummaryResponse(BaseModel):
+    space_id: int
+    content: str
+    # bumped on every refresh that folded in new messages
+    version: int
+    message_count: int
+    refreshed_at: Optional[datetime] = None
+    # set when this read queued a refresh, poll it on /jobs/{id}
+    refresh_job_id: Optional[str] = None
+
+class KnowledgeCreate(BaseModel):
+    kind: Literal["document", "faq", "decision"] = "document"
+    title: Annotated[str, StringConstraints(min_length=1, max_length=200)]
+    content: Annotated[str, StringConstraints(min_length=1, max_length=100_000)]
+
+class KnowledgeUpdate(BaseModel):
+    kind: Optional[Literal["document", "faq", "decision"]] = None
+    title: Optional[Annotated[str, StringConstraints(min_length=1, max_length=200)]] = None
+    content: Optional[Annotated[str, StringConstraints(min_length=1, max_length=100_000)]] = None
+
+class KnowledgeResponse(BaseModel):
+    id: int
+    space_id: int
+    author_id: Optional[int] = None
+    kind: str
+    title: str
+    content: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class AskHit(BaseModel):
+    chunk_id: int
+    entry_id: int
+    title: str
+    kind: str
+    # which chunk of the entry this is, 0 is the start
+    position: int
+    content: str
+    score: float
+
+class AskResponse(BaseModel):
+    query: str
+    hits: list[AskHit]
+    # set while the space's index is being built, poll it on /jobs/{id}
+    index_job_id: Optional[str] = None
+
+class ImportResponse(BaseModel):
+    space_id: int
+    imported: int
+
+class HeartbeatResponse(BaseModel):
+    space_id: int
+    # seconds until the next heartbeat is worth sending
+    next_heartbeat: int
+
+class OnlineMember(BaseModel):
+    id: int
+    last_seen: datetime
+
+class OnlineResponse(BaseModel):
+    space_id: int
+    online: int
+    # most recently seen first, names are on /spaces/{space_id}/members
+    members: list[OnlineMember]
+
+class DailyActive(BaseModel):
+    day: date
+    active: int
+
+class ActivityResponse(BaseModel):
+    space_id: int
+    daily: list[DailyActive]
+    # distinct users over all of `daily`, not the sum
+    period_active: int
+    month: str
+    monthly_active: int
+
 class CreateMessage(BaseModel):
     content: str
     space_id: int
 
+class CreateMessageBatch(BaseModel):
+    messages: list[CreateMessage]
+
 class MessageResponse(BaseModel):
     id: int
     content: str
@@ -71,6 +178,20 @@ class MessageResponse(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+class MessagePage(BaseModel):
+    items: list[MessageResponse]
+    # pass these back as ?before= / ?after= to keep paging
+    before: Optional[str] = None
+    after: Optional[str] = None
+
+class SearchHit(MessageResponse):
+    rank: float
+
+class SearchPage(BaseModel):
+    items: list[SearchHit]
+    # pass back as ?cursor= for the next page
+    next: Optional[str] = None
+
 class MessgeEditResponse(BaseModel):
     id: int
     content: str
@@ -82,4 +203,13 @@ class MessgeEditResponse(BaseModel):
 class UpdateMessage(BaseModel):
     content: str
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class JobResponse(BaseModel):
+    id: str
+    name: str
+    # queued, running, retrying, done or failed
+    status: str
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
@@ -0,0 +1,153 @@
+import asyncio
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import ReadSessionLocal
+from app.db.models import Message, SpaceMembership
+
+# space export/import as NDJSON, one message per line. both directions work a
+# chunk at a time so memory stays flat no matter how big the space is
+
+class ExportedMessage(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    content: str
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ImportedMessage(BaseModel):
+    # ids from the export are dropped, the target database hands out new ones
+    user_id: Optional[int] = None
+    content: str = Field(max_length=200)
+    created_at: Optional[datetime] = None
+
+exported_adapter = TypeAdapter(list[ExportedMessage])
+
+async def export_lines(space_id: int) -> AsyncIterator[bytes]:
+    # archived months first, their files already hold exactly these lines
+    from app.db import archive # it builds on this module
+    # file reads and zstd run on a thread, a chunk at a time, so the loop keeps serving
+    for month in await asyncio.to_thread(archive.space_months, space_id):
+        reader = archive.read_raw(month, space_id)
+        try:
+            while (chunk := await asyncio.to_thread(next, reader, None)) is not None:
+                yield chunk
+        finally:
+            # a client that hangs up mid file shouldn't leave it open
+            await asyncio.to_thread(reader.close)
+    # own session, the response outlives the request's dependencies. yield_per
+    # makes it a server side cursor on postgres instead of fetching everything
+    async with ReadSessionLocal() as db:
+        result = await db.stream(
+            select(Message.id, Message.user_id, Message.content, Message.created_at)
+            .where(Message.space_id == space_id)
+            .order_by(Message.id)
+            .execution_options(yield_per=settings.EXPORT_CHUNK)
+        )
+        async for rows in result.partitions():
+            messages = exported_adapter.dump_json(exported_adapter.validate_python(rows, from_attributes=True))
+            # a json array of objects -> one object per line, without parsing it again
+            yield messages[1:-1].replace(b'},{"id"', b'}\n{"id"') + b"\n"
+
+async def gzip_lines(lines: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in lines:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+class ImportFailed(ValueError):
+    def __init__(self, line: int, message: str, imported: int):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.imported = imported
+
+def inflate(decompressor, data: bytes):
+    # at most IMPORT_MAX_LINE bytes out per step, a tiny gzip body can expand
+    # to gigabytes and decompress() would hand all of it back at once
+    while True:
+        piece = decompressor.decompress(data, settings.IMPORT_MAX_LINE)
+        data = decompressor.unconsumed_tail
+        if piece:
+            yield piece
+        if not data and len(piece) < settings.IMPORT_MAX_LINE:
+            return
+
+async def read_lines(body: AsyncIterator[bytes], compressed: bool) -> AsyncIterator[bytes]:
+    # splits the upload into lines as it arrives, never holding more than one
+    # chunk (or one bounded step of a compressed one)
+    decompressor = zlib.decompressobj(47) if compressed else None
+    pending = b""
+    async for chunk in body:
+        for piece in (inflate(decompressor, chunk) if decompressor is not None else [chunk]):
+            pending += piece
+            *lines, pending = pending.split(b"\n")
+            if len(pending) > settings.IMPORT_MAX_LINE:
+                raise ValueError(f"line longer than {settings.IMPORT_MAX_LINE} bytes")
+            for line in lines:
+                yield line
+    if decompressor is not None:
+        pending += decompressor.flush()
+    if pending:
+        yield pending
+
+async def insert_chunk(db: AsyncSession, space_id: int, default_user_id: int, chunk: list[ImportedMessage]):
+    # the importer owns the space (the route checks). an author from the file is
+    # only kept if they're a member of it, otherwise anyone could post as anyone
+    # by writing their id into a file. the rest go in as the importer
+    wanted = {m.user_id for m in chunk if m.user_id is not None}
+    members = set((await db.scalars(
+        select(SpaceMembership.user_id)
+        .where(SpaceMembership.space_id == space_id, SpaceMembership.user_id.in_(wanted))
+    )).all()) if wanted else set()
+    rows = [
+        {
+            "space_id": space_id,
+            "user_id": m.user_id if m.user_id in members else default_user_id,
+            "content": m.content,
+            "created_at": m.created_at or datetime.now(timezone.utc),
+        }
+        for m in chunk
+    ]
+    connection = await db.connection()
+    if connection.dialect.driver == "asyncpg":
+        # COPY is several times faster than any INSERT for bulk loads
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table( # type: ignore
+            Message.__tablename__,
+            columns=["space_id", "user_id", "content", "created_at"],
+            records=[(r["space_id"], r["user_id"], r["content"], r["created_at"]) for r in rows],
+        )
+    else:
+        await db.execute(insert(Message), rows)
+    await db.commit()
+
+async def import_lines(db: AsyncSession, space_id: int, user_id: int, lines: AsyncIterator[bytes]) -> int:
+    # every chunk is its own transaction, on a bad line the chunks before it stay in
+    imported = 0
+    chunk: list[ImportedMessage] = []
+    line_number = 0
+    try:
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            chunk.append(ImportedMessage.model_validate_json(line))
+            if len(chunk) >= settings.IMPORT_CHUNK:
+                await insert_chunk(db, space_id, user_id, chunk)
+                imported += len(chunk)
+                chunk = []
+    except ValidationError as e:
+        raise ImportFailed(line_number, e.errors()[0]["msg"], imported)
+    except (ValueError, zlib.error) as e:
+        raise ImportFailed(line_number, str(e), imported)
+    if chunk:
+        await insert_chunk(db, space_id, user_id, chunk)
+        imported += len(chunk)
+    return imported
@@ -1,33 +1,133 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.db.database import engine, Base
-from app.routers import auth, users, spaces, messages
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from app.routers.messages import limiter
-
-app = FastAPI()
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler) # type: ignore
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],  # allow GET, POST, PUT, DELETE, OPTIONS, etc.
-    allow_headers=["*"],  # allow Content-Type, Authorization, etc.
-)
-
-Base.metadata.create_all(bind=engine)
-
-app.include_router(auth.router)
-app.include_router(users.router)
-app.include_router(spaces.router)
-app.include_router(messages.router)
+
+logger = logging.getLogger("app.startup")
+
+# importing this module is free, everything heavy (engines, redis clients,
+# routers) is pulled in by create_app(). the schema is alembic's job now,
+# run `alembic upgrade head` before starting workers
+
+async def warm_database():
+    from sqlalchemy import text
+    from app.core.config import settings
+    from app.db.database import async_engine, read_engine
+
+    async def connect(engine):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # a couple of pooled connections per engine so the first requests don't pay for the handshake
+    engines = {id(async_engine): async_engine, id(read_engine): read_engine}.values()
+    await asyncio.gather(*(connect(engine) for engine in engines
+                           for _ in range(min(settings.STARTUP_WARM_CONNECTIONS, settings.DB_POOL_SIZE))))
+
+async def warm_redis():
+    from app.core.redis_client import ard
+    await ard.ping()
+
+async def warm_up():
+    from app.core.config import settings
+    # concurrently, and never for longer than the timeout. a slow database makes
+    # the first requests slow instead of holding the whole deploy back
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(warm_database(), warm_redis(), return_exceptions=True),
+            settings.STARTUP_WARM_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        logger.warning("warm up took longer than %ss, starting anyway", settings.STARTUP_WARM_TIMEOUT)
+        return
+    for name, result in zip(("database", "redis"), results):
+        if isinstance(result, Exception):
+            logger.warning("could not warm up %s: %r", name, result)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.core.config import settings
+    from app.core.realtime import hub
+    from app.core.cache import listen_invalidations
+    from app.core.revocation import listen_revocations
+    from app.core.presence import presence
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    from app.db.database import engines
+
+    listeners = [
+        asyncio.create_task(listen_invalidations()),
+        asyncio.create_task(listen_revocations()),
+        asyncio.create_task(presence.run()),
+    ]
+    stop_worker = asyncio.Event()
+    if settings.JOBS_IN_PROCESS:
+        from app.worker import run_worker
+        listeners.append(asyncio.create_task(
+            run_worker(settings.JOB_CONCURRENCY, settings.JOB_PROCESSES, stop_worker)))
+    await warm_up()
+    yield
+    stop_worker.set()
+    for task in listeners:
+        task.cancel()
+    if settings.MESSAGES_GROUP_COMMIT:
+        from app.db.group_commit import message_writer
+        await message_writer.close()
+    await presence.close()
+    await hub.close()
+    for db_engine in engines.values():
+        if isinstance(db_engine, AsyncEngine):
+            await db_engine.dispose()
+        else:
+            db_engine.dispose()
+
+def create_app() -> FastAPI:
+    from app.core.config import settings
+    from app.core import metrics
+    from app.core.redis_client import rd, ard
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    from app.db.database import engines
+    from app.routers import auth, users, spaces, messages, jobs, knowledge
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],  # allow GET, POST, PUT, DELETE, OPTIONS, etc.
+        allow_headers=["*"],  # allow Content-Type, Authorization, etc.
+    )
+
+    if settings.METRICS_ENABLED:
+        # every engine, the replica included. events live on the sync side of an async engine
+        for db_engine in engines.values():
+            metrics.instrument_engine(db_engine.sync_engine if isinstance(db_engine, AsyncEngine) else db_engine)
+        metrics.instrument_redis(rd, is_async=False)
+        metrics.instrument_redis(ard, is_async=True)
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.add_route("/metrics", metrics.metrics_endpoint, include_in_schema=False)
+
+    app.include_router(auth.router)
+    app.include_router(users.router)
+    app.include_router(spaces.router)
+    app.include_router(messages.router)
+    app.include_router(jobs.router)
+    app.include_router(knowledge.router)
+    return app
+
+_app: FastAPI | None = None
+
+def __getattr__(name: str):
+    # keeps `uvicorn app.main:app` working, the app is only built when asked for
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # future reference to test my thing
 # import time
 # start = time.perf_counter()
 # elapsed_ms = (time.perf_counter() - start) * 1000
-# print(f"Endpoint took: {elapsed_ms:.2f} ms")
\ No newline at end of file
+# print(f"Endpoint took: {elapsed_ms:.2f} ms")
@@ -1,50 +1,92 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from app.db.database import get_db
-from sqlalchemy.orm import Session
-from app.core.security import hash_password, verify_password, create_access_token
-from app.db.schemas import UserCreate, UserLogin, UserResponse, TokenResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from jose import JWTError
+from app.core.security import (hash_password_async, verify_password_async, create_token_pair,
+                               decode_token, get_current_user, get_cached_user, invalidate_user)
+from app.core.revocation import revoke_token
+from app.core.ratelimit import rate_limit, by_ip
+from app.db.schemas import (UserCreate, UserLogin, UserResponse, TokenResponse, CurrentUser,
+                            RefreshRequest, LogoutRequest)
 from app.db.models import User
-from datetime import timedelta
-from slowapi import Limiter
-from app.core.config import settings
-from slowapi.util import get_remote_address
 
 router = APIRouter(prefix="/auth", tags=['auth'])
 
-limiter = Limiter(key_func=get_remote_address,
-                  storage_uri=settings.REDIS_URL
-                  )
-
 @router.post("/register", response_model=UserResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    exisiting_email = db.query(User).filter(User.email == user_data.email).first()
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+    exisiting_email = await db.scalar(select(User).where(User.email == user_data.email))
     if exisiting_email:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await hash_password_async(user_data.password)
     user = User(name=user_data.name, email=user_data.email, password_hash=hashed_pw)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 # learn this
-@router.post("/login", response_model=TokenResponse)
-@limiter.limit("3/minute", per_method=True)
-def login(user_data: UserLogin, request: Request, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == user_data.email).first()
+@router.post("/login", response_model=TokenResponse, dependencies=[Depends(rate_limit("auth.login", by_ip))])
+async def login(user_data: UserLogin, request: Request, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == user_data.email))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
     
-    if not verify_password(user_data.password, user.password_hash): # type: ignore
+    if not await verify_password_async(user_data.password, user.password_hash): # type: ignore
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
     
-    access_token_expires = timedelta(minutes=60)
-    access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
-    refresh_token_expires = timedelta(minutes=60)
-    refresh_token = create_access_token(
-        data={"sub": str(user.id), "type": "refresh"}, expires_delta=refresh_token_expires
-    )
-    return {"access_token": access_token, "refresh_token": refresh_token,  "token_type": "bearer"}
\ No newline at end of file
+    return create_token_pair(user.id, user.token_version) # type: ignore
+
+async def bump_token_version(user_id: int, db: AsyncSession):
+    # every token issued before this carries an older ver and stops working
+    await db.execute(update(User).where(User.id == user_id).values(token_version=User.token_version + 1))
+    await db.commit()
+    await invalidate_user(user_id)
+
+@router.post("/refresh", response_model=TokenResponse, dependencies=[Depends(rate_limit("auth.refresh", by_ip))])
+async def refresh(data: RefreshRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    invalid_token = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    try:
+        payload = decode_token(data.refresh_token)
+    except JWTError:
+        raise invalid_token
+    if payload.get("type") != "refresh" or not payload.get("jti") or not payload.get("sub"):
+        raise invalid_token
+
+    user = await get_cached_user(str(payload["sub"]), db)
+    if user is None or payload.get("ver", 0) != user.token_version:
+        raise invalid_token
+
+    # rotation: the old refresh token is spent the moment it's used
+    if not await revoke_token(payload["jti"], payload["exp"]):
+        # someone already used this one, assume it leaked and end every session
+        await bump_token_version(user.id, db)
+        raise invalid_token
+
+    return create_token_pair(user.id, user.token_version)
+
+@router.post("/logout")
+async def logout(request: Request,
+                 data: LogoutRequest | None = None,
+                 current_user: CurrentUser = Depends(get_current_user),
+                 db: AsyncSession = Depends(get_db)
+                 ):
+    claims = request.state.token_claims
+    if claims.get("jti"):
+        await revoke_token(claims["jti"], claims["exp"])
+
+    if data is not None and data.refresh_token:
+        try:
+            payload = decode_token(data.refresh_token)
+        except JWTError:
+            payload = {}
+        if payload.get("type") == "refresh" and payload.get("sub") == str(current_user.id) and payload.get("jti"):
+            await revoke_token(payload["jti"], payload["exp"])
+
+    if data is not None and data.everywhere:
+        await bump_token_version(current_user.id, db)
+
+    return{
+        "logout": "complete"
+    }
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import database, schemas
+from app.core.security import get_current_user
+from app.core.jobs import get_job
+from app.core.membership import is_member
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.get("/{job_id}", response_model=schemas.JobResponse)
+async def get_job_status(job_id: str,
+                         current_user: schemas.UserResponse = Depends(get_current_user),
+                         db: AsyncSession = Depends(database.get_db)
+                         ):
+    job = await get_job(job_id)
+    # someone else's job looks the same as a missing one, a space's jobs belong to its members
+    if job is None or not (job["owner_id"] == current_user.id
+                           or job["space_id"] is not None and await is_member(current_user.id, job["space_id"], db)):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
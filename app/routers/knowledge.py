@@ -0,0 +1,105 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import schemas, database
+from app.db.models import KnowledgeEntry, Space
+from app.core.config import settings
+from app.core.membership import require_membership
+from app.core.knowledge import ask, chunks_for, retire_chunks, schedule_index
+
+router = APIRouter(prefix="/spaces", tags=["knowledge"])
+
+async def editable_entry(db: AsyncSession, space_id: int, entry_id: int, user_id: int) -> KnowledgeEntry:
+    # the author or the space's owner
+    entry = await db.scalar(select(KnowledgeEntry).where(KnowledgeEntry.id == entry_id,
+                                                         KnowledgeEntry.space_id == space_id))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    if entry.author_id != user_id and await db.scalar(select(Space.owner_id).where(Space.id == space_id)) != user_id:
+        raise HTTPException(status_code=403, detail="Only the author or the space owner can change this entry")
+    return entry
+
+@router.post("/{space_id}/knowledge", response_model=schemas.KnowledgeResponse)
+async def create_entry(space_id: int,
+                       entry_data: schemas.KnowledgeCreate,
+                       current_user: schemas.UserResponse = Depends(require_membership),
+                       db: AsyncSession = Depends(database.get_db)
+                       ):
+    entry = KnowledgeEntry(space_id=space_id, author_id=current_user.id, **entry_data.model_dump())
+    db.add(entry)
+    await db.flush()
+    db.add_all(chunks_for(entry))
+    await db.commit()
+    await db.refresh(entry)
+    # searchable once the index job has embedded it
+    await schedule_index(space_id)
+    return entry
+
+@router.get("/{space_id}/knowledge", response_model=list[schemas.KnowledgeResponse])
+async def list_entries(space_id: int,
+                       before: int | None = None,
+                       limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_MAX),
+                       current_user: schemas.UserResponse = Depends(require_membership),
+                       db: AsyncSession = Depends(database.get_read_db)
+                       ):
+    # newest first, pass the last id you got as `before` for the next page
+    query = select(KnowledgeEntry).where(KnowledgeEntry.space_id == space_id)
+    if before is not None:
+        query = query.where(KnowledgeEntry.id < before)
+    return (await db.scalars(query.order_by(KnowledgeEntry.id.desc()).limit(limit))).all()
+
+@router.get("/{space_id}/knowledge/{entry_id}", response_model=schemas.KnowledgeResponse)
+async def get_entry(space_id: int,
+                    entry_id: int,
+                    current_user: schemas.UserResponse = Depends(require_membership),
+                    db: AsyncSession = Depends(database.get_read_db)
+                    ):
+    entry = await db.scalar(select(KnowledgeEntry).where(KnowledgeEntry.id == entry_id,
+                                                         KnowledgeEntry.space_id == space_id))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    return entry
+
+@router.put("/{space_id}/knowledge/{entry_id}", response_model=schemas.KnowledgeResponse)
+async def update_entry(space_id: int,
+                       entry_id: int,
+                       entry_data: schemas.KnowledgeUpdate,
+                       current_user: schemas.UserResponse = Depends(require_membership),
+                       db: AsyncSession = Depends(database.get_db)
+                       ):
+    entry = await editable_entry(db, space_id, entry_id, current_user.id)
+    changes = entry_data.model_dump(exclude_none=True)
+    for field, value in changes.items():
+        setattr(entry, field, value)
+    if "title" in changes or "content" in changes:
+        # the old chunks leave the index, a fresh set goes in
+        await retire_chunks(db, entry.id) # type: ignore
+        db.add_all(chunks_for(entry))
+    await db.commit()
+    await db.refresh(entry)
+    await schedule_index(space_id)
+    return entry
+
+@router.delete("/{space_id}/knowledge/{entry_id}")
+async def delete_entry(space_id: int,
+                       entry_id: int,
+                       current_user: schemas.UserResponse = Depends(require_membership),
+                       db: AsyncSession = Depends(database.get_db)
+                       ):
+    entry = await editable_entry(db, space_id, entry_id, current_user.id)
+    await retire_chunks(db, entry.id) # type: ignore
+    await db.delete(entry)
+    await db.commit()
+    await schedule_index(space_id)
+    return {"delete": "complete"}
+
+@router.get("/{space_id}/ask", response_model=schemas.AskResponse)
+async def ask_space(space_id: int,
+                    q: str = Query(..., min_length=1, max_length=500),
+                    k: int = Query(5, ge=1, le=settings.KNOWLEDGE_MAX_K),
+                    current_user: schemas.UserResponse = Depends(require_membership),
+                    db: AsyncSession = Depends(database.get_read_db)
+                    ):
+    # nearest chunks from the space's vector index, then one primary key lookup for their text
+    hits, job_id = await ask(db, space_id, q, k)
+    return {"query": q, "hits": hits, "index_job_id": job_id}
@@ -1,100 +1,196 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import delete
-from app.db.schemas import MessageResponse, CreateMessage, MessgeEditResponse, UpdateMessage
-from app.db.models import User, Message, SpaceMembership, Space
-from app.db import database
-from app.core.security import get_current_user, get_userid_from_request
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, select, tuple_
+from app.db.schemas import UserResponse, MessageResponse, MessagePage, CreateMessage, CreateMessageBatch, MessgeEditResponse, UpdateMessage
+from app.db.models import Message, Space
+from app.db import archive, database
+from app.core.security import get_current_user
 from app.core.config import settings
-
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-
-def limit_by_user(request: Request):
-    user_id = get_userid_from_request(request)
-    if user_id is not None:
-        return(f"user:{user_id}")
-    return(f"ip:{get_remote_address(request)}")
-
-limiter = Limiter(key_func=limit_by_user,
-                  storage_uri=settings.REDIS_URL
-                  )
+from app.core.ratelimit import limiter, rate_limit, by_user
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.realtime import publish_event, publish_events
+from app.core.unread import messages_changed
+from app.core.membership import get_space_ids, is_member
+from app.db.group_commit import message_writer
 
 router = APIRouter(prefix="/messages", tags=['messages'])
 
-@router.post("/", response_model=MessageResponse)
-@limiter.limit("1/minute", per_method=True)
-def create_message(message_data: CreateMessage,
-                   request: Request, # i need this bc the docs said so
-                   current_user: User = Depends(get_current_user),
-                   db: Session = Depends(database.get_db)
-                   ) -> Message:
-    space_exist = db.query(Space).filter(Space.id == message_data.space_id).first()
-    if not space_exist:
-        raise HTTPException(status_code=404, detail="This space does not exists")
-    new_content = Message(
-        user_id=current_user.id,
-        content=message_data.content,
-        space_id=message_data.space_id
-    )
-    is_member = db.query(SpaceMembership).filter(
-        SpaceMembership.user_id == current_user.id,
-        SpaceMembership.space_id == message_data.space_id
-    ).first()
-    if not is_member:
+# built once, pages get validated straight off the row tuples and dumped to bytes by pydantic-core
+page_adapter = TypeAdapter(MessagePage)
+messages_adapter = TypeAdapter(list[MessageResponse])
+
+@router.post("/", response_model=MessageResponse, dependencies=[Depends(rate_limit("messages.create", by_user))])
+async def create_message(message_data: CreateMessage,
+                         current_user: UserResponse = Depends(get_current_user),
+                         db: AsyncSession = Depends(database.get_db)
+                         ) -> MessageResponse:
+    # a membership means the space exists and isn't deleted, the space row is
+    # only looked at to tell the two failures apart
+    if not await is_member(current_user.id, message_data.space_id, db):
+        space_exist = await db.get(Space, message_data.space_id)
+        if not space_exist or space_exist.deleted_at is not None:
+            raise HTTPException(status_code=404, detail="This space does not exists")
         raise HTTPException(status_code=403, detail="You're not a member of this space")
     if len(message_data.content) > 200:
         raise HTTPException(status_code=400, detail="Message exceeds limit: 200")
-    db.add(new_content)
-    db.commit()
-    db.refresh(new_content)
-    return new_content
-
-@router.get("/")
-def get_messages(space_id: int, db: Session = Depends(database.get_db)):
-    if space_id:
-        messages = db.query(Message).filter(Message.space_id == space_id).all()
+    if settings.MESSAGES_GROUP_COMMIT:
+        # hand the connection back before waiting on the shared transaction
+        await db.close()
+        row = await message_writer.add(
+            {"user_id": current_user.id, "content": message_data.content, "space_id": message_data.space_id})
+        created = MessageResponse.model_validate(row, from_attributes=True)
+    else:
+        new_content = Message(
+            user_id=current_user.id,
+            content=message_data.content,
+            space_id=message_data.space_id
+        )
+        db.add(new_content)
+        await db.commit()
+        await db.refresh(new_content)
+        created = MessageResponse.model_validate(new_content)
+    await messages_changed({(created.space_id, current_user.id): 1})
+    await publish_event(created.space_id, "message.created", created.model_dump(mode="json"))
+    return created
+
+@router.post("/batch", response_model=list[MessageResponse])
+async def create_messages(batch: CreateMessageBatch,
+                          request: Request,
+                          current_user: UserResponse = Depends(get_current_user),
+                          db: AsyncSession = Depends(database.get_db)
+                          ):
+    if not batch.messages:
+        return []
+    if len(batch.messages) > settings.MESSAGES_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds limit: {settings.MESSAGES_BATCH_MAX}")
+    if any(len(m.content) > 200 for m in batch.messages):
+        raise HTTPException(status_code=400, detail="Message exceeds limit: 200")
+
+    # one hit per batch, weighted by how many messages are in it
+    await limiter.check("messages.batch", by_user(request), cost=len(batch.messages))
+
+    # a membership means the space exists too, so the cached set covers both checks
+    space_ids = {m.space_id for m in batch.messages}
+    allowed = await get_space_ids(current_user.id, db)
+    if space_ids - allowed:
+        raise HTTPException(status_code=403, detail=f"You're not a member of spaces {sorted(space_ids - allowed)}")
+
+    rows = (await db.execute(
+        insert(Message).values([
+            {"user_id": current_user.id, "content": m.content, "space_id": m.space_id}
+            for m in batch.messages
+        ]).returning(Message.id, Message.content, Message.user_id, Message.space_id, Message.created_at)
+    )).all()
+    await db.commit()
+
+    created = messages_adapter.validate_python(rows, from_attributes=True)
+    per_space: dict[tuple[int, int], int] = {}
+    for m in created:
+        per_space[(m.space_id, current_user.id)] = per_space.get((m.space_id, current_user.id), 0) + 1
+    await messages_changed(per_space)
+    await publish_events([(m.space_id, "message.created", m.model_dump(mode="json")) for m in created])
+    return Response(content=messages_adapter.dump_json(created), media_type="application/json")
+
+@router.get("/", response_model=MessagePage)
+async def get_messages(space_id: int,
+                       before: str | None = None,
+                       after: str | None = None,
+                       limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_MAX),
+                       db: AsyncSession = Depends(database.get_read_db)
+                       ):
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+    # only pull the columns the response needs, no ORM objects
+    query = select(Message.id, Message.content, Message.user_id,
+                   Message.space_id, Message.created_at
+                   ).where(Message.space_id == space_id)
+    key = tuple_(Message.created_at, Message.id)
+
+    # fetch one extra row to know if there is another page. months that were
+    # archived out of postgres (app/db/archive.py) are only read once postgres
+    # has nothing older left, and only for spaces that have any. a cold catalog
+    # reads every month's manifest, so that's off the loop too
+    archived = await asyncio.to_thread(archive.has_space, space_id)
+    if after:
+        cursor = decode_cursor(after)
+        rows = await asyncio.to_thread(archive.newer, space_id, cursor, limit + 1) if archived else []
+        if len(rows) <= limit:
+            query = query.where(key > cursor).order_by(
+                Message.created_at.asc(), Message.id.asc()).limit(limit + 1 - len(rows))
+            rows += (await db.execute(query)).all()
+        # a short page means this is the newest there is, same as before= running out
+        has_newer = len(rows) > limit
+        has_older = True
+        rows = rows[:limit]
+    else:
+        has_newer = True
+        cursor = decode_cursor(before) if before else None
+        if cursor:
+            query = query.where(key < cursor)
+        query = query.order_by(
+            Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+        rows = (await db.execute(query)).all()
+        if archived and len(rows) <= limit:
+            oldest = (rows[-1].created_at, rows[-1].id) if rows else cursor
+            rows += await asyncio.to_thread(archive.older, space_id, oldest, limit + 1 - len(rows))
+        has_older = len(rows) > limit
+        rows = rows[:limit][::-1]
+
+    if not rows:
+        page = {"items": [], "before": None, "after": None}
     else:
-        messages = db.query(Message).all()
-    return messages
+        page = {
+            "items": rows,
+            "before": encode_cursor(rows[0].created_at, rows[0].id) if has_older else None,
+            "after": encode_cursor(rows[-1].created_at, rows[-1].id) if has_newer else None,
+        }
+    body = page_adapter.dump_json(page_adapter.validate_python(page, from_attributes=True))
+    return Response(content=body, media_type="application/json")
 
 @router.get("/{id}", response_model=MessageResponse)
-def get_message(id: int, db: Session = Depends(database.get_db)):
-    message = db.query(Message).filter(Message.id == id).first()
+async def get_message(id: int, db: AsyncSession = Depends(database.get_read_db)):
+    message = await db.get(Message, id)
     if message is None:
         raise HTTPException(status_code=404, detail="Message not found")
     return message
 
 @router.delete("/{id}")
-def delete_message(id: int, 
-                   db: Session = Depends(database.get_db),
-                   current_user: User = Depends(get_current_user)
-                   ):
-    message = db.query(Message).filter(Message.user_id == current_user.id,
-                                       Message.id == id).first()
+async def delete_message(id: int,
+                         db: AsyncSession = Depends(database.get_db),
+                         current_user: UserResponse = Depends(get_current_user)
+                         ):
+    message = await db.scalar(select(Message).where(Message.user_id == current_user.id,
+                                                    Message.id == id))
     if not message:
         raise HTTPException(status_code=400, detail="This isn't your message")
-    db.delete(message)
-    db.commit()
+    await db.delete(message)
+    await db.commit()
+    await messages_changed({(message.space_id, current_user.id): -1}) # type: ignore
+    await publish_event(message.space_id, "message.deleted", {"id": id}) # type: ignore
     return{
         "delete": "complete"
     }
 
 @router.put("/{message_id}", response_model=MessgeEditResponse)
-def edit_message(new_content: UpdateMessage,
-                 message_id: int,
-                 db: Session = Depends(database.get_db),
-                 current_user: User = Depends(get_current_user)
-                 ):
-    message = db.query(Message).filter(
+async def edit_message(new_content: UpdateMessage,
+                       message_id: int,
+                       db: AsyncSession = Depends(database.get_db),
+                       current_user: UserResponse = Depends(get_current_user)
+                       ):
+    message = await db.scalar(select(Message).where(
         Message.id == message_id,
         Message.user_id == current_user.id
-    ).first()
+    ))
     if message is None:
         raise HTTPException(status_code=404, detail="Message doesn't exists")
     if new_content is not None:
         message.content = new_content.content # type: ignore
 
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
+    await publish_event(message.space_id, "message.edited", # type: ignore
+                        MessageResponse.model_validate(message).model_dump(mode="json"))
     return message
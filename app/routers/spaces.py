@@ -1,89 +1,138 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import delete
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, literal, literal_column, tuple_, update
 from app.db import schemas, database
-from app.db.models import SpaceMembership, Space, User, Message
-from app.core.security import get_current_user, hash_password, verify_password
+from app.db.models import SpaceMembership, Space, User, Message, SpaceSummary
+from app.core.security import get_current_user, get_user_from_token, hash_password_async, verify_password_async
+from app.core.realtime import hub
+from app.db.purge import remove_space, schedule_purge
+from app.core.config import settings
+from app.core.pagination import encode_rank_cursor, decode_rank_cursor
+from app.core.summary import schedule_refresh, is_stale
+from app.core.knowledge import schedule_index
+from app.core.jobs import get_job
+from app.core.unread import forget_read_mark, reset_counts
+from app.core.membership import require_membership, is_member, invalidate_spaces
+from app.core.presence import presence, forget, online, active_counts
+from app.db.transfer import export_lines, gzip_lines, read_lines, import_lines, ImportFailed
+from app.core.http_cache import (SPACES_VERSION, members_version, get_version, bump_versions,
+                                 cached_body, etag_response)
 
 router = APIRouter(prefix="/spaces", tags=["spaces"])
 
+spaces_adapter = TypeAdapter(list[schemas.SpaceResponse])
+members_adapter = TypeAdapter(list[schemas.SpaceMembershipResponse])
+search_adapter = TypeAdapter(schemas.SearchPage)
+
 @router.post("/", response_model=schemas.SpaceResponse)
-def create_space(space_data: schemas.SpaceCreate,
-                 db: Session = Depends(database.get_db),
-                 current_user: User = Depends(get_current_user)
-                 ):
+async def create_space(space_data: schemas.SpaceCreate,
+                       db: AsyncSession = Depends(database.get_db),
+                       current_user: schemas.UserResponse = Depends(get_current_user)
+                       ):
     new_space = Space(
         name=space_data.name,
         owner_id=current_user.id,
         description=space_data.description
     )
     if space_data.password_hash:
-        hashed_password = hash_password(space_data.password_hash)
+        hashed_password = await hash_password_async(space_data.password_hash)
         new_space.password_hash = hashed_password
 
     db.add(new_space)
-    db.commit()
-    db.refresh(new_space)
+    await db.commit()
+    await db.refresh(new_space)
 
     creator_membership = SpaceMembership(
         space_id=new_space.id,
         user_id=current_user.id
     )
     db.add(creator_membership)
-    db.commit()
+    await db.commit()
+    await invalidate_spaces(current_user.id)
+    presence.seen(current_user.id, new_space.id) # type: ignore
+    await bump_versions(SPACES_VERSION, members_version(new_space.id)) # type: ignore
 
     return new_space
 
 @router.get("/", response_model=list[schemas.SpaceResponse])
-def get_spaces(db: Session = Depends(database.get_db)):
-    spaces = db.query(Space).all()
-    return spaces
+async def get_spaces(request: Request,
+                     after: int = 0,
+                     limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_MAX),
+                     db: AsyncSession = Depends(database.get_read_db)
+                     ):
+    # pass the last id you got as ?after= for the next page
+    async def build() -> bytes:
+        # plain rows, no ORM objects to build just to dump them again
+        spaces = (await db.execute(
+            select(Space.id, Space.name, Space.description, Space.owner_id,
+                   Space.password_hash.is_not(None).label("requires_password"))
+            .where(Space.id > after, Space.deleted_at.is_(None)).order_by(Space.id).limit(limit)
+        )).all()
+        return spaces_adapter.dump_json(spaces_adapter.validate_python(spaces, from_attributes=True))
+
+    version = await get_version(SPACES_VERSION)
+    body = await cached_body(f"spaces:list:{after}:{limit}", version, build)
+    return etag_response(request, body)
 
 @router.post("/{space_id}/join", response_model=schemas.SpaceJoinResponse)
-def join_space(space_id: int,
-               join_data: schemas.SpaceJoinRequest,
-               db: Session = Depends(database.get_db),
-               current_user: User = Depends(get_current_user)               
-               ):
-    space = db.query(Space).filter(Space.id == space_id).first()
-    if not space:
+async def join_space(space_id: int,
+                     join_data: schemas.SpaceJoinRequest,
+                     db: AsyncSession = Depends(database.get_db),
+                     current_user: schemas.UserResponse = Depends(get_current_user)
+                     ):
+    space = await db.get(Space, space_id)
+    if not space or space.deleted_at is not None:
         raise HTTPException(status_code=404, detail="This space isnt found")
 
     if space.password_hash is not None:
         if join_data.password is None:
             raise HTTPException(status_code=403 or 401, detail="Password is required")
-        if not verify_password(join_data.password, space.password_hash):
+        if not await verify_password_async(join_data.password, space.password_hash):
             raise HTTPException(status_code=401 or 403, detail="Wrong password")
-        
-    membership = db.query(SpaceMembership).filter(
-        SpaceMembership.space_id == space_id,
-        SpaceMembership.user_id == current_user.id
-    ).first()
-    if membership:
+
+    if await is_member(current_user.id, space_id, db):
         raise HTTPException(status_code=400, detail="Already a member")
-    
-    new_member = SpaceMembership(user_id=current_user.id, space_id=space_id)
+
+    # history from before joining doesn't count as unread
+    latest = await db.scalar(select(func.max(Message.id)).where(Message.space_id == space_id))
+    new_member = SpaceMembership(user_id=current_user.id, space_id=space_id, last_read_message_id=latest)
     db.add(new_member)
-    db.commit()
-    db.refresh(new_member)
+    await db.commit()
+    await invalidate_spaces(current_user.id)
+    presence.seen(current_user.id, space_id)
+    await bump_versions(members_version(space_id))
     return{
         "space_id": space_id,
         "joined": "true"
     }
 
-@router.get("/{space_id}/enter")
-def enter_space(space_id: int,
-                current_user: User = Depends(get_current_user),
-                db: Session = Depends(database.get_db)
-                ):
-    membership = db.query(SpaceMembership).filter(
-        SpaceMembership.space_id == space_id,
-        SpaceMembership.user_id == current_user.id
-    ).first()
+@router.post("/{space_id}/read", response_model=schemas.MarkReadResponse)
+async def mark_read(space_id: int,
+                    read_data: schemas.MarkReadRequest | None = None,
+                    db: AsyncSession = Depends(database.get_db),
+                    current_user: schemas.UserResponse = Depends(require_membership)
+                    ):
+    message_id = read_data.message_id if read_data else None
+    if message_id is None:
+        message_id = await db.scalar(select(func.max(Message.id)).where(Message.space_id == space_id))
+    await db.execute(
+        update(SpaceMembership)
+        .where(SpaceMembership.user_id == current_user.id, SpaceMembership.space_id == space_id)
+        .values(last_read_message_id=message_id)
+    )
+    await db.commit()
+    await forget_read_mark(space_id, current_user.id)
+    return {"space_id": space_id, "last_read_message_id": message_id}
 
-    if not membership:
-        raise HTTPException(status_code=403, detail="You dont belong to this space")
-    space = db.query(Space).filter(Space.id == space_id).first()
+@router.get("/{space_id}/enter")
+async def enter_space(space_id: int,
+                      current_user: schemas.UserResponse = Depends(require_membership),
+                      db: AsyncSession = Depends(database.get_db)
+                      ):
+    space = await db.get(Space, space_id)
     return {
         "space": {
             "id": space.id, # type: ignore
@@ -96,33 +145,42 @@ def enter_space(space_id: int,
     }
 
 @router.delete("/{space_id}/leave")
-def leave_space(space_id: int,
-                db: Session = Depends(database.get_db),
-                current_user: User = Depends(get_current_user)
-                ):
-    membership = db.query(SpaceMembership).filter(
-        SpaceMembership.user_id == current_user.id,
-        SpaceMembership.space_id == space_id
-    ).first()
+async def leave_space(space_id: int,
+                      db: AsyncSession = Depends(database.get_db),
+                      current_user: schemas.UserResponse = Depends(get_current_user)
+                      ):
+    # row lock so two last members leaving at once can't both miss the empty space
+    space = await db.scalar(select(Space).where(Space.id == space_id).with_for_update())
+    membership = await db.get(SpaceMembership, (current_user.id, space_id))
     if not membership:
         raise HTTPException(status_code=400, detail="Your not in this space")
-    db.delete(membership)
-    db.commit()
+    await db.delete(membership)
+    await db.flush()
 
-    remaining_members = db.query(SpaceMembership).filter(
-        SpaceMembership.space_id == space_id
-    ).count()
+    remaining_members = await db.scalar(
+        select(func.count()).select_from(SpaceMembership).where(SpaceMembership.space_id == space_id)
+    )
+
+    # all in one transaction, nobody ever sees a half deleted space
+    purge_later = False
+    if remaining_members == 0 and space:
+        purge_later = await remove_space(db, space)
+    await db.commit()
+    await invalidate_spaces(current_user.id)
+    await forget(space_id, current_user.id)
+
+    job_id = None
+    if purge_later:
+        job_id = await schedule_purge(space_id, owner_id=current_user.id)
+    await bump_versions(members_version(space_id))
 
     if remaining_members == 0:
-        db.query(Message).filter(Message.space_id == space_id).delete()
-        space = db.query(Space).filter(Space.id == space_id).first()
-        if space:
-            db.delete(space)
-        db.commit()
+        await bump_versions(SPACES_VERSION)
         return{
             "space_id": space_id,
             "status": "left",
-            "space_deleted": True
+            "space_deleted": True,
+            "purge_job_id": job_id
         }
     return{
         "space_id": space_id,
@@ -131,32 +189,212 @@ def leave_space(space_id: int,
     }
 
 @router.get("/{space_id}/members", response_model=list[schemas.SpaceMembershipResponse])
-def get_members(space_id: int, db: Session = Depends(database.get_db)):
-    members = db.query(SpaceMembership).filter(SpaceMembership.space_id == space_id).all()
-    ids = [d.user_id for d in members]
-    name = db.query(User).filter(User.id.in_(ids)).all()
-    return name
+async def get_members(space_id: int,
+                      request: Request,
+                      after: int = 0,
+                      limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_MAX),
+                      db: AsyncSession = Depends(database.get_read_db)
+                      ):
+    async def build() -> bytes:
+        members = (await db.execute(
+            select(User.id, User.name)
+            .join(SpaceMembership, SpaceMembership.user_id == User.id)
+            .where(SpaceMembership.space_id == space_id, User.id > after)
+            .order_by(User.id)
+            .limit(limit)
+        )).all()
+        return members_adapter.dump_json(members_adapter.validate_python(members, from_attributes=True))
+
+    version = await get_version(members_version(space_id))
+    body = await cached_body(f"space:{space_id}:members:{after}:{limit}", version, build)
+    return etag_response(request, body)
+
+@router.post("/{space_id}/heartbeat", response_model=schemas.HeartbeatResponse)
+async def heartbeat(space_id: int,
+                    current_user: schemas.UserResponse = Depends(require_membership)
+                    ):
+    # for clients that sit in a space without making requests, a socket's pings do the same
+    presence.seen(current_user.id, space_id)
+    return {"space_id": space_id, "next_heartbeat": settings.PRESENCE_REFRESH}
+
+@router.get("/{space_id}/online", response_model=schemas.OnlineResponse)
+async def get_online(space_id: int,
+                     limit: int = Query(100, ge=1, le=settings.PRESENCE_ONLINE_MAX),
+                     current_user: schemas.UserResponse = Depends(require_membership)
+                     ):
+    # straight from the space's presence sorted set, no sql
+    count, members = await online(space_id, limit)
+    return {
+        "space_id": space_id,
+        "online": count,
+        "members": [{"id": user_id, "last_seen": datetime.fromtimestamp(at, timezone.utc)} for user_id, at in members],
+    }
+
+@router.get("/{space_id}/activity", response_model=schemas.ActivityResponse)
+async def get_activity(space_id: int,
+                       days: int = Query(7, ge=1, le=settings.PRESENCE_DAILY_RETENTION_DAYS),
+                       current_user: schemas.UserResponse = Depends(require_membership)
+                       ):
+    # daily and monthly active users, approximate (hyperloglog)
+    return await active_counts(space_id, days)
 
 @router.delete("/{space_id}/delete")
-def delete_space(space_id: int, 
-                 db: Session = Depends(database.get_db),
-                 current_user: User = Depends(get_current_user)
-                 ):
-    space = db.query(Space).filter(Space.owner_id == current_user.id, 
-                                   Space.id == space_id).first()
+async def delete_space(space_id: int,
+                       db: AsyncSession = Depends(database.get_db),
+                       current_user: schemas.UserResponse = Depends(get_current_user)
+                       ):
+    space = await db.scalar(select(Space).where(Space.owner_id == current_user.id,
+                                                Space.id == space_id,
+                                                Space.deleted_at.is_(None)).with_for_update())
     if not space:
         raise HTTPException(status_code=400, detail="You cant delete this space if your not the owner")
-    
-    db.query(Message).filter(Message.space_id == space_id).delete()
-    db.commit()
 
-    db.query(SpaceMembership).filter(SpaceMembership.space_id == space_id).delete()
-    db.commit()
+    # everyone in it loses access, grab them before the memberships go
+    member_ids = (await db.scalars(
+        select(SpaceMembership.user_id).where(SpaceMembership.space_id == space_id)
+    )).all()
+    purge_later = await remove_space(db, space)
+    await db.commit()
+    await invalidate_spaces(*member_ids)
 
-    db.delete(space)
-    db.commit()
+    job_id = None
+    if purge_later:
+        job_id = await schedule_purge(space_id, owner_id=current_user.id)
+    # the index job drops the space's vector index files
+    await schedule_index(space_id)
+    await bump_versions(SPACES_VERSION, members_version(space_id))
 
     return{
         "space_id": space_id,
-        "status": "deleted"
-    }
\ No newline at end of file
+        "status": "deleted",
+        "purge_job_id": job_id
+    }
+
+# text search config of the generated messages.search_vector column (migration 0004)
+SEARCH_CONFIG = "english"
+
+@router.get("/{space_id}/search", response_model=schemas.SearchPage)
+async def search_space(space_id: int,
+                       q: str = Query(..., min_length=1, max_length=200),
+                       cursor: str | None = None,
+                       limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_MAX),
+                       current_user: schemas.UserResponse = Depends(require_membership),
+                       db: AsyncSession = Depends(database.get_read_db)
+                       ):
+    if db.bind.dialect.name == "postgresql":
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        vector = literal_column("messages.search_vector")
+        rank = func.ts_rank(vector, ts_query)
+        match = vector.op("@@")(ts_query)
+    else:
+        # no tsvector outside postgres, plain substring match with a flat rank
+        rank = literal(0.0)
+        match = Message.content.ilike(f"%{q}%")
+
+    query = select(Message.id, Message.content, Message.user_id, Message.space_id,
+                   Message.created_at, rank.label("rank")
+                   ).where(Message.space_id == space_id, match)
+    if cursor:
+        query = query.where(tuple_(rank, Message.id) < decode_rank_cursor(cursor))
+    query = query.order_by(rank.desc(), Message.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+    last = rows[limit - 1] if len(rows) > limit else None
+    page = {
+        "items": rows[:limit],
+        "next": encode_rank_cursor(last.rank, last.id) if last else None,
+    }
+    return Response(content=search_adapter.dump_json(search_adapter.validate_python(page, from_attributes=True)),
+                    media_type="application/json")
+
+@router.get("/{space_id}/summary", response_model=schemas.SpaceSummaryResponse)
+async def get_summary(space_id: int,
+                      current_user: schemas.UserResponse = Depends(require_membership),
+                      db: AsyncSession = Depends(database.get_read_db)
+                      ):
+    # always answers with whatever digest is stored, an old one just queues a refresh
+    summary = await db.get(SpaceSummary, space_id)
+    job_id = None
+    if summary is None or is_stale(summary):
+        job_id = await schedule_refresh(space_id)
+    if summary is None:
+        return {"space_id": space_id, "content": "", "version": 0, "message_count": 0, "refresh_job_id": job_id}
+    return {
+        "space_id": space_id,
+        "content": summary.content,
+        "version": summary.version,
+        "message_count": summary.message_count,
+        "refreshed_at": summary.refreshed_at,
+        "refresh_job_id": job_id,
+    }
+
+@router.post("/{space_id}/summary/refresh", response_model=schemas.JobResponse)
+async def refresh_space_summary(space_id: int,
+                                current_user: schemas.UserResponse = Depends(require_membership),
+                                db: AsyncSession = Depends(database.get_read_db)
+                                ):
+    # an already pending refresh comes back as is
+    return await get_job(await schedule_refresh(space_id))
+
+@router.get("/{space_id}/export")
+async def export_space(space_id: int,
+                       compress: bool = False,
+                       current_user: schemas.UserResponse = Depends(require_membership)
+                       ):
+    # one message per line, streamed straight off a server side cursor
+    lines = export_lines(space_id)
+    filename = f"space-{space_id}.ndjson"
+    media_type = "application/x-ndjson"
+    if compress:
+        lines = gzip_lines(lines)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(lines, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.post("/{space_id}/import", response_model=schemas.ImportResponse)
+async def import_space(space_id: int,
+                       request: Request,
+                       db: AsyncSession = Depends(database.get_db),
+                       current_user: schemas.UserResponse = Depends(get_current_user)
+                       ):
+    # raw NDJSON body (gzip if sent with Content-Encoding: gzip), read as it arrives
+    space = await db.scalar(select(Space).where(Space.id == space_id, Space.deleted_at.is_(None)))
+    if not space or space.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only the owner can import into this space")
+    await db.commit()
+
+    compressed = request.headers.get("Content-Encoding", "").lower() == "gzip"
+    try:
+        imported = await import_lines(db, space_id, current_user.id, read_lines(request.stream(), compressed))
+    except ImportFailed as e:
+        await db.rollback()
+        await reset_counts(space_id)
+        raise HTTPException(status_code=400, detail=f"{e}, {e.imported} messages were imported before it")
+    await reset_counts(space_id)
+    return {"space_id": space_id, "imported": imported}
+
+async def can_stream(token: str, space_id: int) -> int | None:
+    # the user's id if they may, short lived session so the socket doesn't pin a db connection
+    async with database.AsyncSessionLocal() as db:
+        try:
+            user = await get_user_from_token(token, db)
+        except HTTPException:
+            return None
+        return user.id if await is_member(user.id, space_id, db) else None
+
+# browsers can't set headers on a websocket so the jwt comes in as ?token=
+@router.websocket("/{space_id}/stream")
+async def stream_space(websocket: WebSocket, space_id: int, token: str = ""):
+    user_id = await can_stream(token, space_id) if token else None
+    if user_id is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    presence.seen(user_id, space_id)
+    queue = await hub.join(space_id)
+    try:
+        # every ping from the client is a heartbeat
+        await hub.pump(websocket, queue, on_ping=lambda: presence.seen(user_id, space_id))
+    finally:
+        await hub.leave(space_id, queue)
@@ -1,44 +1,67 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from app.db import models, schemas, database
-from app.core.security import get_current_user
-from app.core.security import rd
+from app.core.security import get_current_user, invalidate_user
+from app.core.http_cache import bump_versions, members_version
+from app.core.unread import unread_counts
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/me", response_model=schemas.UserResponse)
-def get_current_user_profile(current_user: models.User = Depends(get_current_user)):
+async def get_current_user_profile(current_user: schemas.UserResponse = Depends(get_current_user)):
     return current_user
 
 @router.put("/me", response_model=schemas.UserResponse)
-def update_user(update_data: schemas.UpdateUser,
-                current_user: models.User = Depends(get_current_user),
-                db: Session = Depends(database.get_db)
-                ):
+async def update_user(update_data: schemas.UpdateUser,
+                      current_user: schemas.UserResponse = Depends(get_current_user),
+                      db: AsyncSession = Depends(database.get_db)
+                      ):
+    # current_user comes from the cache, so grab the real row to update
+    user = await db.get(models.User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
     if update_data.name is not None:
-        current_user.name = update_data.name # type: ignore
+        user.name = update_data.name # type: ignore
     if update_data.email is not None:
-        current_user.email = update_data.email # type: ignore
+        user.email = update_data.email # type: ignore
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(user)
 
-    try:
-        rd.delete(f"user:{current_user.id}")
-        rd.set(
-        f"user:{current_user.id}", schemas.UserResponse.model_validate(current_user).model_dump_json(), ex=180)
-    except Exception:
-        pass
-    return current_user
+    # the next request loads the new row, writing it here could race an older load
+    await invalidate_user(user.id) # type: ignore
+    # rosters show the name, so every space this user is in needs a fresh one
+    space_ids = (await db.scalars(
+        select(models.SpaceMembership.space_id).where(models.SpaceMembership.user_id == user.id)
+    )).all()
+    await bump_versions(*[members_version(space_id) for space_id in space_ids])
+    return user
+
+@router.get("/me/spaces", response_model=list[schemas.MySpaceResponse])
+async def get_my_spaces(current_user: schemas.UserResponse = Depends(get_current_user),
+                        db: AsyncSession = Depends(database.get_read_db)
+                        ):
+    # one query for the spaces, one redis round trip for every unread count
+    spaces = (await db.execute(
+        select(models.Space.id, models.Space.name, models.Space.description, models.Space.owner_id,
+               models.Space.password_hash.is_not(None).label("requires_password"),
+               models.SpaceMembership.last_read_message_id)
+        .join(models.SpaceMembership, models.SpaceMembership.space_id == models.Space.id)
+        .where(models.SpaceMembership.user_id == current_user.id, models.Space.deleted_at.is_(None))
+        .order_by(models.Space.id)
+    )).all()
+    counts = await unread_counts(db, current_user.id, [space.id for space in spaces])
+    return [{**space._mapping, "unread": counts.get(space.id, 0)} for space in spaces]
 
 @router.get("/{user_id}", response_model=schemas.UserResponse)
-def get_user_by_id(user_id: int, db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(user_id: int, db: AsyncSession = Depends(database.get_read_db)):
+    user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.get("/", response_model=list[schemas.UserResponse])
-def get_all_users(db: Session = Depends(database.get_db)):
-    users = db.query(models.User).all()
-    return users
\ No newline at end of file
+async def get_all_users(db: AsyncSession = Depends(database.get_read_db)):
+    users = (await db.scalars(select(models.User))).all()
+    return users
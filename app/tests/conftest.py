@@ -0,0 +1,155 @@
+import itertools
+from datetime import datetime
+import pytest
+from app.bench.harness import configure_env
+
+# same offline setup as the benchmarks (a throwaway sqlite file and fakeredis),
+# it has to be in place before anything imports app.core.config
+configure_env()
+
+names = itertools.count(1)
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def reset_state():
+    # every test starts from empty tables, an empty redis and cold local caches
+    from app.core import metrics
+    from app.core.cache import local_caches
+    from app.core.presence import presence
+    from app.core.ratelimit import limiter
+    from app.core.redis_client import rd
+    from app.core.revocation import revoked
+    from app.core.security import token_cache
+    from app.db import archive
+    from app.db.database import Base, engine
+    from app.bench.harness import create_schema
+
+    Base.metadata.drop_all(bind=engine)
+    create_schema()
+    rd.flushall()
+    for cache in [*local_caches.values(), token_cache, limiter.leases, limiter.fallback,
+                  archive.catalog_cache, archive.month_cache]:
+        cache.clear()
+    revoked.replace({})
+    presence.pending.clear()
+    presence.recent.clear()
+    metrics.histograms.clear()
+    metrics.request_totals.clear()
+
+@pytest.fixture
+async def app():
+    from app.main import create_app
+    from app.core.config import settings
+    from app.core.ratelimit import limiter
+    reset_state()
+    app = create_app()
+    # tests that are about rate limits turn it back on
+    limiter.enabled = False
+    async with app.router.lifespan_context(app):
+        yield app
+    limiter.enabled = settings.RATE_LIMIT_ENABLED
+
+@pytest.fixture
+async def client_for(app):
+    import httpx
+    clients = []
+
+    def make():
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.aclose()
+
+async def sign_up(client, name: str | None = None) -> dict:
+    # registers and logs in, the client keeps the access token. returns the token pair and the user id
+    name = name or f"user{next(names)}"
+    email = f"{name}@example.com"
+    registered = await client.post("/auth/register", json={"name": name, "email": email, "password": "password123"})
+    assert registered.status_code == 200, registered.text
+    tokens = (await client.post("/auth/login", json={"email": email, "password": "password123"})).json()
+    client.headers["Authorization"] = f"Bearer {tokens['access_token']}"
+    return {**tokens, "id": registered.json()["id"], "name": name}
+
+@pytest.fixture
+async def user(client_for):
+    # a signed in client and who it is
+    client = client_for()
+    client.me = await sign_up(client)
+    return client
+
+async def make_space(client, name: str = "space", **fields) -> int:
+    response = await client.post("/spaces/", json={"name": name, **fields})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+@pytest.fixture
+def archived_month(tmp_path, monkeypatch):
+    # writes one archived month for a space, the way archive_partition lays it out
+    import os
+    from app.core.config import settings
+    from app.db import archive
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    archive.catalog_cache.clear()
+
+    def write(space_id: int, user_id: int, month: datetime, contents: list[str]) -> str:
+        path = archive.month_dir(month)
+        os.makedirs(path)
+        writer = archive.MonthWriter(path)
+        writer.write([archive.ArchivedMessage(i + 1, content, user_id, space_id, month.replace(second=i))
+                      for i, content in enumerate(contents)])
+        writer.close_file()
+        archive.write_manifest(path, {"from": month.isoformat(), "to": archive.next_month(month).isoformat(),
+                                      "spaces": writer.counts})
+        return path
+
+    return write
+
+databases = itertools.count(1)
+
+@pytest.fixture(scope="session")
+def postgres_server() -> str:
+    # TEST_POSTGRES_URL, or a local server from the pgserver package. the
+    # postgres only tests skip when there's neither
+    import os
+    import tempfile
+    from sqlalchemy.engine import make_url
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pgserver = pytest.importorskip("pgserver")
+        url = pgserver.get_server(tempfile.mkdtemp(prefix="pg"), cleanup_mode="stop").get_uri()
+    return make_url(url).set(drivername="postgresql+psycopg2").render_as_string(hide_password=False)
+
+def migrate(url: str, revision: str = "head", downgrade: bool = False):
+    import os
+    from alembic import command
+    from alembic.config import Config
+    config = Config()
+    config.set_main_option("script_location", os.path.join(os.path.dirname(__file__), "..", "..", "alembic"))
+    config.attributes["database_url"] = url
+    (command.downgrade if downgrade else command.upgrade)(config, revision)
+
+@pytest.fixture
+def empty_postgres(postgres_server):
+    # a fresh database with nothing in it, its sync url
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.engine import make_url
+    name = f"teambrain_test_{next(databases)}"
+    admin = create_engine(postgres_server, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    yield make_url(postgres_server).set(database=name).render_as_string(hide_password=False)
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {name} WITH (FORCE)"))
+    admin.dispose()
+
+@pytest.fixture
+def postgres(empty_postgres):
+    # the same, migrated to head
+    migrate(empty_postgres)
+    return empty_postgres
@@ -0,0 +1,44 @@
+import asyncio
+import time
+import pytest
+from app.core.security import hash_password_async, verify_password, verify_password_async
+from app.tests.conftest import sign_up
+
+pytestmark = pytest.mark.anyio
+
+async def test_hashing_runs_off_the_event_loop():
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    start = time.perf_counter()
+    hashes = await asyncio.gather(*(hash_password_async(f"password{i}") for i in range(4)))
+    elapsed = time.perf_counter() - start
+    ticker.cancel()
+    # the loop kept going while bcrypt ran in the pool
+    assert ticks >= elapsed / 0.005 / 4
+    assert verify_password("password0", hashes[0])
+    assert await verify_password_async("password3", hashes[3])
+    assert not await verify_password_async("wrong", hashes[3])
+
+async def test_register_login_and_me(client_for):
+    client = client_for()
+    me = await sign_up(client, "alice")
+    profile = (await client.get("/users/me")).json()
+    assert profile["id"] == me["id"] and profile["name"] == "alice"
+
+async def test_duplicate_email_and_bad_password(client_for):
+    client = client_for()
+    await sign_up(client, "bob")
+    again = await client.post("/auth/register", json={"name": "bob", "email": "bob@example.com", "password": "password123"})
+    assert again.status_code == 400
+    wrong = await client.post("/auth/login", json={"email": "bob@example.com", "password": "nope12345"})
+    assert wrong.status_code == 401
+
+async def test_requests_need_a_token(client_for):
+    assert (await client_for().get("/users/me")).status_code == 401
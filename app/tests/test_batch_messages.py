@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import event, func, select
+from app.db.database import AsyncSessionLocal, async_engine
+from app.db.models import Message
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+async def message_count() -> int:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(Message)) # type: ignore
+
+async def test_batch_is_one_insert_in_order(user):
+    first, second = await make_space(user, "a"), await make_space(user, "b")
+    inserts = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("INSERT"):
+            inserts.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = await user.post("/messages/batch", json={"messages": [
+            {"content": f"m{i}", "space_id": first if i % 2 else second} for i in range(10)]})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    assert [m["content"] for m in response.json()] == [f"m{i}" for i in range(10)]
+    assert len(inserts) == 1
+
+async def test_one_foreign_space_rejects_the_whole_batch(user, client_for):
+    mine = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    theirs = await make_space(other)
+    response = await user.post("/messages/batch", json={"messages": [
+        {"content": "ok", "space_id": mine}, {"content": "nope", "space_id": theirs}]})
+    assert response.status_code == 403
+    assert await message_count() == 0
+
+async def test_batch_limits(user):
+    from app.core.config import settings
+    space_id = await make_space(user)
+    too_many = [{"content": "x", "space_id": space_id}] * (settings.MESSAGES_BATCH_MAX + 1)
+    assert (await user.post("/messages/batch", json={"messages": too_many})).status_code == 400
+    too_long = [{"content": "x" * 201, "space_id": space_id}]
+    assert (await user.post("/messages/batch", json={"messages": too_long})).status_code == 400
+    assert (await user.post("/messages/batch", json={"messages": []})).json() == []
+
+async def test_rate_limit_counts_messages_not_requests(user):
+    from app.core.ratelimit import limiter
+    space_id = await make_space(user)
+    limiter.enabled = True
+    batch = [{"content": "x", "space_id": space_id}] * 400
+    assert (await user.post("/messages/batch", json={"messages": batch})).status_code == 200
+    # 800 messages inside a minute is past 600/minute
+    assert (await user.post("/messages/batch", json={"messages": batch})).status_code == 429
@@ -0,0 +1,45 @@
+import pytest
+from app.bench import harness
+from app.tests.conftest import reset_state
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert harness.percentile(values, 50) == 50
+    assert harness.percentile(values, 95) == 95
+    assert harness.percentile(values, 99) == 99
+    assert harness.percentile([7.0], 99) == 7
+    assert harness.percentile([], 50) == 0
+
+def row(queries: float, p95: float) -> dict:
+    return {"count": 1, "errors": 0, "p50_ms": p95, "p95_ms": p95, "p99_ms": p95, "rps": 1.0, "queries_per_call": queries}
+
+def test_compare_flags_extra_queries_and_slow_p95():
+    baseline = {"get_messages": row(2, 10), "users_me": row(1, 5), "gone": row(1, 1)}
+    report = {"get_messages": row(3, 10), "users_me": row(1, 7), "new": row(9, 99)}
+    failures = harness.compare(report, baseline, p95_tolerance=0.25)
+    assert failures == ["get_messages: queries/call 2 -> 3", "users_me: p95 5ms -> 7ms"]
+    # inside the tolerance is fine
+    assert harness.compare({"users_me": row(1, 6)}, baseline, p95_tolerance=0.25) == []
+
+def test_report_round_trips(tmp_path):
+    report = {"users_me": row(1, 5)}
+    path = tmp_path / "baseline.json"
+    harness.save_report(str(path), report)
+    assert harness.load_report(str(path)) == report
+    assert "users_me" in harness.format_report(report)
+
+@pytest.mark.anyio
+async def test_tiny_api_run():
+    from app.core.config import settings
+    from app.core.ratelimit import limiter
+    reset_state()
+    try:
+        report = await harness.run_api(users=2, spaces=1, messages=2, reads=2, concurrency=2)
+    finally:
+        limiter.enabled = settings.RATE_LIMIT_ENABLED
+    assert {"register", "login", "create_space", "join_space", "create_message",
+            "get_messages", "users_me", "get_spaces", "get_members"} <= report.keys()
+    assert all(r["errors"] == 0 for r in report.values()), report
+    assert report["create_message"]["count"] == 4
+    # the warm cached reads don't go to the database every time
+    assert report["users_me"]["queries_per_call"] < 1
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import event, text
+from app.core import metrics
+from app.core.config import settings
+from app.db import database
+
+pytestmark = pytest.mark.anyio
+
+def test_async_urls_are_derived():
+    assert database.async_database_url("postgresql://u:p@db/teambrain") == "postgresql+asyncpg://u:p@db/teambrain"
+    assert database.async_database_url("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+    with pytest.raises(RuntimeError):
+        database.async_database_url("mysql://db/teambrain")
+
+@pytest.fixture
+def replica(monkeypatch):
+    # a second async engine registered the way a READ_REPLICA_URL one is
+    url = database.async_database_url(settings.DATABASE_URL)
+    replica = database.make_engine(url, "replica", is_async=True)
+    monkeypatch.setitem(database.engines, "replica", replica)
+    yield replica
+
+async def test_every_engine_is_instrumented_and_disposed(replica):
+    from app.main import create_app
+    from app.tests.conftest import reset_state
+    reset_state()
+    app = create_app()
+    for db_engine in (database.engine, database.async_engine.sync_engine, replica.sync_engine):
+        assert event.contains(db_engine, "before_cursor_execute", metrics.before_cursor_execute)
+
+    async with app.router.lifespan_context(app):
+        async with replica.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        assert replica.pool.checkedin() == 1
+    # the lifespan closed the replica's pooled connection too
+    assert replica.pool.checkedin() == 0
+
+async def test_replica_queries_show_up_per_request(replica, user):
+    sessions = database.async_sessionmaker(replica, autoflush=False, expire_on_commit=False)
+
+    async def get_read_db():
+        async with sessions() as db:
+            yield db
+
+    user._transport.app.dependency_overrides[database.get_read_db] = get_read_db
+    await user.get("/spaces/")
+    queries = metrics.histograms[("http_request_sql_queries", (("method", "GET"), ("route", "/spaces/")))]
+    assert queries.sum >= 1
@@ -0,0 +1,92 @@
+import asyncio
+import re
+import pytest
+from sqlalchemy import event
+from app.core import metrics
+from app.core.config import settings
+from app.db.database import async_engine
+from app.db.group_commit import GroupCommitter
+from app.db.models import Message
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+COLUMNS = (Message.id, Message.content, Message.space_id)
+
+class Commits:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "commit", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "commit", self)
+
+async def test_concurrent_adds_share_one_transaction(user):
+    space_id = await make_space(user)
+    writer = GroupCommitter(Message, COLUMNS, window_ms=50, max_batch=100)
+    with Commits() as commits:
+        rows = await asyncio.gather(*(
+            writer.add({"user_id": user.me["id"], "content": f"m{i}", "space_id": space_id}) for i in range(10)))
+    assert commits.count == 1
+    # every caller gets its own row back
+    assert [row.content for row in rows] == [f"m{i}" for i in range(10)]
+    assert len({row.id for row in rows}) == 10
+    assert metrics.histograms[("group_commit_batch_size", ())].sum == 10
+
+async def test_a_full_batch_doesnt_wait_for_the_window(user):
+    space_id = await make_space(user)
+    writer = GroupCommitter(Message, COLUMNS, window_ms=60_000, max_batch=3)
+    rows = await asyncio.wait_for(asyncio.gather(*(
+        writer.add({"user_id": user.me["id"], "content": f"m{i}", "space_id": space_id}) for i in range(3))), 5)
+    assert len(rows) == 3
+
+async def test_one_bad_row_only_fails_its_own_caller(user):
+    space_id = await make_space(user)
+    writer = GroupCommitter(Message, COLUMNS, window_ms=20, max_batch=100)
+    results = await asyncio.gather(
+        writer.add({"user_id": user.me["id"], "content": "ok", "space_id": space_id}),
+        writer.add({"user_id": user.me["id"], "content": "gone", "space_id": 999999}),
+        return_exceptions=True,
+    )
+    assert results[0].content == "ok"
+    assert isinstance(results[1], Exception)
+
+async def test_route_uses_the_shared_writer(user, monkeypatch):
+    monkeypatch.setattr(settings, "MESSAGES_GROUP_COMMIT", True)
+    space_id = await make_space(user)
+    responses = await asyncio.gather(*(
+        user.post("/messages/", json={"content": f"m{i}", "space_id": space_id}) for i in range(5)))
+    assert all(r.status_code == 200 for r in responses)
+    assert sorted(r.json()["content"] for r in responses) == [f"m{i}" for i in range(5)]
+
+NAME = r"[a-zA-Z_:][a-zA-Z0-9_:]*"
+LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*"'
+SAMPLE = re.compile(rf"^({NAME})(\{{{LABEL}(?:,{LABEL})*\}})? (\S+)$")
+COMMENT = re.compile(rf"^# (HELP {NAME} .*|TYPE {NAME} (counter|gauge|histogram|summary|untyped))$")
+
+async def test_metrics_output_is_valid_prometheus_text(user):
+    space_id = await make_space(user)
+    # unlabelled, like the group commit histogram
+    metrics.observe("group_commit_batch_size", 3)
+    await user.get(f"/messages/?space_id={space_id}")
+    body = (await user.get("/metrics")).text
+    assert body.endswith("\n")
+    samples = {}
+    for line in body.splitlines():
+        if line.startswith("#"):
+            assert COMMENT.match(line), line
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        float(match.group(3))
+        samples[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    assert samples['group_commit_batch_size_bucket{le="3"}'] == 1
+    assert samples['group_commit_batch_size_bucket{le="+Inf"}'] == 1
+    assert samples["group_commit_batch_size_sum"] == 3
+    assert samples["group_commit_batch_size_count"] == 1
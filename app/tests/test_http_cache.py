@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import event
+from app.db.database import async_engine
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+class Queries:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self)
+
+async def test_space_list_revalidates_with_etags(user):
+    await make_space(user, "one")
+    first = await user.get("/spaces/")
+    etag = first.headers["ETag"]
+    with Queries() as queries:
+        again = await user.get("/spaces/", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    # served from the redis copy, postgres wasn't asked
+    assert queries.count == 0
+
+    await make_space(user, "two")
+    changed = await user.get("/spaces/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert [s["name"] for s in changed.json()] == ["one", "two"]
+
+async def test_roster_changes_on_join_and_rename(user, client_for):
+    space_id = await make_space(user)
+    etag = (await user.get(f"/spaces/{space_id}/members")).headers["ETag"]
+
+    other = client_for()
+    await sign_up(other, "joiner")
+    await other.post(f"/spaces/{space_id}/join", json={})
+    roster = await user.get(f"/spaces/{space_id}/members", headers={"If-None-Match": etag})
+    assert roster.status_code == 200
+    assert "joiner" in [m["name"] for m in roster.json()]
+
+    await other.put("/users/me", json={"name": "renamed"})
+    renamed = await user.get(f"/spaces/{space_id}/members", headers={"If-None-Match": roster.headers["ETag"]})
+    assert "renamed" in [m["name"] for m in renamed.json()]
+
+async def test_weak_and_star_validators_match(user):
+    etag = (await user.get("/spaces/")).headers["ETag"]
+    assert (await user.get("/spaces/", headers={"If-None-Match": f'"nope", W/{etag}'})).status_code == 304
+    assert (await user.get("/spaces/", headers={"If-None-Match": "*"})).status_code == 304
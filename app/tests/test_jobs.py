@@ -0,0 +1,108 @@
+import asyncio
+import time
+import pytest
+from app import worker
+from app.core import jobs
+from app.core.config import settings
+from app.core.redis_client import ard
+from app.tests.conftest import reset_state
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def clean():
+    reset_state()
+
+@pytest.fixture
+def flaky(monkeypatch):
+    # fails the first time, then returns what it was given
+    calls = []
+
+    async def fn(value: int):
+        calls.append(value)
+        if len(calls) == 1:
+            raise ValueError("first try")
+        return value * 2
+
+    monkeypatch.setitem(jobs.registry, "flaky", jobs.JobSpec(fn))
+    return calls
+
+async def claimed(name: str, **fields) -> str:
+    # a job a worker took off the queue, as if that worker then died
+    job_id = await jobs.enqueue(name, {"value": 1})
+    assert await ard.blmove(jobs.QUEUE, jobs.PROCESSING, 1, "RIGHT", "LEFT") == job_id
+    if fields:
+        await ard.hset(jobs.job_key(job_id), mapping=fields)
+    return job_id
+
+async def test_claimed_but_never_started_is_requeued(flaky):
+    job_id = await claimed("flaky")
+    await jobs.reap_stale()
+    # first sighting starts its clock
+    assert await ard.lrange(jobs.PROCESSING, 0, -1) == [job_id]
+    assert await ard.hget(jobs.job_key(job_id), "claimed") is not None
+
+    await ard.hset(jobs.job_key(job_id), "claimed", time.time() - settings.JOB_VISIBILITY_TIMEOUT - 1)
+    await jobs.reap_stale()
+    assert await ard.lrange(jobs.PROCESSING, 0, -1) == []
+    assert await ard.lrange(jobs.QUEUE, 0, -1) == [job_id]
+    assert await ard.hmget(jobs.job_key(job_id), ["status", "claimed", "started"]) == ["queued", None, None]
+
+async def test_only_stale_running_jobs_are_reaped(flaky):
+    stale = await claimed("flaky", started=time.time() - settings.JOB_VISIBILITY_TIMEOUT - 1)
+    fresh = await claimed("flaky", started=time.time())
+    await jobs.reap_stale()
+    assert await ard.lrange(jobs.PROCESSING, 0, -1) == [fresh]
+    assert await ard.lrange(jobs.QUEUE, 0, -1) == [stale]
+
+async def test_retry_backs_off_then_runs(flaky):
+    job_id = await claimed("flaky")
+    await jobs.run_job(job_id, None)
+    assert (await jobs.get_job(job_id))["status"] == "retrying"
+
+    await ard.zadd(jobs.DELAYED, {job_id: 0})
+    await jobs.promote_delayed()
+    # the first try's start time is gone, so the reaper can't fire early
+    assert await ard.hget(jobs.job_key(job_id), "started") is None
+    assert await ard.blmove(jobs.QUEUE, jobs.PROCESSING, 1, "RIGHT", "LEFT") == job_id
+    await jobs.run_job(job_id, None)
+    job = await jobs.get_job(job_id)
+    assert job["status"] == "done" and job["result"] == 2 and job["attempts"] == 2
+    assert flaky == [1, 1]
+
+async def test_worker_runs_cpu_jobs_and_stops():
+    stop = asyncio.Event()
+    task = asyncio.create_task(worker.run_worker(2, 1, stop))
+    job_id = await jobs.enqueue("hash_password", {"password": "hunter22"}, sensitive=True)
+    hashed = await jobs.wait_for_job(job_id, timeout=30)
+    assert hashed.startswith("$2")
+    # the hash doesn't stay behind in redis
+    assert await ard.hget(jobs.job_key(job_id), "result") is None
+    assert 0 < await ard.ttl(jobs.job_key(job_id)) <= settings.JOB_SENSITIVE_TTL
+    stop.set()
+    await asyncio.wait_for(task, 10)
+
+class SlowPool:
+    # shuts down like a pool waiting on a busy child process
+    def __init__(self, max_workers=None):
+        pass
+
+    def shutdown(self, wait=True):
+        time.sleep(0.3)
+
+async def test_pool_shutdown_leaves_the_loop_running(monkeypatch):
+    monkeypatch.setattr(worker, "ProcessPoolExecutor", SlowPool)
+    stop = asyncio.Event()
+    stop.set()
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    await worker.run_worker(1, 1, stop)
+    ticker.cancel()
+    assert ticks > 10
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from app.core import vector_index
+from app.core.config import settings
+from app.core.embeddings import HashingEmbedder, chunk_text
+from app.core.knowledge import sync_index
+from app.core.vector_index import SpaceIndex
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path))
+    vector_index.readers.clear()
+
+def test_chunks_overlap():
+    words = [f"w{i}" for i in range(10)]
+    chunks = chunk_text(" ".join(words), size=4, overlap=1)
+    assert chunks == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+    assert chunk_text("   ", 4, 1) == []
+
+def test_hashing_embeddings_are_stable_unit_vectors():
+    embedder = HashingEmbedder(64)
+    first, again, empty = embedder.embed(["deploy the api", "deploy the api", ""])
+    assert np.allclose(first, again)
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert not empty.any()
+
+def random_vectors(n: int, dim: int) -> np.ndarray:
+    vectors = np.random.default_rng(1).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_flat_index_search_and_remove():
+    vectors = random_vectors(50, 16)
+    index = SpaceIndex.create(1, 16, "test")
+    index.add(np.arange(100, 150, dtype=np.int64), vectors)
+    index.save_meta()
+    assert index.search(vectors[7], 3, 1)[0][0] == 107
+    index.remove([107])
+    assert 107 not in [chunk_id for chunk_id, _ in index.search(vectors[7], 3, 1)]
+
+    reopened = SpaceIndex.open(1)
+    assert reopened.count == 50
+    assert reopened.search(vectors[8], 1, 1)[0][0] == 108
+
+def test_ivf_finds_the_same_nearest_rows(monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MODE", "ivf")
+    monkeypatch.setattr(settings, "VECTOR_IVF_MIN_ROWS", 100)
+    vectors = random_vectors(400, 16)
+    index = SpaceIndex.create(1, 16, "test")
+    index.add(np.arange(400, dtype=np.int64), vectors)
+    assert index.needs_training()
+    index.train()
+    index.save_meta()
+    assert index.centroids is not None
+    # probing every list is an exact search
+    lists = len(index.centroids)
+    for row in (0, 123, 399):
+        assert index.search(vectors[row], 1, lists)[0][0] == row
+    # rows appended after training are still searched
+    extra = random_vectors(401, 16)[400:]
+    index.add(np.array([1000]), extra)
+    assert index.search(extra[0], 1, 2)[0][0] == 1000
+
+async def test_ask_after_indexing(user):
+    space_id = await make_space(user)
+    entry = (await user.post(f"/spaces/{space_id}/knowledge", json={
+        "kind": "decision", "title": "Database choice",
+        "content": "We picked postgres for messages because of partitioning and full text search."})).json()
+    await user.post(f"/spaces/{space_id}/knowledge", json={
+        "title": "Lunch", "content": "Tacos on friday at the place around the corner."})
+
+    pending = (await user.get(f"/spaces/{space_id}/ask", params={"q": "why postgres"})).json()
+    assert pending["hits"] == [] and pending["index_job_id"] == f"index_space:{space_id}"
+    job = await user.get(f"/jobs/{pending['index_job_id']}")
+    assert job.status_code == 200 and job.json()["name"] == "index_space"
+
+    assert await sync_index(space_id) == {"added": 2, "removed": 0}
+    hits = (await user.get(f"/spaces/{space_id}/ask", params={"q": "postgres partitioning full text search", "k": 1})).json()["hits"]
+    assert [(hit["entry_id"], hit["kind"]) for hit in hits] == [(entry["id"], "decision")]
+
+    await user.put(f"/spaces/{space_id}/knowledge/{entry['id']}", json={"content": "We moved to sqlite."})
+    assert await sync_index(space_id) == {"added": 1, "removed": 1}
+    hits = (await user.get(f"/spaces/{space_id}/ask", params={"q": "postgres partitioning"})).json()["hits"]
+    assert all("postgres" not in hit["content"] for hit in hits)
+
+    await user.delete(f"/spaces/{space_id}/knowledge/{entry['id']}")
+    # the index is behind until the job runs, postgres filters the stale hit out
+    hits = (await user.get(f"/spaces/{space_id}/ask", params={"q": "sqlite"})).json()["hits"]
+    assert entry["id"] not in [hit["entry_id"] for hit in hits]
+
+async def test_ask_is_members_only(user, client_for):
+    from app.tests.conftest import sign_up
+    space_id = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    assert (await other.get(f"/spaces/{space_id}/ask", params={"q": "x"})).status_code == 403
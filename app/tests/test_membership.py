@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from app.core.membership import get_space_ids, invalidate_spaces, load_space_ids, space_cache, spaces_key
+from app.core.presence import spaces_of
+from app.core.redis_client import ard
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+class Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+class SlowDb:
+    # hands back membership rows read before the write, once the test lets it
+    def __init__(self, space_ids):
+        self.space_ids = space_ids
+        self.gate = asyncio.Event()
+
+    async def scalars(self, query):
+        await self.gate.wait()
+        return Rows(self.space_ids)
+
+async def test_load_in_flight_during_a_join_caches_nothing():
+    space_cache.clear()
+    db = SlowDb([1])
+    load = asyncio.create_task(load_space_ids(7, db, space_cache.generation)) # type: ignore
+    await asyncio.sleep(0.01)
+    # the join commits and invalidates while the load is still waiting on postgres
+    await invalidate_spaces(7)
+    db.gate.set()
+    assert await load == frozenset({1})
+
+    assert space_cache.get("7") is None
+    assert await ard.get(spaces_key(7)) is None
+
+async def test_lookups_after_an_invalidation_get_a_new_load():
+    space_cache.clear()
+    old = SlowDb([1])
+    before = asyncio.create_task(get_space_ids(7, old)) # type: ignore
+    await asyncio.sleep(0.01)
+    await invalidate_spaces(7)
+    new = SlowDb([1, 2])
+    new.gate.set()
+    after = await get_space_ids(7, new) # type: ignore
+    old.gate.set()
+    assert await before == frozenset({1})
+    assert after == frozenset({1, 2})
+    assert space_cache.get("7") == frozenset({1, 2})
+
+async def test_presence_lookup_racing_an_invalidation_stays_out_of_the_cache(monkeypatch):
+    space_cache.clear()
+    await ard.set(spaces_key(7), "[1]")
+    mget = ard.mget
+
+    async def slow_mget(keys):
+        values = await mget(keys)
+        await invalidate_spaces(7)
+        return values
+
+    monkeypatch.setattr(ard, "mget", slow_mget)
+    assert await spaces_of([7]) == {7: frozenset({1})}
+    assert space_cache.get("7") is None
+
+async def test_join_and_leave_take_effect_right_away(user, client_for):
+    space_id = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    post = {"content": "hi", "space_id": space_id}
+    assert (await other.post("/messages/", json=post)).status_code == 403
+    await other.post(f"/spaces/{space_id}/join", json={})
+    assert (await other.post("/messages/", json=post)).status_code == 200
+    await other.delete(f"/spaces/{space_id}/leave")
+    assert (await other.get(f"/spaces/{space_id}/summary")).status_code == 403
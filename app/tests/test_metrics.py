@@ -0,0 +1,62 @@
+import logging
+import pytest
+from app.core import metrics
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+def histogram(name: str, route: str, method: str = "GET") -> metrics.Histogram:
+    return metrics.histograms[(name, (("method", method), ("route", route)))]
+
+async def test_requests_are_labelled_by_route_template(user):
+    await user.get("/users/me")
+    await user.get("/users/me")
+    await user.get("/spaces/123/members")
+
+    duration = histogram("http_request_duration_seconds", "/users/me")
+    assert duration.count == 2 and duration.sum > 0
+    assert metrics.request_totals[("/users/me", "GET", "200")] == 2
+    # the id stays out of the labels
+    assert ("/spaces/{space_id}/members", "GET", "200") in metrics.request_totals
+
+async def test_sql_redis_and_bcrypt_are_counted(user):
+    from app.core.security import user_cache
+    login = histogram("http_request_sql_queries", "/auth/login", "POST")
+    # one select for the user, and bcrypt verified the password
+    assert login.count == 1 and login.sum >= 1
+    assert histogram("http_request_bcrypt_seconds", "/auth/login", "POST").sum > 0
+
+    # a cold worker cache goes to redis for the user
+    user_cache.clear()
+    await user.get("/users/me")
+    assert histogram("http_request_redis_calls", "/users/me").sum >= 1
+    assert histogram("http_request_redis_seconds", "/users/me").sum > 0
+
+async def test_pipelined_commands_are_counted(user):
+    from app.tests.conftest import make_space
+    spaces = [await make_space(user, f"space{i}") for i in range(3)]
+    metrics.histograms.clear()
+    # cold unread counters: one pipelined hmget per space, then one seed per space
+    await user.get("/users/me/spaces")
+    calls = histogram("http_request_redis_calls", "/users/me/spaces")
+    assert calls.count == 1 and calls.sum >= 2 * len(spaces)
+
+    # the warm path is a single pipeline of hmgets
+    metrics.histograms.clear()
+    await user.get("/users/me/spaces")
+    assert histogram("http_request_redis_calls", "/users/me/spaces").sum >= len(spaces)
+
+async def test_metrics_endpoint(user):
+    await user.get("/users/me")
+    body = (await user.get("/metrics")).text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/me",le="+Inf"} 1' in body
+    assert 'http_requests_total{route="/users/me",method="GET",status="200"} 1' in body
+
+async def test_slow_requests_are_logged_with_their_sql(user, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_REQUEST_MS", 0.000001)
+    with caplog.at_level(logging.WARNING, logger="app.slow_requests"):
+        await user.get("/spaces/")
+    [record] = [r for r in caplog.records if r.name == "app.slow_requests"]
+    assert "GET /spaces/" in record.getMessage()
+    assert "SELECT" in record.getMessage()
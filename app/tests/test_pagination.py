@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import update
+from app.core.pagination import decode_cursor, encode_cursor
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+def test_cursor_round_trip():
+    moment = datetime(2026, 1, 2, 3, 4, 5, 678000)
+    assert decode_cursor(encode_cursor(moment, 42)) == (moment, 42)
+
+def test_bad_cursor_is_a_400():
+    from fastapi import HTTPException
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+async def post_messages(client, space_id: int, count: int) -> list[int]:
+    from app.db.database import AsyncSessionLocal
+    from app.db.models import Message
+    ids = []
+    for i in range(count):
+        response = await client.post("/messages/", json={"content": f"m{i}", "space_id": space_id})
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["id"])
+    # one message a minute, sqlite's server default only has whole seconds
+    async with AsyncSessionLocal() as db:
+        for i, message_id in enumerate(ids):
+            await db.execute(update(Message).where(Message.id == message_id)
+                             .values(created_at=datetime(2026, 1, 1) + timedelta(minutes=i)))
+        await db.commit()
+    return ids
+
+async def test_pages_backward_to_the_oldest(user):
+    space_id = await make_space(user)
+    await post_messages(user, space_id, 7)
+
+    seen, cursor = [], None
+    while True:
+        params = {"space_id": space_id, "limit": 3, **({"before": cursor} if cursor else {})}
+        page = (await user.get("/messages/", params=params)).json()
+        seen = [m["content"] for m in page["items"]] + seen
+        cursor = page["before"]
+        if cursor is None:
+            break
+    assert seen == [f"m{i}" for i in range(7)]
+
+async def test_after_runs_out_on_the_newest_page(user):
+    space_id = await make_space(user)
+    await post_messages(user, space_id, 5)
+
+    seen, cursor, pages = [], encode_cursor(datetime(2025, 1, 1), 0), 0
+    while cursor is not None:
+        page = (await user.get("/messages/", params={"space_id": space_id, "limit": 2, "after": cursor})).json()
+        seen += [m["content"] for m in page["items"]]
+        cursor = page["after"]
+        pages += 1
+        assert pages <= 3
+    assert seen == [f"m{i}" for i in range(5)]
+
+async def test_empty_after_page_has_no_cursors(user):
+    space_id = await make_space(user)
+    await post_messages(user, space_id, 2)
+    page = (await user.get("/messages/", params={"space_id": space_id, "after": encode_cursor(datetime(2030, 1, 1), 0)})).json()
+    assert page == {"items": [], "before": None, "after": None}
+
+async def test_before_and_after_together_is_a_400(user):
+    space_id = await make_space(user)
+    cursor = encode_cursor(datetime(2026, 1, 1), 1)
+    response = await user.get("/messages/", params={"space_id": space_id, "before": cursor, "after": cursor})
+    assert response.status_code == 400
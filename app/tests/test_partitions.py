@@ -0,0 +1,134 @@
+import os
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from app.core.config import settings
+from app.db import archive
+from app.db.partitions import ensure_partitions, list_partitions, month_start, next_month, partition_name
+from app.tests.conftest import make_space, migrate
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime.now(timezone.utc)
+
+def seed(url: str, messages: list[tuple[str, datetime]], user_id: int = 1, space_id: int = 1):
+    # a user, a space and its messages
+    with create_engine(url).begin() as conn:
+        conn.execute(text("INSERT INTO users (id, name, email, password_hash) VALUES (:u, 'u', 'u@example.com', 'x') "
+                          "ON CONFLICT DO NOTHING"), {"u": user_id})
+        conn.execute(text("INSERT INTO spaces (id, name, owner_id) VALUES (:s, 's', :u) ON CONFLICT DO NOTHING"),
+                     {"s": space_id, "u": user_id})
+        for content, created_at in messages:
+            conn.execute(text("INSERT INTO messages (content, user_id, space_id, created_at) VALUES (:c, :u, :s, :t)"),
+                         {"c": content, "u": user_id, "s": space_id, "t": created_at})
+
+def rows(url: str, sql: str) -> list:
+    with create_engine(url).connect() as conn:
+        return conn.execute(text(sql)).all()
+
+@pytest.fixture
+async def pg(postgres):
+    # an asyncpg session on the migrated database, what the maintenance job runs with
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    engine = create_async_engine(make_url(postgres).set(drivername="postgresql+asyncpg"))
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+        yield db
+    await engine.dispose()
+
+def test_migration_partitions_existing_rows(empty_postgres):
+    migrate(empty_postgres, "0008")
+    old = datetime(2025, 3, 14, tzinfo=timezone.utc)
+    seed(empty_postgres, [("old", old), ("new", NOW)])
+    migrate(empty_postgres)
+
+    placed = dict(rows(empty_postgres, "SELECT content, tableoid::regclass::text FROM messages"))
+    assert placed == {"old": "messages_p202503", "new": partition_name(month_start(NOW))}
+    assert rows(empty_postgres, "SELECT count(*) FROM messages_default") == [(0,)]
+    # the sequence survived the rebuild
+    seed_more = "INSERT INTO messages (content, user_id, space_id) VALUES ('next', 1, 1) RETURNING id"
+    with create_engine(empty_postgres).begin() as conn:
+        assert conn.execute(text(seed_more)).scalar() == 3
+    assert rows(empty_postgres, "SELECT search_vector IS NOT NULL FROM messages WHERE content = 'old'") == [(True,)]
+
+    migrate(empty_postgres, "0008", downgrade=True)
+    assert sorted(r[0] for r in rows(empty_postgres, "SELECT content FROM messages")) == ["new", "next", "old"]
+
+async def test_new_month_takes_its_rows_out_of_default(postgres, pg):
+    far = month_start(NOW)
+    for _ in range(settings.MESSAGES_PARTITIONS_AHEAD + 2):
+        far = next_month(far)
+    # nothing covers that month yet, so these land in the default
+    seed(postgres, [("early", far.replace(day=2)), ("late", far.replace(day=20))])
+    assert rows(postgres, "SELECT count(*) FROM messages_default") == [(2,)]
+
+    created = await ensure_partitions(pg, far)
+    assert partition_name(far) in created
+    assert rows(postgres, "SELECT count(*) FROM messages_default") == [(0,)]
+    placed = rows(postgres, "SELECT DISTINCT tableoid::regclass::text FROM messages")
+    assert placed == [(partition_name(far),)]
+    # attached with the parent's keys and indexes, and the search column still works
+    indexes = {r[0] for r in rows(postgres, f"SELECT indexdef FROM pg_indexes WHERE tablename = '{partition_name(far)}'")}
+    assert any("(id, created_at)" in i for i in indexes) and any("gin" in i for i in indexes)
+    assert rows(postgres, "SELECT content FROM messages WHERE search_vector @@ to_tsquery('english', 'early')") == [("early",)]
+    # and it's idempotent
+    assert partition_name(far) not in await ensure_partitions(pg, far)
+
+async def test_archived_month_reads_through(app, user, postgres, pg, tmp_path, monkeypatch):
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from app.db import database
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    # the copy goes in more than one batch
+    monkeypatch.setattr(settings, "EXPORT_CHUNK", 2)
+    archive.catalog_cache.clear()
+    # membership comes from the app's database, history from postgres
+    space_id = await make_space(user)
+    month = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    seed(postgres, [(f"a{i}", month.replace(day=i + 1)) for i in range(3)] + [("live", NOW)],
+         user.me["id"], space_id)
+    # march is older than anything 0009 made a partition for, its rows sat in the default
+    assert partition_name(month) in await ensure_partitions(pg, month)
+
+    name = partition_name(month)
+    assert name in [n for n, _ in await list_partitions(pg)]
+    assert await archive.archive_partition(pg, name, month) == 3
+    assert name not in [n for n, _ in await list_partitions(pg)]
+    assert os.path.exists(archive.space_file(month, space_id))
+    assert archive.space_months(space_id) == [month]
+
+    sessions = async_sessionmaker(pg.bind, expire_on_commit=False)
+
+    async def postgres_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[database.get_read_db] = postgres_db
+
+    async def page(**params) -> dict:
+        response = await user.get("/messages/", params={"space_id": space_id, "limit": 2, **params})
+        return response.json()
+
+    newest = await page()
+    assert [m["content"] for m in newest["items"]] == ["a2", "live"]
+    older = await page(before=newest["before"])
+    assert [m["content"] for m in older["items"]] == ["a0", "a1"]
+    assert older["before"] is None
+    forward = await page(after=older["after"])
+    assert [m["content"] for m in forward["items"]] == ["a2", "live"]
+    assert forward["after"] is None
+
+async def test_maintenance_job(postgres, pg, tmp_path, monkeypatch):
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "MESSAGES_ARCHIVE_AFTER_DAYS", 30)
+    monkeypatch.setattr(archive, "AsyncSessionLocal", async_sessionmaker(pg.bind, expire_on_commit=False))
+    archive.catalog_cache.clear()
+    seed(postgres, [("current", NOW)])
+
+    later = next_month(next_month(month_start(NOW)))
+    result = await archive.maintain(later.replace(day=15))
+    assert partition_name(next_month(next_month(next_month(later)))) in result["created"]
+    # this month ended more than 30 days before then
+    assert result["archived"] == {partition_name(month_start(NOW)): 1}
+    assert rows(postgres, "SELECT count(*) FROM messages") == [(0,)]
+    assert [m.content for m in archive.older(1, None, 10)] == ["current"]
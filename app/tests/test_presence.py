@@ -0,0 +1,103 @@
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.core.config import settings
+from app.core.membership import space_cache
+from app.core.presence import PresenceBuffer, presence, presence_key, day_key, month_key
+from app.core.redis_client import ard
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+async def online_ids(client, space_id: int) -> list[int]:
+    response = await client.get(f"/spaces/{space_id}/online")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["online"] == len(body["members"])
+    return sorted(member["id"] for member in body["members"])
+
+async def test_heartbeat_and_requests_show_as_online(user, client_for):
+    space_id = await make_space(user)
+    other = client_for()
+    other.me = await sign_up(other)
+    assert (await other.post(f"/spaces/{space_id}/join", json={})).status_code == 200
+
+    response = await user.post(f"/spaces/{space_id}/heartbeat")
+    assert response.json() == {"space_id": space_id, "next_heartbeat": settings.PRESENCE_REFRESH}
+    await presence.flush()
+    assert await online_ids(user, space_id) == sorted([user.me["id"], other.me["id"]])
+
+    # leaving takes them out straight away, not when the window runs out
+    assert (await other.delete(f"/spaces/{space_id}/leave")).status_code == 200
+    await presence.flush()
+    assert await online_ids(user, space_id) == [user.me["id"]]
+
+async def test_heartbeat_needs_membership(user, client_for):
+    space_id = await make_space(user)
+    stranger = client_for()
+    stranger.me = await sign_up(stranger)
+    assert (await stranger.post(f"/spaces/{space_id}/heartbeat")).status_code == 403
+    assert (await stranger.get(f"/spaces/{space_id}/online")).status_code == 403
+    await presence.flush()
+    assert await ard.zscore(presence_key(space_id), str(stranger.me["id"])) is None
+
+async def test_seen_outside_the_window_is_not_online(user):
+    space_id = await make_space(user)
+    await ard.zadd(presence_key(space_id), {"999": time.time() - settings.PRESENCE_ONLINE_SECONDS - 5})
+    await presence.flush()
+    assert 999 not in await online_ids(user, space_id)
+
+async def test_repeats_inside_the_refresh_are_free(app):
+    buffer = PresenceBuffer()
+    buffer.seen(1, 5)
+    first = buffer.pending[(5, 1)]
+    buffer.seen(1, 5)
+    assert buffer.pending == {(5, 1): first}
+
+    assert await buffer.flush() == 1
+    buffer.seen(1, 5)
+    assert buffer.pending == {}
+    assert await buffer.flush() == 0
+
+    # once the refresh has passed it goes to redis again
+    buffer.recent[(5, 1)] -= settings.PRESENCE_REFRESH
+    buffer.seen(1, 5)
+    assert (5, 1) in buffer.pending
+
+async def test_any_request_fans_out_to_cached_spaces(app):
+    buffer = PresenceBuffer()
+    space_cache.set("1", frozenset({10, 11}))
+    buffer.seen(1)
+    # nothing cached for this one, so nothing to write and the next hit tries again
+    buffer.seen(2)
+    assert await buffer.flush() == 2
+    assert await ard.zscore(presence_key(10), "1") is not None
+    assert await ard.zscore(presence_key(11), "1") is not None
+    assert (None, 1) in buffer.recent
+    assert (None, 2) not in buffer.recent
+
+async def test_daily_and_monthly_active_users(user, client_for):
+    space_id = await make_space(user)
+    for _ in range(3):
+        member = client_for()
+        await sign_up(member)
+        assert (await member.post(f"/spaces/{space_id}/join", json={})).status_code == 200
+    await presence.flush()
+
+    today = datetime.now(timezone.utc).date()
+    yesterday = today - timedelta(days=1)
+    await ard.pfadd(day_key(space_id, yesterday), str(user.me["id"]), "999")
+    if yesterday.month == today.month:
+        await ard.pfadd(month_key(space_id, today), "999")
+
+    response = await user.get(f"/spaces/{space_id}/activity", params={"days": 2})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["daily"] == [{"day": today.isoformat(), "active": 4},
+                             {"day": yesterday.isoformat(), "active": 2}]
+    # the owner was around yesterday too, only 999 is new
+    assert body["period_active"] == 5
+    assert body["month"] == f"{today:%Y-%m}"
+    assert body["monthly_active"] == (5 if yesterday.month == today.month else 4)
+
+    assert (await user.get(f"/spaces/{space_id}/activity", params={"days": 0})).status_code == 422
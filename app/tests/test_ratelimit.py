@@ -0,0 +1,64 @@
+import pytest
+from app.core.ratelimit import Rate, RateLimiter, parse_rate
+from app.tests.conftest import reset_state
+
+pytestmark = pytest.mark.anyio
+
+def test_parse_rate():
+    assert parse_rate("3/minute") == Rate(3, 60, "3/minute")
+    assert parse_rate("10 per 5 seconds").period == 5
+    assert parse_rate("600/minute").interval == 0.1
+    with pytest.raises(ValueError):
+        parse_rate("lots")
+
+@pytest.fixture
+def limiter():
+    reset_state()
+    limiter = RateLimiter()
+    limiter.enabled = True
+    limiter.rates = {"tight": parse_rate("3/minute"), "loose": parse_rate("600/minute")}
+    return limiter
+
+async def test_burst_up_to_the_limit_then_wait(limiter):
+    assert [await limiter.hit("tight", "a") for _ in range(3)] == [0, 0, 0]
+    retry_after = await limiter.hit("tight", "a")
+    # one token comes back every 20 seconds
+    assert 19 < retry_after <= 20
+    # other keys have their own budget
+    assert await limiter.hit("tight", "b") == 0
+
+async def test_busy_keys_spend_local_leases(limiter):
+    for _ in range(50):
+        assert await limiter.hit("loose", "a") == 0
+    # the batch doubles up to 600 // 10 = 60 capped by RATE_LIMIT_PRECLAIM
+    assert limiter.checks["redis"] < 10
+    assert limiter.checks["lease"] > 40
+
+async def test_tight_limits_always_ask_redis(limiter):
+    for _ in range(3):
+        await limiter.hit("tight", "a")
+    assert limiter.checks == {"lease": 0, "redis": 3, "fallback": 0}
+
+async def test_cost_counts_several_tokens(limiter):
+    assert await limiter.hit("tight", "a", cost=3) == 0
+    assert await limiter.hit("tight", "a") > 0
+
+async def test_local_fallback_while_redis_is_down(limiter, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(limiter, "script", broken)
+    assert [await limiter.hit("tight", "a") for _ in range(3)] == [0, 0, 0]
+    assert await limiter.hit("tight", "a") > 0
+    assert limiter.checks["fallback"] == 4
+
+async def test_login_gets_429_with_retry_after(client_for):
+    from app.core.ratelimit import limiter
+    client = client_for()
+    limiter.enabled = True
+    body = {"email": "nobody@example.com", "password": "password123"}
+    statuses = [(await client.post("/auth/login", json=body)).status_code for _ in range(3)]
+    assert statuses == [401, 401, 401]
+    limited = await client.post("/auth/login", json=body)
+    assert limited.status_code == 429
+    assert 1 <= int(limited.headers["Retry-After"]) <= 20
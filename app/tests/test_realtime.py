@@ -0,0 +1,64 @@
+import asyncio
+import json
+import pytest
+from app.core.realtime import SpaceHub, publish_event
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+async def next_event(queue: asyncio.Queue) -> dict:
+    return json.loads(await asyncio.wait_for(queue.get(), 2))
+
+async def test_hub_delivers_to_every_socket_in_the_space():
+    hub = SpaceHub()
+    first, second, elsewhere = await hub.join(1), await hub.join(1), await hub.join(2)
+    try:
+        await publish_event(1, "message.created", {"id": 7})
+        assert await next_event(first) == {"type": "message.created", "data": {"id": 7}}
+        assert await next_event(second) == {"type": "message.created", "data": {"id": 7}}
+        assert elsewhere.empty()
+    finally:
+        await hub.close()
+
+async def test_slow_socket_gets_hung_up_on():
+    hub = SpaceHub(queue_size=2)
+    queue = await hub.join(1)
+    try:
+        for i in range(3):
+            hub.dispatch(1, str(i))
+        # the oldest payload made room for the hang up marker
+        assert [queue.get_nowait(), queue.get_nowait()] == ["1", None]
+    finally:
+        await hub.close()
+
+async def test_leaving_unsubscribes_the_last_socket():
+    hub = SpaceHub()
+    queue = await hub.join(1)
+    await hub.leave(1, queue)
+    assert hub.queues == {}
+    await hub.close()
+
+async def test_message_writes_reach_the_space(user):
+    from app.core.realtime import hub
+    space_id = await make_space(user)
+    queue = await hub.join(space_id)
+    try:
+        created = (await user.post("/messages/", json={"content": "hi", "space_id": space_id})).json()
+        event = await next_event(queue)
+        assert event["type"] == "message.created" and event["data"]["id"] == created["id"]
+
+        await user.put(f"/messages/{created['id']}", json={"content": "edited"})
+        assert (await next_event(queue))["type"] == "message.edited"
+        await user.delete(f"/messages/{created['id']}")
+        assert await next_event(queue) == {"type": "message.deleted", "data": {"id": created["id"]}}
+    finally:
+        await hub.leave(space_id, queue)
+
+async def test_only_members_can_stream(user, client_for):
+    from app.routers.spaces import can_stream
+    from app.tests.conftest import sign_up
+    space_id = await make_space(user)
+    outsider = await sign_up(client_for())
+    assert await can_stream(user.me["access_token"], space_id) == user.me["id"]
+    assert await can_stream(outsider["access_token"], space_id) is None
+    assert await can_stream("garbage", space_id) is None
@@ -0,0 +1,59 @@
+import asyncio
+import time
+import pytest
+from app.core.redis_client import ard
+from app.core.revocation import REVOKED_CHANNEL, REVOKED_KEY, RevocationList, revoke_token, revoked
+
+pytestmark = pytest.mark.anyio
+
+async def refresh(client, token: str):
+    return await client.post("/auth/refresh", json={"refresh_token": token})
+
+async def test_refresh_rotates_the_pair(user):
+    response = await refresh(user, user.me["refresh_token"])
+    assert response.status_code == 200
+    fresh = response.json()
+    assert fresh["refresh_token"] != user.me["refresh_token"]
+    user.headers["Authorization"] = f"Bearer {fresh['access_token']}"
+    assert (await user.get("/users/me")).status_code == 200
+
+async def test_reusing_a_refresh_token_ends_every_session(user):
+    first = (await refresh(user, user.me["refresh_token"])).json()
+    # the spent token comes back, someone else has it
+    assert (await refresh(user, user.me["refresh_token"])).status_code == 401
+    assert (await refresh(user, first["refresh_token"])).status_code == 401
+    user.headers["Authorization"] = f"Bearer {first['access_token']}"
+    assert (await user.get("/users/me")).status_code == 401
+
+async def test_access_tokens_dont_refresh(user):
+    assert (await refresh(user, user.me["access_token"])).status_code == 401
+
+async def test_logout_revokes_both_tokens(user):
+    response = await user.post("/auth/logout", json={"refresh_token": user.me["refresh_token"]})
+    assert response.status_code == 200
+    assert (await user.get("/users/me")).status_code == 401
+    assert (await refresh(user, user.me["refresh_token"])).status_code == 401
+
+def test_revocation_list_forgets_expired_entries():
+    denylist = RevocationList()
+    denylist.add("old", time.time() - 1)
+    denylist.add("live", time.time() + 60)
+    assert not denylist.is_revoked("old")
+    assert denylist.is_revoked("live")
+    assert "old" not in denylist.entries
+
+async def test_revocations_reach_other_workers(app):
+    # another worker revoked it: only the pub/sub message gets here
+    exp = time.time() + 60
+    await ard.publish(REVOKED_CHANNEL, f"elsewhere:{exp}")
+    for _ in range(100):
+        if revoked.is_revoked("elsewhere"):
+            break
+        await asyncio.sleep(0.02)
+    assert revoked.is_revoked("elsewhere")
+
+async def test_redis_only_keeps_live_revocations(app):
+    await ard.zadd(REVOKED_KEY, {"dead": time.time() - 10})
+    assert await revoke_token("new", time.time() + 60)
+    assert not await revoke_token("new", time.time() + 60)
+    assert await ard.zscore(REVOKED_KEY, "dead") is None
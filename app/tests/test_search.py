@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import create_engine, text
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+async def post(client, space_id: int, *contents: str):
+    for content in contents:
+        assert (await client.post("/messages/", json={"content": content, "space_id": space_id})).status_code == 200
+
+async def test_search_matches_and_pages(user):
+    space_id = await make_space(user)
+    await post(user, space_id, "deploy on friday", "lunch plans", "the deploy broke", "deploy again")
+    first = (await user.get(f"/spaces/{space_id}/search", params={"q": "deploy", "limit": 2})).json()
+    assert len(first["items"]) == 2 and first["next"]
+    rest = (await user.get(f"/spaces/{space_id}/search", params={"q": "deploy", "limit": 2, "cursor": first["next"]})).json()
+    assert rest["next"] is None
+    found = [m["content"] for m in first["items"] + rest["items"]]
+    assert sorted(found) == ["deploy again", "deploy on friday", "the deploy broke"]
+
+async def test_search_is_for_members_only(user, client_for):
+    from app.tests.conftest import sign_up
+    space_id = await make_space(user)
+    outsider = client_for()
+    await sign_up(outsider)
+    assert (await outsider.get(f"/spaces/{space_id}/search", params={"q": "x"})).status_code == 403
+
+async def test_postgres_ranks_by_relevance(app, user, postgres):
+    # the route's tsvector query against a migrated postgres, membership still comes from the app's database
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.db import database
+    space_id = await make_space(user)
+    with create_engine(postgres).begin() as conn:
+        conn.execute(text("INSERT INTO users (id, name, email, password_hash) VALUES (:id, 'u', 'u@example.com', 'x')"),
+                     {"id": user.me["id"]})
+        conn.execute(text("INSERT INTO spaces (id, name, owner_id) VALUES (:id, 's', :owner)"),
+                     {"id": space_id, "owner": user.me["id"]})
+        for content in ["a database migration", "migration migration plan for the migrations", "unrelated chatter"]:
+            conn.execute(text("INSERT INTO messages (content, user_id, space_id) VALUES (:c, :u, :s)"),
+                         {"c": content, "u": user.me["id"], "s": space_id})
+
+    engine = create_async_engine(make_url(postgres).set(drivername="postgresql+asyncpg"))
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def postgres_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[database.get_read_db] = postgres_db
+    try:
+        page = (await user.get(f"/spaces/{space_id}/search", params={"q": "migrations"})).json()
+    finally:
+        app.dependency_overrides.clear()
+        await engine.dispose()
+    # stemming matches both, more hits rank higher
+    assert [m["content"] for m in page["items"]] == ["migration migration plan for the migrations", "a database migration"]
+    assert page["items"][0]["rank"] > page["items"][1]["rank"] > 0
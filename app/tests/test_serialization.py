@@ -0,0 +1,42 @@
+import pytest
+from app.db import schemas
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+# the list routes dump rows through prebuilt TypeAdapters and skip response_model,
+# the json has to come out the same as the schema would give it
+
+async def test_message_page_matches_the_schema(user):
+    space_id = await make_space(user)
+    await user.post("/messages/batch", json={"messages": [{"content": "hi", "space_id": space_id}]})
+    response = await user.get("/messages/", params={"space_id": space_id})
+    assert response.headers["content-type"] == "application/json"
+    page = response.json()
+    assert schemas.MessagePage.model_validate(page).model_dump(mode="json") == page
+    [item] = page["items"]
+    assert set(item) == {"id", "content", "user_id", "space_id", "created_at"}
+    assert item["content"] == "hi" and item["user_id"] == user.me["id"]
+
+async def test_batch_response_matches_the_schema(user):
+    space_id = await make_space(user)
+    response = await user.post("/messages/batch", json={"messages": [
+        {"content": f"m{i}", "space_id": space_id} for i in range(3)]})
+    created = response.json()
+    assert [schemas.MessageResponse.model_validate(m).model_dump(mode="json") for m in created] == created
+
+async def test_space_list_never_leaks_the_password_hash(user):
+    await make_space(user, "open")
+    await make_space(user, "locked", password_hash="secret123")
+    spaces = (await user.get("/spaces/")).json()
+    assert [(s["name"], s["requires_password"]) for s in spaces] == [("open", False), ("locked", True)]
+    for space in spaces:
+        assert set(space) == {"id", "name", "description", "owner_id", "requires_password"}
+        assert schemas.SpaceResponse.model_validate(space).model_dump(mode="json") == space
+
+async def test_search_page_matches_the_schema(user):
+    space_id = await make_space(user)
+    await user.post("/messages/batch", json={"messages": [{"content": "find me", "space_id": space_id}]})
+    page = (await user.get(f"/spaces/{space_id}/search", params={"q": "find"})).json()
+    assert schemas.SearchPage.model_validate(page).model_dump(mode="json") == page
+    assert [hit["content"] for hit in page["items"]] == ["find me"]
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import event, func, select
+from app.core.config import settings
+from app.db import archive
+from app.db.database import AsyncSessionLocal, async_engine
+from app.db.models import Message, Space, SpaceMembership
+from app.db.purge import purge_space
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+async def count(model, space_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(model).where(model.space_id == space_id)) # type: ignore
+
+async def post(client, space_id: int, n: int):
+    response = await client.post("/messages/batch", json={"messages": [
+        {"content": f"m{i}", "space_id": space_id} for i in range(n)]})
+    assert response.status_code == 200, response.text
+
+class Commits:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "commit", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "commit", self)
+
+async def test_delete_cascades_in_one_commit(user, client_for):
+    space_id = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    await other.post(f"/spaces/{space_id}/join", json={})
+    await post(user, space_id, 5)
+
+    with Commits() as commits:
+        response = await user.delete(f"/spaces/{space_id}/delete")
+    assert response.status_code == 200
+    assert response.json()["purge_job_id"] is None
+    assert commits.count == 1
+    assert await count(Message, space_id) == 0
+    assert await count(SpaceMembership, space_id) == 0
+    # the member lost access right away, not after a cache ttl
+    assert (await other.post("/messages/", json={"content": "hi", "space_id": space_id})).status_code == 404
+
+async def test_only_the_owner_deletes(user, client_for):
+    space_id = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    await other.post(f"/spaces/{space_id}/join", json={})
+    assert (await other.delete(f"/spaces/{space_id}/delete")).status_code == 400
+    assert await count(SpaceMembership, space_id) == 2
+
+async def test_big_spaces_are_tombstoned_then_purged(user, monkeypatch):
+    monkeypatch.setattr(settings, "SPACE_PURGE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "SPACE_PURGE_BATCH", 2)
+    space_id = await make_space(user)
+    await post(user, space_id, 5)
+
+    response = await user.delete(f"/spaces/{space_id}/delete")
+    assert response.json()["purge_job_id"] == f"purge_space:{space_id}"
+    assert await count(SpaceMembership, space_id) == 0
+    assert space_id not in [s["id"] for s in (await user.get("/spaces/")).json()]
+    assert (await user.post(f"/spaces/{space_id}/join", json={})).status_code == 404
+
+    await purge_space(space_id)
+    assert await count(Message, space_id) == 0
+    async with AsyncSessionLocal() as db:
+        assert await db.get(Space, space_id) is None
+
+async def test_last_member_leaving_deletes_the_space(user, client_for):
+    space_id = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    await other.post(f"/spaces/{space_id}/join", json={})
+    await post(user, space_id, 2)
+
+    first = (await other.delete(f"/spaces/{space_id}/leave")).json()
+    assert first["space_deleted"] is False
+    with Commits() as commits:
+        last = (await user.delete(f"/spaces/{space_id}/leave")).json()
+    assert last["space_deleted"] is True and commits.count == 1
+    assert await count(Message, space_id) == 0
+    async with AsyncSessionLocal() as db:
+        assert await db.get(Space, space_id) is None
+
+async def test_leaving_a_space_youre_not_in(user):
+    space_id = await make_space(user)
+    await user.delete(f"/spaces/{space_id}/leave")
+    assert (await user.delete(f"/spaces/{space_id}/leave")).status_code == 400
+
+def test_migration_leaves_validated_cascading_keys(postgres):
+    from sqlalchemy import create_engine, text
+    engine = create_engine(postgres)
+    with engine.connect() as conn:
+        keys = conn.execute(text(
+            "SELECT conname, convalidated, confdeltype FROM pg_constraint "
+            "WHERE conrelid IN ('messages'::regclass, 'space_membership'::regclass) AND contype = 'f' "
+            "AND conname LIKE '%space_id_fkey' ORDER BY conname"
+        )).all()
+    engine.dispose()
+    assert [tuple(key) for key in keys] == [("messages_space_id_fkey", True, "c"),
+                                            ("space_membership_space_id_fkey", True, "c")]
+
+async def test_dropping_a_space_reloads_every_workers_catalog(user, archived_month):
+    space_id = await make_space(user)
+    archived_month(space_id, user.me["id"], datetime(2025, 6, 1, tzinfo=timezone.utc), ["old"])
+    assert archive.has_space(space_id)
+    # what another worker still has cached
+    elsewhere = archive.catalog_cache.get("months")
+
+    archive.drop_space(space_id)
+    archive.catalog_cache.set("months", elsewhere)
+    assert not archive.has_space(space_id)
+
+async def test_archive_catalog_loads_leave_the_loop_running(user, archived_month, monkeypatch):
+    space_id = await make_space(user)
+    archived_month(space_id, user.me["id"], datetime(2025, 6, 1, tzinfo=timezone.utc), ["old"])
+    catalog = archive.catalog
+
+    def slow_catalog():
+        # a cold disk full of manifests
+        time.sleep(0.3)
+        return catalog()
+
+    monkeypatch.setattr(archive, "catalog", slow_catalog)
+    stalls = []
+
+    async def tick():
+        # the longest the loop went without getting back to us
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - start)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0)
+    page = (await user.get("/messages/", params={"space_id": space_id})).json()
+    ticker.cancel()
+    assert [m["content"] for m in page["items"]] == ["old"]
+    assert max(stalls) < 0.2
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+def run(code: str, **env) -> str:
+    # a fresh interpreter, so nothing is imported yet
+    return subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                          env={**os.environ, **env}).stdout.strip()
+
+def test_importing_main_is_free():
+    loaded = run("import sys, app.main; print(' '.join(sorted(sys.modules)))").split()
+    for heavy in ("sqlalchemy", "app.db.database", "app.routers.spaces", "redis"):
+        assert heavy not in loaded
+
+def test_app_attribute_is_built_on_demand():
+    assert run("import app.main as m; print(m._app is None, type(m.app).__name__, m.app is m.app)") == "True FastAPI True"
+
+def test_startup_never_creates_tables(tmp_path):
+    url = f"sqlite:///{tmp_path}/empty.db"
+    code = ("import asyncio, sqlalchemy, app.main as m\n"
+            "a = m.create_app()\n"
+            "async def go():\n"
+            "    async with a.router.lifespan_context(a): pass\n"
+            "asyncio.run(go())\n"
+            f"print(sqlalchemy.inspect(sqlalchemy.create_engine({url!r})).get_table_names())")
+    assert run(code, DATABASE_URL=url) == "[]"
+
+async def test_slow_warm_up_doesnt_hold_startup(monkeypatch, caplog):
+    from app import main
+    monkeypatch.setattr(settings, "STARTUP_WARM_TIMEOUT", 0.1)
+
+    async def stuck():
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(main, "warm_database", stuck)
+    await asyncio.wait_for(main.warm_up(), 1)
+    assert "warm up took longer" in caplog.text
+
+async def test_failed_warm_up_is_logged_not_raised(monkeypatch, caplog):
+    from app import main
+
+    async def broken():
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(main, "warm_redis", broken)
+    await main.warm_up()
+    assert "could not warm up redis" in caplog.text
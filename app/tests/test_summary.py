@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.core.config import settings
+from app.core.jobs import get_job
+from app.core.summary import ExtractiveSummariser, refresh_summary
+from app.db.database import AsyncSessionLocal
+from app.db.models import Message, SpaceSummary
+from app.tests.conftest import make_space
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+async def add_messages(space_id: int, user_id: int, contents: list[str], offset: int = 0):
+    # explicit timestamps, sqlite's default only has whole seconds
+    async with AsyncSessionLocal() as db:
+        db.add_all(Message(content=content, space_id=space_id, user_id=user_id,
+                           created_at=START + timedelta(seconds=offset + i))
+                   for i, content in enumerate(contents))
+        await db.commit()
+
+async def stored(space_id: int) -> SpaceSummary:
+    async with AsyncSessionLocal() as db:
+        return await db.get(SpaceSummary, space_id) # type: ignore
+
+def test_extractive_picks_the_recurring_topic():
+    summariser = ExtractiveSummariser(sentences=1)
+    state = summariser.fold(None, [
+        (1, "The deploy pipeline broke again on staging."),
+        (2, "lunch anyone?"),
+        (3, "Fixing the deploy pipeline needs the staging credentials."),
+    ])
+    assert summariser.render(state) == "- Fixing the deploy pipeline needs the staging credentials."
+    # same input, same digest
+    assert summariser.fold(None, [(3, "Fixing the deploy pipeline needs the staging credentials."),
+                                  (1, "The deploy pipeline broke again on staging."),
+                                  (2, "lunch anyone?")])["terms"] == state["terms"]
+
+async def test_refresh_only_folds_new_messages(user, monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_BATCH", 2)
+    space_id = await make_space(user)
+    await add_messages(space_id, user.me["id"], [f"release planning item number {i}." for i in range(5)])
+
+    assert await refresh_summary(space_id) == 1
+    first = await stored(space_id)
+    assert first.message_count == 5
+
+    # nothing new, the version stays
+    assert await refresh_summary(space_id) == 1
+
+    await add_messages(space_id, user.me["id"], ["database migration plan for release planning."], offset=10)
+    folded = []
+    original = ExtractiveSummariser.fold
+
+    def spy(self, state, messages):
+        folded.extend(messages)
+        return original(self, state, messages)
+
+    monkeypatch.setattr(ExtractiveSummariser, "fold", spy)
+    assert await refresh_summary(space_id) == 2
+    assert [content for _, content in folded] == ["database migration plan for release planning."]
+    assert (await stored(space_id)).message_count == 6
+
+async def test_reading_queues_a_refresh(user):
+    space_id = await make_space(user)
+    empty = (await user.get(f"/spaces/{space_id}/summary")).json()
+    assert empty["version"] == 0 and empty["refresh_job_id"] == f"summarise_space:{space_id}"
+
+    await add_messages(space_id, user.me["id"], ["the quarterly roadmap review happens friday."])
+    await refresh_summary(space_id)
+    fresh = (await user.get(f"/spaces/{space_id}/summary")).json()
+    assert fresh["version"] == 1 and fresh["refresh_job_id"] is None
+    assert "roadmap" in fresh["content"]
+
+    job = (await user.post(f"/spaces/{space_id}/summary/refresh")).json()
+    assert job["id"] == f"summarise_space:{space_id}"
+    assert (await get_job(job["id"]))["space_id"] == space_id
+
+async def test_refresh_job_is_visible_to_every_member(user, client_for):
+    from app.tests.conftest import sign_up
+    space_id = await make_space(user)
+    job_id = (await user.get(f"/spaces/{space_id}/summary")).json()["refresh_job_id"]
+    member = client_for()
+    await sign_up(member)
+    assert (await member.post(f"/spaces/{space_id}/join", json={})).status_code == 200
+    # the pending job comes back as is, queued by someone else
+    assert (await member.get(f"/spaces/{space_id}/summary")).json()["refresh_job_id"] == job_id
+    assert (await member.get(f"/jobs/{job_id}")).status_code == 200
+    assert (await user.get(f"/jobs/{job_id}")).status_code == 200
+
+    stranger = client_for()
+    await sign_up(stranger)
+    assert (await stranger.get(f"/jobs/{job_id}")).status_code == 404
+    assert (await member.delete(f"/spaces/{space_id}/leave")).status_code == 200
+    assert (await member.get(f"/jobs/{job_id}")).status_code == 404
+
+async def test_summary_is_members_only(user, client_for):
+    from app.tests.conftest import sign_up
+    space_id = await make_space(user)
+    other = client_for()
+    await sign_up(other)
+    assert (await other.get(f"/spaces/{space_id}/summary")).status_code == 403
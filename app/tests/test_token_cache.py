@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+import pytest
+from jose import JWTError
+from app.core import security
+from app.core.security import create_access_token, decode_token, token_cache
+
+@pytest.fixture
+def decodes(monkeypatch):
+    calls = []
+    real = security.jwt.decode
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return real(*args, **kwargs)
+
+    token_cache.clear()
+    monkeypatch.setattr(security.jwt, "decode", counting)
+    return calls
+
+def test_repeat_tokens_skip_the_signature_check(decodes):
+    token = create_access_token({"sub": "1", "type": "access"})
+    assert decode_token(token)["sub"] == "1"
+    assert decode_token(token)["sub"] == "1"
+    assert len(decodes) == 1
+
+def test_one_decode_per_request(decodes):
+    class State:
+        pass
+
+    class FakeRequest:
+        state = State()
+
+    token = create_access_token({"sub": "2"})
+    request = FakeRequest()
+    decode_token(token, request) # type: ignore
+    token_cache.clear()
+    # the claims stuck to the request, the cache isn't even asked
+    assert decode_token(token, request)["sub"] == "2" # type: ignore
+    assert len(decodes) == 1
+
+def test_expired_and_forged_tokens_are_rejected(decodes):
+    expired = create_access_token({"sub": "3"}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(JWTError):
+        decode_token(expired)
+    forged = create_access_token({"sub": "3"})[:-2] + "xx"
+    with pytest.raises(JWTError):
+        decode_token(forged)
+    # neither got cached
+    assert len(token_cache.data) == 0
+
+def test_cached_claims_never_outlive_the_token(decodes):
+    token = create_access_token({"sub": "4"}, expires_delta=timedelta(seconds=2))
+    decode_token(token)
+    expires, _ = token_cache.data[next(iter(token_cache.data))]
+    assert expires - time.monotonic() <= 2
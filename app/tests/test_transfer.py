@@ -0,0 +1,138 @@
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import select
+from app.core.config import settings
+from app.db import archive
+from app.db.transfer import read_lines
+from app.db.database import AsyncSessionLocal
+from app.db.models import Message
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+def ndjson(*messages: dict) -> bytes:
+    return b"".join(json.dumps(m).encode() + b"\n" for m in messages)
+
+async def authors(space_id: int) -> dict[str, int]:
+    async with AsyncSessionLocal() as db:
+        return dict((await db.execute(
+            select(Message.content, Message.user_id).where(Message.space_id == space_id)
+        )).all()) # type: ignore
+
+@pytest.fixture
+async def others(client_for):
+    # a member of the owner's space and a user who isn't in it
+    member, outsider = client_for(), client_for()
+    member.me = await sign_up(member, "member")
+    outsider.me = await sign_up(outsider, "outsider")
+    return member, outsider
+
+async def test_import_only_keeps_authors_who_are_members(user, others):
+    member, outsider = others
+    space_id = await make_space(user)
+    await member.post(f"/spaces/{space_id}/join", json={})
+    body = ndjson(
+        {"user_id": member.me["id"], "content": "from a member"},
+        {"user_id": outsider.me["id"], "content": "claims to be the outsider"},
+        {"user_id": 999999, "content": "nobody here"},
+        {"content": "no author"},
+    )
+    response = await user.post(f"/spaces/{space_id}/import", content=body)
+    assert response.json() == {"space_id": space_id, "imported": 4}
+    assert await authors(space_id) == {
+        "from a member": member.me["id"],
+        "claims to be the outsider": user.me["id"],
+        "nobody here": user.me["id"],
+        "no author": user.me["id"],
+    }
+
+async def test_only_the_owner_imports(user, others):
+    member, _ = others
+    space_id = await make_space(user)
+    await member.post(f"/spaces/{space_id}/join", json={})
+    response = await member.post(f"/spaces/{space_id}/import", content=ndjson({"content": "x"}))
+    assert response.status_code == 403
+
+async def test_a_bad_line_keeps_the_chunks_before_it(user, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_CHUNK", 2)
+    space_id = await make_space(user)
+    body = ndjson(*[{"content": f"m{i}"} for i in range(3)]) + b'{"content": 5}\n'
+    response = await user.post(f"/spaces/{space_id}/import", content=body)
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("line 4:")
+    assert sorted(await authors(space_id)) == ["m0", "m1"]
+
+async def test_gzip_round_trip(user):
+    space_id = await make_space(user)
+    body = gzip.compress(ndjson(*[{"content": f"m{i}", "created_at": f"2026-01-01T00:00:0{i}Z"} for i in range(3)]))
+    response = await user.post(f"/spaces/{space_id}/import", content=body, headers={"Content-Encoding": "gzip"})
+    assert response.json()["imported"] == 3
+
+    exported = await user.get(f"/spaces/{space_id}/export", params={"compress": True})
+    assert exported.headers["content-type"] == "application/gzip"
+    lines = [json.loads(line) for line in gzip.decompress(exported.content).splitlines()]
+    assert [m["content"] for m in lines] == ["m0", "m1", "m2"]
+    assert {m["user_id"] for m in lines} == {user.me["id"]}
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+async def test_gzip_lines_come_out_in_bounded_steps(monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_MAX_LINE", 16)
+    lines = [f"line {i}".encode() for i in range(2000)]
+    body = gzip.compress(b"\n".join(lines))
+    # one upload chunk that inflates to hundreds of steps, and the same split up
+    assert [line async for line in read_lines(stream(body), True)] == lines
+    split = [body[i:i + 7] for i in range(0, len(body), 7)]
+    assert [line async for line in read_lines(stream(*split), True)] == lines
+
+async def test_gzip_bomb_is_refused_without_inflating_it():
+    import tracemalloc
+    # ~50KB on the wire, 50MB with no newline once inflated
+    body = gzip.compress(b"a" * 50_000_000)
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="line longer"):
+            [line async for line in read_lines(stream(body), True)]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 4 * settings.IMPORT_MAX_LINE + 1_000_000
+
+async def test_export_reads_archived_months_first(user, archived_month):
+    space_id = await make_space(user)
+    archived_month(space_id, user.me["id"], datetime(2025, 6, 1, tzinfo=timezone.utc), ["old one", "old two"])
+    await user.post("/messages/batch", json={"messages": [{"content": "live", "space_id": space_id}]})
+    lines = (await user.get(f"/spaces/{space_id}/export")).text.splitlines()
+    assert [json.loads(line)["content"] for line in lines] == ["old one", "old two", "live"]
+
+async def test_archive_reads_leave_the_loop_running(user, archived_month, monkeypatch):
+    space_id = await make_space(user)
+    archived_month(space_id, user.me["id"], datetime(2025, 6, 1, tzinfo=timezone.utc), ["old"])
+    read_raw = archive.read_raw
+
+    def slow_read_raw(month, space_id):
+        for chunk in read_raw(month, space_id):
+            # a cold disk
+            time.sleep(0.3)
+            yield chunk
+
+    monkeypatch.setattr(archive, "read_raw", slow_read_raw)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    exported = await user.get(f"/spaces/{space_id}/export")
+    ticker.cancel()
+    assert json.loads(exported.text.splitlines()[0])["content"] == "old"
+    assert ticks > 10
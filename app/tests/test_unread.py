@@ -0,0 +1,57 @@
+import pytest
+from app.core.redis_client import ard
+from app.core.unread import reconcile, unread_key
+from app.db.database import AsyncSessionLocal
+from app.tests.conftest import make_space, sign_up
+
+pytestmark = pytest.mark.anyio
+
+async def post(client, space_id: int, n: int) -> list[int]:
+    response = await client.post("/messages/batch", json={"messages": [
+        {"content": f"m{i}", "space_id": space_id} for i in range(n)]})
+    assert response.status_code == 200, response.text
+    return [m["id"] for m in response.json()]
+
+async def unread(client) -> dict[int, int]:
+    return {s["id"]: s["unread"] for s in (await client.get("/users/me/spaces")).json()}
+
+@pytest.fixture
+async def pair(user, client_for):
+    # user owns a space that reader joined
+    space_id = await make_space(user)
+    reader = client_for()
+    reader.me = await sign_up(reader, "reader")
+    await reader.post(f"/spaces/{space_id}/join", json={})
+    return user, reader, space_id
+
+async def test_counts_follow_new_messages_and_reads(pair):
+    author, reader, space_id = pair
+    assert await unread(reader) == {space_id: 0}
+    ids = await post(author, space_id, 3)
+    # the hash was seeded by the first read, these were counted in redis
+    assert await unread(reader) == {space_id: 3}
+    # nobody has unread messages of their own
+    assert await unread(author) == {space_id: 0}
+
+    await reader.post(f"/spaces/{space_id}/read", json={"message_id": ids[0]})
+    assert await unread(reader) == {space_id: 2}
+    await post(author, space_id, 1)
+    assert await unread(reader) == {space_id: 3}
+    await reader.post(f"/spaces/{space_id}/read")
+    assert await unread(reader) == {space_id: 0}
+
+async def test_counts_rebuild_after_redis_loses_them(pair):
+    author, reader, space_id = pair
+    await post(author, space_id, 2)
+    await ard.delete(unread_key(space_id))
+    assert await unread(reader) == {space_id: 2}
+
+async def test_reconcile_fixes_drift(pair):
+    author, reader, space_id = pair
+    await unread(reader)
+    await post(author, space_id, 4)
+    await ard.hset(unread_key(space_id), "total", 100)
+    async with AsyncSessionLocal() as db:
+        assert await reconcile(db) == 2
+    assert await unread(reader) == {space_id: 4}
+    assert await unread(author) == {space_id: 0}
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from app.core.cache import LocalCache, drop_shared, read_shared, store_shared
+from app.core.redis_client import ard
+from app.core.security import get_cached_user, invalidate_user, load_user, user_cache, user_key
+from app.db import models
+
+pytestmark = pytest.mark.anyio
+
+def test_local_set_from_before_a_delete_is_dropped():
+    cache = LocalCache(10, 60)
+    generation = cache.generation
+    cache.delete("a")
+    cache.set("a", "stale", generation=generation)
+    assert cache.get("a") is None
+    cache.set("a", "fresh", generation=cache.generation)
+    assert cache.get("a") == "fresh"
+
+async def test_shared_store_loses_to_an_invalidation():
+    _, generation = await read_shared("thing")
+    await drop_shared("thing")
+    assert not await store_shared("thing", "stale", 60, generation)
+    assert await ard.get("thing") is None
+
+    _, generation = await read_shared("thing")
+    assert await store_shared("thing", "fresh", 60, generation)
+    assert await ard.get("thing") == "fresh"
+
+class SlowDb:
+    # hands back a row read before the write, once the test lets it
+    def __init__(self, row):
+        self.row = row
+        self.gate = asyncio.Event()
+
+    async def get(self, model, id):
+        await self.gate.wait()
+        return self.row
+
+async def test_load_in_flight_during_an_invalidation_caches_nothing(user):
+    user_id = user.me["id"]
+    user_cache.clear()
+    await ard.delete(user_key(user_id))
+    stale = models.User(id=user_id, name="old", email="old@example.com", password_hash="x", token_version=0)
+    db = SlowDb(stale)
+
+    load = asyncio.create_task(load_user(str(user_id), db, user_cache.generation)) # type: ignore
+    await asyncio.sleep(0.01)
+    # the write commits and invalidates while the load is still waiting on postgres
+    await invalidate_user(user_id)
+    db.gate.set()
+    assert (await load).name == "old"
+
+    assert user_cache.get(str(user_id)) is None
+    assert await ard.get(user_key(user_id)) is None
+
+async def test_requests_after_an_invalidation_get_a_new_load(user):
+    user_id = str(user.me["id"])
+    user_cache.clear()
+    await ard.delete(user_key(user_id))
+    old = SlowDb(models.User(id=int(user_id), name="old", email="o@example.com", password_hash="x", token_version=0))
+    before = asyncio.create_task(get_cached_user(user_id, old)) # type: ignore
+    await asyncio.sleep(0.01)
+    await invalidate_user(int(user_id))
+    # the generation moved, so this request doesn't join the old load
+    new = SlowDb(models.User(id=int(user_id), name="new", email="n@example.com", password_hash="x", token_version=1))
+    new.gate.set()
+    after = await get_cached_user(user_id, new) # type: ignore
+    old.gate.set()
+    assert (await before).name == "old"
+    assert after.name == "new" # type: ignore
+
+async def test_profile_update_is_seen_right_away(user):
+    assert (await user.get("/users/me")).json()["name"] == user.me["name"]
+    await user.put("/users/me", json={"name": "renamed"})
+    assert (await user.get("/users/me")).json()["name"] == "renamed"
+
+async def test_logout_everywhere_kills_cached_sessions(user):
+    assert (await user.get("/users/me")).status_code == 200
+    assert (await user.post("/auth/logout", json={"everywhere": True})).status_code == 200
+    assert (await user.get("/users/me")).status_code == 401
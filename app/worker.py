@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.core import jobs, tasks # noqa: F401, importing tasks registers the jobs
+from app.core.config import settings
+from app.core.redis_client import ard
+from app.db.purge import resume_purges
+
+logger = logging.getLogger("app.worker")
+
+async def run_worker(concurrency: int, processes: int, stop: asyncio.Event | None = None):
+    stop = stop or asyncio.Event()
+    slots = asyncio.Semaphore(concurrency)
+    running: set[asyncio.Task] = set()
+    next_maintenance = 0.0
+
+    def done(task: asyncio.Task):
+        running.discard(task)
+        slots.release()
+        if not task.cancelled() and task.exception():
+            logger.error("job crashed", exc_info=task.exception())
+
+    # not a with block, its exit waits on the child processes and would block the loop
+    pool = ProcessPoolExecutor(max_workers=processes or os.cpu_count())
+    try:
+        try:
+            await resume_purges()
+        except Exception:
+            logger.exception("could not resume purges")
+
+        while not stop.is_set():
+            await slots.acquire()
+            try:
+                if time.time() >= next_maintenance:
+                    await jobs.promote_delayed()
+                    await jobs.reap_stale()
+                    await jobs.schedule_periodic()
+                    next_maintenance = time.time() + 1
+                # short block so stop and delayed jobs get looked at every second
+                job_id = await ard.blmove(jobs.QUEUE, jobs.PROCESSING, 1, "RIGHT", "LEFT")
+            except asyncio.CancelledError:
+                slots.release()
+                raise
+            except Exception:
+                slots.release()
+                logger.exception("job queue unavailable")
+                await asyncio.sleep(1.0)
+                continue
+            if job_id is None:
+                slots.release()
+                continue
+            try:
+                await jobs.claim(job_id)
+            except Exception:
+                # it's in processing either way, the reaper stamps it
+                logger.exception("could not stamp job %s", job_id)
+            task = asyncio.create_task(jobs.run_job(job_id, pool))
+            running.add(task)
+            task.add_done_callback(done)
+
+        # let whatever is in flight finish, anything cut off gets reaped later
+        await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        await asyncio.to_thread(pool.shutdown)
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs background jobs off the redis queue")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_CONCURRENCY)
+    parser.add_argument("--processes", type=int, default=settings.JOB_PROCESSES)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        logger.info("worker started, %d jobs registered", len(jobs.registry))
+        await run_worker(args.concurrency, args.processes, stop)
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()